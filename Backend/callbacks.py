@@ -0,0 +1,45 @@
+from Backend.log import get_logger
+
+log = get_logger("session")
+
+
+class UICallbacks:
+    """
+    The UICallbacks class is the interface used by XMPP_Client to report session events
+    to whatever front end is driving it. The default implementation only writes to the
+    log of the session, which is what the headless mode uses; the GUI provides its own subclass.
+
+    Methods:
+        - session_started: Called once the session is authenticated and the roster is loaded
+        - authentication_failed: Called when the server rejects the credentials
+        - registration_succeeded: Called when a new account has been created
+        - registration_failed: Called when the account could not be created
+        - connection_lost: Called when the connection drops and the session is being reconnected
+        - connection_restored: Called when the session is back, resumed or restarted
+        - show_info: Report an informative message to the user
+        - show_error: Report an error message to the user
+    """
+
+    def session_started(self, client):
+        log.info("Session started", extra={'jid': client.boundjid.full})
+
+    def authentication_failed(self, client):
+        log.error("Authentication failed", extra={'jid': client.boundjid.bare})
+
+    def registration_succeeded(self, client):
+        log.info("Account created", extra={'jid': client.boundjid.bare})
+
+    def registration_failed(self, client, reason):
+        log.error("Could not register account: %s", reason, extra={'jid': client.boundjid.bare})
+
+    def connection_lost(self, client):
+        log.warning("Connection lost, reconnecting", extra={'jid': client.boundjid.bare})
+
+    def connection_restored(self, client, resumed):
+        log.info("Session is back", extra={'jid': client.boundjid.bare, 'resumed': resumed})
+
+    def show_info(self, title, message):
+        log.info("%s: %s", title, message)
+
+    def show_error(self, title, message):
+        log.error("%s: %s", title, message)
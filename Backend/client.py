@@ -1,47 +1,134 @@
-from slixmpp import ClientXMPP
-from tkinter import messagebox
-from Frontend.home import HomeWindow
 import asyncio
+from slixmpp import ClientXMPP
+from Backend.callbacks import UICallbacks
+from Backend.contacts import ContactList
+from Backend.presence import PresenceIndex, PresenceBuffer
+from Backend.messages import MessageRouter
+from Backend.outbox import Outbox
+from Backend.reconnect import ReconnectSupervisor
+from Backend.iq import IqRequests
+from Backend.rooms import RoomManager
+from Backend.presence_scheduler import PresenceScheduler
+from Backend.metrics import instrument
+from Backend.log import get_logger
 import xml.etree.ElementTree as ET
 from slixmpp.exceptions import IqError, IqTimeout
 
+log = get_logger("session")
+
 class XMPP_Client(ClientXMPP):
 
     """
-    A simple Slixmpp bot that will echo messages it
-    receives, along with a short thank you message.
+    A Slixmpp client session for the chat application.
+    Received chat messages are queued per conversation in a MessageRouter
+    and, when a MessageStore is given, persisted in the local history.
+
+    When a RosterCache is given, the roster and its XEP-0237 version are
+    kept on disk: the cached contacts are listed as soon as the client is
+    created and the login only downloads the changes since that version.
+
+    A dropped connection is brought back by a ReconnectSupervisor, resuming
+    the stream when the server still holds it.
+
+    The calls and durations of the stanza handlers and of the roster fetch
+    are recorded in the shared MetricsRegistry.
+
+    IQ requests (registration, account removal) are sent through IqRequests:
+    they time out, can be cancelled, and their result futures are awaited
+    without blocking the event loop.
+
+    Multi-user chat rooms (XEP-0045) are joined through a RoomManager,
+    which keeps their occupants and bounded message queues.
+
+    The own presence is broadcast by a PresenceScheduler, which coalesces
+    rapid changes, drops the ones that change nothing, and can switch to
+    away while the user is idle.
+
+    Every instance is an independent session: several clients can live
+    on the same event loop, usually owned by a ConnectionManager.
+    Session events are reported through a UICallbacks implementation,
+    so the client does not depend on any GUI toolkit.
     """
-    _instance = None
 
-    def __new__(cls, *args, **kwargs):
-        """
-        Singleton pattern to ensure only one instance of the XMPP_Client is created.
-        """
-        if cls._instance is None:
-            cls._instance = super(XMPP_Client, cls).__new__(cls)
-        return cls._instance
-    
-    def __init__(self, jid, password, window=None, register=False):
-        if not hasattr(self, 'initialized'):
-            super().__init__(jid, password)
-            self.window = window
-            self.registration = register
-            self.initialized = True
+    def __init__(self, jid, password, ui=None, register=False, store=None, roster_cache=None):
+        super().__init__(jid, password)
+        self.ui = ui if ui is not None else UICallbacks()
+        self.registration = register
+
+        # The IqError or IqTimeout of a failed registration
+        self.registration_error = None
+
+        # Local chat history, optional
+        self.store = store
+
+        # The connection manager owning this session, if any
+        self.manager = None
+
+        # Options of the first connection, reused to reconnect
+        self.connect_options = {}
+        self.session_established = False
+
+        # Store the presence and status
+        self.presence = {'show': 'Available', 'status': ''}
+
+        # Broadcasts the presence, registered before the start handler so the
+        # initial presence is sent as soon as the session starts
+        self.presence_scheduler = PresenceScheduler(self)
 
-            # Store the presence and status
-            self.presence = {'show': 'Available', 'status': ''}
+        # Roster kept on disk with its version, optional
+        if roster_cache is not None:
+            self.roster.set_backend(roster_cache, save=False)
 
-            # Register event handlers
-            if self.registration:
-                self.add_event_handler("register", self.register)
+        # Contact list maintained incrementally from the roster and presence events,
+        # starting with the cached roster
+        self.contacts = ContactList(self.boundjid.bare)
+        self.contacts.add([jid for jid in self.client_roster.keys() if jid != self.boundjid.bare])
 
-            # Set event Handlers
-            self.add_event_handler("session_start", self.start)
-            self.add_event_handler("message", self.message)
-            self.add_event_handler("failed_auth", self.failed_auth)
-            print("SUCCES: ClientXMPP initialized")
+        # Best presence of every contact, updated in batches from the buffered presence stanzas
+        self.contact_presence = PresenceIndex()
+        self.presence_buffer = PresenceBuffer(self.contact_presence, self.contacts)
 
+        # Per-conversation queues of chat messages, drained by the front end
+        self.conversations = MessageRouter(store, self.boundjid.bare)
+        self.register_plugin('xep_0203')
 
+        # Outbound messages, acked and resumed with stream management
+        self.register_plugin('xep_0198')
+        self.outbox = Outbox(self)
+
+        # Reconnect with backoff after an unexpected disconnection
+        self.reconnector = ReconnectSupervisor(self)
+
+        # IQ requests waiting for their answer
+        self.iq_requests = IqRequests(self)
+
+        # Multi-user chat rooms
+        self.register_plugin('xep_0045')
+        self.rooms = RoomManager(self)
+
+        # Register event handlers and the in-band registration plugin
+        if self.registration:
+            self.register_plugin('xep_0077')
+            self.add_event_handler("register", self.register)
+
+        # Set event Handlers
+        self.add_event_handler("session_start", self.start)
+        self.add_event_handler("message", self.message)
+        self.add_event_handler("failed_auth", self.failed_auth)
+
+        # Keep the contact list up to date from the roster and presence events
+        self.add_event_handler("roster_update", self.roster_update)
+        self.add_event_handler("roster_subscription_request", self.subscription_request)
+        for event in ("roster_subscription_authorized", "roster_subscription_remove",
+                      "roster_subscription_removed"):
+            self.add_event_handler(event, self.contact_changed)
+        for event in ("presence_available", "presence_chat", "presence_away",
+                      "presence_xa", "presence_dnd", "presence_unavailable"):
+            self.add_event_handler(event, self.presence_changed)
+        log.debug("ClientXMPP initialized", extra={'jid': self.boundjid.bare})
+
+
+    @instrument("start")
     async def start(self, event):
         """
         Process the session_start event.
@@ -55,13 +142,32 @@ class XMPP_Client(ClientXMPP):
                      event does not provide any additional
                      data.
         """
-        self.send_presence()
+        if self.session_established:
+            # A new session replaced a stream that could not be resumed: the
+            # GUI is kept and the roster refreshed, the presence scheduler
+            # has already restored the presence
+            self.presence_buffer.clear()
+            self.contacts.touch(self.contact_presence.clear())
+            await self.fetch_roster()
+            return
+        self.session_established = True
+
+        # The cached roster is already listed, only the changes are awaited:
+        # the request is sent before the front end is notified
+        log.info("User connected to the server", extra={'jid': self.boundjid.bare})
+        roster = asyncio.ensure_future(self.fetch_roster())
+        await asyncio.sleep(0)  # Let the task send the request
+        self.ui.session_started(self)
+        await roster
+
+    @instrument("roster_fetch")
+    async def fetch_roster(self):
+        """
+        Request the roster, or only its changes when a cached version is known.
+        """
         await self.get_roster()
-        print("SUCCESS: user connected to the server")
-        messagebox.showinfo("Success", "Successfully authenticated with the server")
-        self.window.root.destroy()
-        await self.init_home_gui()
 
+    @instrument("message")
     def message(self, msg):
         """
         Process incoming message stanzas. Be aware that this also
@@ -73,35 +179,99 @@ class XMPP_Client(ClientXMPP):
             msg -- The received message stanza. See the documentation
                    for stanza objects and the Message stanza to see
                    how it may be used.
+
+        Chat messages are only queued in their conversation here,
+        the front end renders them in batches.
+        """
+        if msg['type'] in ('chat', 'normal') and msg['body']:
+            self.conversations.receive(msg)
+
+    @instrument("roster_update")
+    def roster_update(self, iq):
+        """
+        Apply the items of a roster result or roster push to the contact list.
+        Only the items carried by the stanza are processed, never the whole roster.
+
+        A roster result carrying a query is the full roster (the server could not
+        send the changes since the cached version): the cached contacts missing
+        from it are removed. An empty result means the cached roster is current.
         """
-        if msg['type'] in ('chat', 'normal'):
-            msg.reply("Thanks for sending\n%(body)s" % msg).send()
+        added, removed = [], []
+        items = iq['roster']['items']
+        for jid, item in items.items():
+            if item['subscription'] == 'remove':
+                removed.append(jid.bare)
+            else:
+                added.append(jid.bare)
+
+        if iq['type'] == 'result' and iq.xml.find('{jabber:iq:roster}query') is not None:
+            listed = {jid.bare for jid in items}
+            for jid in list(self.client_roster.keys()):
+                if jid not in listed and jid != self.boundjid.bare:
+                    self.client_roster[jid].save(remove=True)
+                    removed.append(jid)
+
+        self.contacts.remove(removed)
+        new_contacts = set(self.contacts.add(added))
+
+        # Items already listed may have a new subscription state
+        self.contacts.touch([jid for jid in added if jid not in new_contacts])
+
+    def subscription_request(self, presence):
+        """
+        List the sender of a subscription request as a contact.
+        """
+        jid = presence['from'].bare
+        if not self.contacts.add([jid]):
+            self.contacts.touch([jid])
+
+    def contact_changed(self, presence):
+        """
+        Report a subscription change of a contact.
+        """
+        self.contacts.touch([presence['from'].bare])
+
+    @instrument("presence")
+    def presence_changed(self, presence):
+        """
+        Buffer the presence stanza, the presence index is updated with the next batch.
+        The presences of the room occupants are handled by the RoomManager.
+        """
+        if presence['from'].bare in self.rooms:
+            return
+        self.presence_buffer.add(presence)
+
+    async def get_dns_records(self, domain, port=None):
+        """
+        Return the endpoint the server was last reached at when it is cached,
+        otherwise resolve the domain.
+        """
+        endpoint = self.reconnector.endpoints.get(domain)
+        if endpoint is not None:
+            return [endpoint]
+        return await super().get_dns_records(domain, port)
+
+    def get_contact_presence(self, jid):
+        """
+        Return the (presence label, status message) of a contact from the presence index.
+        """
+        return self.contact_presence.describe(jid)
 
     def failed_auth(self, event):
         """
         Handler for failed authentication attempts.
-        If the authentication attempt fails, an error message is displayed,
+        If the authentication attempt fails, the front end is notified,
         and the client is disconnected from the server.
         """
-        def handle_failed_auth():
-            """
-            Internal function to handle failed authentication.
-            """
-            # Display an error message and update the login window
-            messagebox.showerror("Error", "Failed to authenticate with the server credentials")
-            self.window.show_authentication_failed()
-           
-            # Add a print statement to show the error message in the console
-            print("ERROR: Authentication Failed")
-            print("INFO: Client disconnected from the server")
-            
-            # Disconnect the client from the server
-            self.disconnect()
+        log.error("Authentication failed", extra={'jid': self.boundjid.bare})
+        self.ui.authentication_failed(self)
 
-        # Use after to schedule the error message and disconnection
-        self.window.root.after(0, handle_failed_auth)
+        # Disconnect the client from the server
+        self.disconnect()
+        log.info("Client disconnected from the server", extra={'jid': self.boundjid.bare})
 
 
+    @instrument("register")
     async def register(self, iq):
         """
         Fill out and submit a registration form.
@@ -116,24 +286,26 @@ class XMPP_Client(ClientXMPP):
 
         # Send the Iq object to the server and handle the response
         try:
-            await resp.send()
-            messagebox.showinfo("Success", "Account created for %s!" % self.boundjid)
-            print("SUCCESS: Account created for %s!" % self.boundjid)
+            await self.iq_requests.send(resp, name="register")
+            log.info("Account created", extra={'jid': self.boundjid.bare})
+            self.ui.registration_succeeded(self)
         except IqError as e:
-            messagebox.showerror("Error", "Could not register account: %s" % e.iq['error']['text'])
-            print("ERROR: Could not register account: %s" %
-                    e.iq['error']['text'])
-            self.window.show_registration_failed()
+            self.registration_error = e
+            log.error("Could not register account: %s", e.iq['error']['text'],
+                      extra={'jid': self.boundjid.bare})
+            self.ui.registration_failed(self, e.iq['error']['text'])
             self.disconnect()
-        except IqTimeout:
-            messagebox.showerror("Error", "No response from server.")
-            print("TIMEOUT: No response from server.")
-            self.window.show_registration_failed()
+        except IqTimeout as e:
+            self.registration_error = e
+            log.warning("No response from server to the registration", extra={'jid': self.boundjid.bare})
+            self.ui.registration_failed(self, "No response from server.")
             self.disconnect()
 
+    @instrument("update_presence")
     def update_presence(self, presence, custom_message=None):
             """
-            Update the presence status on the server and store it locally.
+            Store the presence status locally and let the presence scheduler broadcast it.
+            Rapid changes are coalesced and a change to the current presence is not sent.
             """
             presence_mapping = {
                 "Available": None,
@@ -149,59 +321,86 @@ class XMPP_Client(ClientXMPP):
             self.presence['show'] = presence
             self.presence['status'] = custom_message if custom_message else ''
 
-            # Send the presence update to the server
-            self.send_presence(pshow=show_value, pstatus=self.presence['status'])
-            print(f"SUCCESS: Presence updated to {presence} with status: {self.presence['status']}")
+            # Hand the presence update to the scheduler
+            self.presence_scheduler.request(show_value, self.presence['status'])
+            log.debug("Presence updated", extra={'show': presence, 'status': self.presence['status']})
+
+    def send_chat_message(self, peer, body):
+        """
+        Queue a chat message for a contact.
+        Returns the queued message, or None if the outbox is full.
+        """
+        return self.outbox.submit(peer, body)
 
     def send_presence_subscription(self, username):
         """
         Send a subscription request to add a new contact to the roster.
         """
         self.send_presence(pto=username, ptype='subscribe')
-        print(f"SUCCESS: Subscription request sent to {username}")
+        log.debug("Subscription request sent", extra={'contact': username})
 
-    async def init_home_gui(self):
+    def logout(self):
         """
-        Initialize the home GUI for the user.
+        Disconnect the session from the server and release it from its connection manager.
+        Returns the future of the disconnection.
         """
-        home_window = HomeWindow(self)
-        home_window.root.mainloop()
-        await asyncio.sleep(0.01)
+        self.reconnector.stop()
+        self.outbox.close()
+        self.iq_requests.cancel_all()
+        self.presence_scheduler.close()
+        self.presence_buffer.clear()
+        disconnected = self.disconnect()
+        disconnected.add_done_callback(self.stop_send_loop)
+        log.info("Client disconnected from the server", extra={'jid': self.boundjid.bare})
+        if self.manager is not None:
+            self.manager.discard(self)
+            log.debug("XMPP Client session released", extra={'jid': self.boundjid.bare})
+        return disconnected
 
-    def logout(self):
-        self.disconnect()
-        print("INFO: Client disconnected from the server")
-        XMPP_Client._instance = None
-        self.initialized = False
-        print("INFO: XMPP Client instance cleaned and reset")
 
+    def stop_send_loop(self, disconnected=None):
+        """
+        Stop the send loop of the stream. Slixmpp keeps it running after the
+        disconnection, so a closed session would leave a pending task behind.
+        """
+        if self._run_out_filters is not None and not self._run_out_filters.done():
+            self._run_out_filters.cancel()
 
-    def delete_my_account(self):
+    async def delete_my_account(self, timeout=None):
         """
         Delete the user's account from the server by sending an IQ stanza with a 'remove' request.
+        Returns True once the server confirmed the removal, False if it failed or timed out.
         """
-        try:
-            # Create a new IQ stanza
-            iq = self.make_iq_set()
-
-            # Manually construct the 'query' element with the 'remove' request
-            query = ET.Element('{jabber:iq:register}query')
-            remove = ET.SubElement(query, 'remove')
+        # Create a new IQ stanza
+        iq = self.make_iq_set()
 
-            # Attach the query element to the IQ stanza
-            iq.append(query)
+        # Manually construct the 'query' element with the 'remove' request
+        query = ET.Element('{jabber:iq:register}query')
+        ET.SubElement(query, '{jabber:iq:register}remove')
 
-            # Send the IQ stanza and wait for the response
-            result = iq.send()
+        # Attach the query element to the IQ stanza
+        iq.append(query)
 
-            print("SUCCESS: Account successfully deleted from the server")
+        # The server closes the stream once the account is removed, it must not be reconnected
+        supervised = self.reconnector.enabled
+        self.reconnector.enabled = False
+        deleted = False
+        try:
+            # Send the IQ stanza and wait for the response without blocking the event loop
+            await self.iq_requests.send(iq, timeout=timeout, name="delete_account")
+            deleted = True
+            log.info("Account deleted from the server", extra={'jid': self.boundjid.bare})
             return True
 
         except IqError as e:
-            print(f"ERROR: Failed to delete account: {e.iq['error']['text']}")
-            messagebox.showerror("Error", f"Failed to delete the account: {e.iq['error']['text']}")
+            log.error("Failed to delete account: %s", e.iq['error']['text'], extra={'jid': self.boundjid.bare})
+            self.ui.show_error("Error", f"Failed to delete the account: {e.iq['error']['text']}")
             return False
         except IqTimeout:
-            print("ERROR: Timeout while trying to delete account")
-            messagebox.showerror("Error", "Timeout while trying to delete account")
-            return False
\ No newline at end of file
+            log.error("Timeout while trying to delete account", extra={'jid': self.boundjid.bare})
+            self.ui.show_error("Error", "Timeout while trying to delete account")
+            return False
+        finally:
+            # The session goes on, unless it was closed meanwhile
+            if not deleted and not self.reconnector.stopped:
+                self.reconnector.enabled = supervised
\ No newline at end of file
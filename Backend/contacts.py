@@ -0,0 +1,87 @@
+from bisect import bisect_left, insort
+
+
+class ContactList:
+    """
+    The ContactList class maintains the sorted list of contacts of a session incrementally.
+    It is fed by the Slixmpp roster and presence events, so the contacts never have to be
+    rebuilt from the whole roster, and notifies its listeners with the deltas only.
+
+    Attributes:
+        - owner: The bare JID of the account, never listed as a contact
+        - jids: The sorted list of contact bare JIDs
+        - listeners: Functions called with (added, removed, changed) lists of bare JIDs
+
+    Methods:
+        - add: Add contacts to the list
+        - remove: Remove contacts from the list
+        - touch: Report contacts whose details changed
+        - add_listener: Register a delta listener
+        - remove_listener: Unregister a delta listener
+    """
+
+    def __init__(self, owner=''):
+        self.owner = owner
+        self.jids = []
+        self._members = set()
+        self.listeners = []
+
+    def __len__(self):
+        return len(self.jids)
+
+    def __contains__(self, jid):
+        return jid in self._members
+
+    def __iter__(self):
+        return iter(self.jids)
+
+    def add(self, jids):
+        """
+        Add the given bare JIDs to the list and return the ones that were new.
+        """
+        added = []
+        for jid in jids:
+            if jid and jid != self.owner and jid not in self._members:
+                self._members.add(jid)
+                insort(self.jids, jid)
+                added.append(jid)
+        if added:
+            self.notify(added=added)
+        return added
+
+    def remove(self, jids):
+        """
+        Remove the given bare JIDs from the list and return the ones that were present.
+        """
+        removed = []
+        for jid in jids:
+            if jid in self._members:
+                self._members.discard(jid)
+                del self.jids[bisect_left(self.jids, jid)]
+                removed.append(jid)
+        if removed:
+            self.notify(removed=removed)
+        return removed
+
+    def touch(self, jids):
+        """
+        Report that the details (presence, subscription) of the given contacts changed.
+        """
+        changed = [jid for jid in jids if jid in self._members]
+        if changed:
+            self.notify(changed=changed)
+        return changed
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def notify(self, added=(), removed=(), changed=()):
+        """
+        Call every listener with the given deltas.
+        """
+        for listener in list(self.listeners):
+            listener(list(added), list(removed), list(changed))
@@ -0,0 +1,167 @@
+import asyncio
+import time
+from Backend.metrics import get_metrics
+from Backend.log import get_logger
+
+log = get_logger("gui")
+
+# Default time between two GUI pumps, in seconds (50 ticks per second)
+DEFAULT_TICK_INTERVAL = 0.02
+
+
+class EventLoopBridge:
+    """
+    The EventLoopBridge class integrates Tkinter with the asyncio event loop used by Slixmpp.
+    Instead of handing the thread over to Tk with mainloop(), the Tk roots are pumped
+    from an asyncio task on a fixed tick, so the XMPP stream is serviced between every
+    GUI frame and inbound stanzas never wait longer than one tick plus the GUI work.
+
+    Attributes:
+        - tick_interval: Seconds between two GUI pumps (the tick budget)
+        - roots: The Tk roots currently being pumped
+        - tick_count: Number of ticks performed so far
+        - last_lag: Delay of the last tick with respect to its schedule, in seconds
+        - max_lag: Largest tick delay observed, in seconds
+        - max_tick_duration: Longest time spent processing GUI events in one tick, in seconds
+        - tick_callbacks: Functions called once per tick, after the GUI events
+
+    Methods:
+        - attach: Start pumping a Tk root
+        - detach: Stop pumping a Tk root
+        - add_tick_callback: Call a function once per tick (e.g. to render batched updates)
+        - remove_tick_callback: Stop calling a tick function
+        - pump: Coroutine that pumps the attached roots until none is left
+        - run: Run the asyncio event loop until every attached root is closed
+        - stats: Return the loop latency measurements
+    """
+
+    def __init__(self, tick_interval=DEFAULT_TICK_INTERVAL):
+        self.tick_interval = tick_interval
+        self.roots = []
+        self.tick_count = 0
+        self.total_lag = 0.0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.max_tick_duration = 0.0
+        self.tick_callbacks = []
+
+    def attach(self, root):
+        """
+        Start pumping the given Tk root on every tick.
+        This replaces the blocking call to root.mainloop().
+        """
+        if root not in self.roots:
+            self.roots.append(root)
+
+    def detach(self, root):
+        """
+        Stop pumping the given Tk root.
+        """
+        if root in self.roots:
+            self.roots.remove(root)
+
+    def add_tick_callback(self, callback):
+        """
+        Call the given function once per tick, after the GUI events are processed.
+        """
+        if callback not in self.tick_callbacks:
+            self.tick_callbacks.append(callback)
+
+    def remove_tick_callback(self, callback):
+        """
+        Stop calling the given tick function.
+        """
+        if callback in self.tick_callbacks:
+            self.tick_callbacks.remove(callback)
+
+    def pump_once(self):
+        """
+        Process every pending Tk event of the attached roots once.
+        Roots that have been destroyed are detached automatically.
+        Tkinter is only imported here, so the headless mode never loads it.
+        """
+        from tkinter import TclError
+
+        for root in list(self.roots):
+            try:
+                root.update()
+            except TclError:
+                # The window was destroyed since the last tick
+                self.detach(root)
+
+        for callback in list(self.tick_callbacks):
+            try:
+                callback()
+            except Exception:
+                log.exception("Tick callback %s failed", callback)
+
+    async def pump(self):
+        """
+        Pump the attached Tk roots every tick_interval seconds until all of them are closed.
+        Between two ticks the asyncio event loop is free to process network events.
+        """
+        loop = asyncio.get_running_loop()
+        expected = loop.time()
+
+        while self.roots:
+            # Measure how late this tick is with respect to its schedule
+            now = loop.time()
+            lag = max(0.0, now - expected)
+            self.record_lag(lag)
+
+            # Process the GUI events and measure the time spent doing it
+            tick_start = time.perf_counter()
+            with get_metrics().time("gui_refresh"):
+                self.pump_once()
+            self.max_tick_duration = max(self.max_tick_duration, time.perf_counter() - tick_start)
+
+            # Schedule the next tick on a fixed cadence
+            expected = loop.time() + self.tick_interval
+            await asyncio.sleep(self.tick_interval)
+
+    def record_lag(self, lag):
+        """
+        Store a tick lag measurement.
+        """
+        self.tick_count += 1
+        self.total_lag += lag
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        get_metrics().record_loop_lag(lag)
+
+    def run(self):
+        """
+        Run the asyncio event loop until every attached Tk root has been closed.
+        """
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(self.pump())
+
+    def stats(self):
+        """
+        Return the loop latency measurements as a dictionary.
+        """
+        return {
+            'tick_interval': self.tick_interval,
+            'ticks': self.tick_count,
+            'last_lag': self.last_lag,
+            'max_lag': self.max_lag,
+            'mean_lag': self.total_lag / self.tick_count if self.tick_count else 0.0,
+            'max_tick_duration': self.max_tick_duration,
+        }
+
+
+# Bridge shared by every window of the application
+_bridge = None
+
+
+def get_event_loop_bridge(tick_interval=None):
+    """
+    Return the bridge shared by the application, creating it on first use.
+    A tick_interval can be given to reconfigure the tick budget.
+    """
+    global _bridge
+    if _bridge is None:
+        _bridge = EventLoopBridge(tick_interval or DEFAULT_TICK_INTERVAL)
+    elif tick_interval:
+        _bridge.tick_interval = tick_interval
+    return _bridge
@@ -0,0 +1,83 @@
+import asyncio
+from Backend.callbacks import UICallbacks
+from Backend.manager import get_connection_manager
+from Backend.store import get_message_store
+from Backend.roster_cache import get_roster_cache
+from Backend.metrics import LoopLagMonitor, MetricsServer
+from Backend.log import get_logger
+
+log = get_logger("app")
+
+
+class HeadlessCallbacks(UICallbacks):
+    """
+    The HeadlessCallbacks class reports the session events of a headless client.
+    It stops the service when the session can not be established.
+
+    Attributes:
+        - stopped: Future resolved when the headless session must stop
+    """
+
+    def __init__(self, stopped):
+        self.stopped = stopped
+
+    def authentication_failed(self, client):
+        super().authentication_failed(client)
+        if not self.stopped.done():
+            self.stopped.set_result(1)
+
+    def registration_failed(self, client, reason):
+        super().registration_failed(client, reason)
+        if not self.stopped.done():
+            self.stopped.set_result(1)
+
+
+async def run_headless(jid, password, register=False, timeout=30, metrics_host="127.0.0.1", metrics_port=None):
+    """
+    Run a single XMPP session without any GUI until it is closed.
+    Dropped connections are reconnected by the session itself.
+    The event loop lag is measured, and when a metrics port is given the
+    metrics are served in the Prometheus text format on /metrics.
+    Returns the process exit code.
+    """
+    loop = asyncio.get_running_loop()
+    stopped = loop.create_future()
+
+    # Measure the event loop lag and export the metrics
+    lag_monitor = LoopLagMonitor()
+    lag_monitor.start()
+    metrics_server = None
+    if metrics_port is not None:
+        metrics_server = MetricsServer(host=metrics_host, port=metrics_port)
+        await metrics_server.start()
+
+    # Create the session with console callbacks
+    manager = get_connection_manager()
+    client = manager.create_session(jid, password, ui=HeadlessCallbacks(stopped), register=register,
+                                    store=get_message_store(), roster_cache=get_roster_cache())
+
+    def on_disconnected(event):
+        # The supervisor reconnects after an unexpected disconnection
+        if not client.reconnector.enabled and not stopped.done():
+            stopped.set_result(0)
+
+    try:
+        # Open the session and wait until the server closes it
+        if not await manager.open_session(client, timeout=timeout):
+            log.error("Could not open a session", extra={'jid': jid})
+            manager.close_session(jid)
+            return 1
+
+        client.add_event_handler("disconnected", on_disconnected)
+        log.info("Headless session running, press Ctrl+C to stop")
+        try:
+            return await stopped
+        finally:
+            client.del_event_handler("disconnected", on_disconnected)
+            if client.manager is not None:
+                client.logout()
+                await asyncio.sleep(0.1)
+    finally:
+        lag_monitor.stop()
+        if metrics_server is not None:
+            await metrics_server.stop()
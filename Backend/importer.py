@@ -0,0 +1,318 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from slixmpp.jid import JID, InvalidJID
+from Backend.log import get_logger
+from Backend.metrics import get_metrics
+
+log = get_logger("session")
+
+# Subscription requests sent per second by default
+DEFAULT_SUBSCRIPTION_RATE = 20
+
+# Subscription requests that can be sent at once before the rate applies
+DEFAULT_SUBSCRIPTION_BURST = 10
+
+# Seconds the server has to acknowledge the last subscription request
+DEFAULT_ACK_TIMEOUT = 30
+
+# Separators of the entries of a contact list: new lines, commas, semicolons and spaces
+ENTRY_SEPARATORS = re.compile(r'[\s,;]+')
+
+# Statuses of the contacts of an import
+QUEUED = 'queued'            # Waiting for its subscription request to be sent
+SENT = 'sent'                # Subscription request sent, not acknowledged by the server yet
+PENDING = 'pending'          # Accepted by the server, waiting for the contact to approve it
+SUBSCRIBED = 'subscribed'    # Approved by the contact, or already subscribed before
+REFUSED = 'refused'          # Refused by the contact
+FAILED = 'failed'            # Rejected by the server, or not sent
+UNCONFIRMED = 'unconfirmed'  # Not acknowledged by the server in time
+SKIPPED = 'skipped'          # Already subscribed, no request sent
+INVALID = 'invalid'          # Not a valid contact JID
+
+# Statuses of the contacts whose request is still in progress
+IN_PROGRESS = (QUEUED, SENT)
+
+# Statuses of the contacts that could not be added
+NOT_ADDED = (FAILED, REFUSED, UNCONFIRMED, INVALID)
+
+# Every status of the contacts of an import
+STATUSES = (QUEUED, SENT, PENDING, SUBSCRIBED, REFUSED, FAILED, UNCONFIRMED, SKIPPED, INVALID)
+
+
+def parse_contacts(text, domain=None, owner=None):
+    """
+    Split a pasted list or the content of a file into contact JIDs.
+    Entries are separated by new lines, commas, semicolons or spaces, and lines starting
+    with # are ignored; usernames without a domain get the given one.
+    Returns the list of valid bare JIDs, without duplicates and in their order, and the
+    list of (entry, reason) of the invalid ones.
+    """
+    jids, invalid, seen = [], [], set()
+    for line in text.splitlines():
+        if line.lstrip().startswith('#'):
+            continue
+        for entry in ENTRY_SEPARATORS.split(line):
+            if not entry:
+                continue
+            reason = None
+            candidate = entry if '@' in entry or not domain else f"{entry}@{domain}"
+            try:
+                jid = JID(candidate)
+            except InvalidJID as e:
+                jid, reason = None, str(e) or "Invalid JID"
+            if jid is not None:
+                if not jid.user:
+                    reason = "Missing username"
+                elif jid.resource:
+                    reason = "Contacts are bare JIDs, without a resource"
+                elif jid.bare == owner:
+                    reason = "This is your own account"
+            if reason is not None:
+                invalid.append((entry, reason))
+            elif jid.bare not in seen:
+                seen.add(jid.bare)
+                jids.append(jid.bare)
+    return jids, invalid
+
+
+class ContactOutcome:
+    """
+    The ContactOutcome class holds the state of the subscription request of one imported contact.
+
+    Attributes:
+        - jid: The bare JID of the contact, or the entry as given when it is invalid
+        - status: One of the statuses of the contacts of an import
+        - error: The reason of a failure or of an invalid entry
+        - sent_at: perf_counter time the subscription request was sent
+    """
+
+    __slots__ = ('jid', 'status', 'error', 'sent_at')
+
+    def __init__(self, jid, status=QUEUED, error=None):
+        self.jid = jid
+        self.status = status
+        self.error = error
+        self.sent_at = None
+
+
+class ContactImport:
+    """
+    The ContactImport class adds many contacts to the roster of a session at once.
+    The subscription requests are pipelined: a sender task sends them one after the other
+    without waiting for the answers, throttled by a token bucket of rate requests per
+    second after a first burst, and yields to the event loop between requests so the GUI
+    stays responsive.
+
+    The outcome of every contact is then tracked from what the server sends back: the
+    roster push with a pending subscription acknowledges the request, a subscribed or
+    unsubscribed presence is the answer of the contact, and an error presence a rejection.
+    Requests still unacknowledged ack_timeout seconds after the last one was sent are
+    reported as unconfirmed. The time the server takes to acknowledge each request is
+    recorded in the shared MetricsRegistry as the operation subscription_ack.
+
+    Front ends read the aggregate progress with progress() on their own schedule; the
+    import never calls into them.
+
+    Attributes:
+        - client: The XMPP_Client the contacts are added to
+        - rate: Subscription requests sent per second
+        - burst: Subscription requests sent at once before the rate applies
+        - ack_timeout: Seconds the server has to acknowledge the last request
+        - outcomes: The ContactOutcome of every entry, keyed by bare JID in import order
+        - task: The sender task, None before the import starts
+
+    Methods:
+        - start: Queue the contacts and start sending their subscription requests
+        - cancel: Stop sending the requests still queued
+        - close: Cancel the import and stop tracking the answers
+        - progress: Return the number of contacts per status and the completion
+        - failures: Return the outcomes of the contacts that could not be added
+    """
+
+    def __init__(self, client, rate=DEFAULT_SUBSCRIPTION_RATE, burst=DEFAULT_SUBSCRIPTION_BURST,
+                 ack_timeout=DEFAULT_ACK_TIMEOUT):
+        if rate <= 0:
+            raise ValueError("The subscription rate must be positive")
+        self.client = client
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.ack_timeout = ack_timeout
+        self.outcomes = OrderedDict()
+        self.task = None
+        self._settled = None
+        # Number of outcomes per status, kept up to date so the progress never rescans the import
+        self._counts = dict.fromkeys(STATUSES, 0)
+        self._in_progress = 0  # Outcomes whose status is in IN_PROGRESS
+        self._not_added = {}  # Outcomes whose status is in NOT_ADDED, in the order they failed
+        self._handlers = (
+            ("roster_update", self.on_roster_update),
+            ("presence_subscribed", self.on_subscribed),
+            ("presence_unsubscribed", self.on_unsubscribed),
+            ("presence_error", self.on_presence_error),
+        )
+        for event, handler in self._handlers:
+            client.add_event_handler(event, handler)
+
+    def start(self, jids, invalid=()):
+        """
+        Queue the contacts and start the sender task. Contacts already subscribed are
+        skipped, and the invalid (entry, reason) pairs are reported as they are.
+        Returns the sender task.
+        """
+        for entry, reason in invalid:
+            if entry not in self.outcomes:
+                self._add(ContactOutcome(entry, INVALID, reason))
+        roster = self.client.client_roster
+        for jid in jids:
+            if jid in self.outcomes:
+                continue
+            if roster.has_jid(jid) and roster[jid]['to']:
+                self._add(ContactOutcome(jid, SKIPPED, "Already subscribed"))
+            else:
+                self._add(ContactOutcome(jid))
+
+        self._settled = asyncio.Event()
+        self.task = asyncio.ensure_future(self._run())
+        log.info("Contact import started", extra={'contacts': len(self.outcomes), 'rate': self.rate})
+        return self.task
+
+    def _add(self, outcome):
+        self.outcomes[outcome.jid] = outcome
+        self._counts[outcome.status] += 1
+        self._in_progress += outcome.status in IN_PROGRESS
+        if outcome.status in NOT_ADDED:
+            self._not_added[outcome.jid] = outcome
+
+    async def _run(self):
+        """
+        Send the queued subscription requests at the configured rate, then wait for the
+        server to acknowledge them.
+        """
+        loop = asyncio.get_running_loop()
+        tokens, refilled = float(self.burst), loop.time()
+        try:
+            for outcome in list(self.outcomes.values()):
+                if outcome.status != QUEUED:
+                    continue
+                # Refill the bucket with the time elapsed, and wait for a token if it is empty
+                now = loop.time()
+                tokens = min(float(self.burst), tokens + (now - refilled) * self.rate)
+                refilled = now
+                if tokens < 1:
+                    await asyncio.sleep((1 - tokens) / self.rate)
+                    tokens, refilled = 1.0, loop.time()
+                tokens -= 1
+                self._send(outcome)
+                # Let the event loop process the answers and the GUI between two requests
+                await asyncio.sleep(0)
+
+            self._check_settled()
+            try:
+                await asyncio.wait_for(self._settled.wait(), self.ack_timeout)
+            except asyncio.TimeoutError:
+                for outcome in self.outcomes.values():
+                    if outcome.status == SENT:
+                        self._set_status(outcome, UNCONFIRMED, "No response from server")
+        except asyncio.CancelledError:
+            for outcome in self.outcomes.values():
+                if outcome.status == QUEUED:
+                    self._set_status(outcome, FAILED, "Import cancelled")
+            raise
+        finally:
+            progress = self.progress()
+            log.info("Contact import finished", extra={status: count for status, count in
+                                                       progress['statuses'].items() if count})
+
+    def _send(self, outcome):
+        try:
+            self.client.send_presence_subscription(outcome.jid)
+        except Exception as e:
+            self._set_status(outcome, FAILED, str(e))
+            return
+        outcome.sent_at = time.perf_counter()
+        self._set_status(outcome, SENT)
+
+    def _set_status(self, outcome, status, error=None):
+        if outcome.status == SENT and outcome.sent_at is not None:
+            # First answer of the server to the request
+            get_metrics().record("subscription_ack", time.perf_counter() - outcome.sent_at,
+                                 failed=status in (FAILED, UNCONFIRMED))
+        # The counts are kept up to date, so a status change never rescans the import
+        self._counts[outcome.status] -= 1
+        self._counts[status] += 1
+        self._in_progress += (status in IN_PROGRESS) - (outcome.status in IN_PROGRESS)
+        if status in NOT_ADDED:
+            self._not_added[outcome.jid] = outcome
+        else:
+            self._not_added.pop(outcome.jid, None)
+        outcome.status = status
+        outcome.error = error
+        self._check_settled()
+
+    def _check_settled(self):
+        if self._settled is not None and self._in_progress == 0:
+            self._settled.set()
+
+    def _tracked(self, jid, statuses):
+        """
+        Return the outcome of an imported contact when its status is one of statuses.
+        """
+        outcome = self.outcomes.get(jid)
+        if outcome is not None and outcome.status in statuses:
+            return outcome
+        return None
+
+    def on_roster_update(self, iq):
+        """
+        Acknowledge the requests of the contacts pushed with a pending or granted subscription.
+        """
+        for jid, item in iq['roster']['items'].items():
+            outcome = self._tracked(jid.bare, (SENT, UNCONFIRMED, PENDING))
+            if outcome is None:
+                continue
+            if item['subscription'] in ('to', 'both'):
+                self._set_status(outcome, SUBSCRIBED)
+            elif item['ask'] == 'subscribe' and outcome.status != PENDING:
+                self._set_status(outcome, PENDING)
+
+    def on_subscribed(self, presence):
+        outcome = self._tracked(presence['from'].bare, (SENT, UNCONFIRMED, PENDING))
+        if outcome is not None:
+            self._set_status(outcome, SUBSCRIBED)
+
+    def on_unsubscribed(self, presence):
+        outcome = self._tracked(presence['from'].bare, (SENT, UNCONFIRMED, PENDING))
+        if outcome is not None:
+            self._set_status(outcome, REFUSED, "Refused by the contact")
+
+    def on_presence_error(self, presence):
+        outcome = self._tracked(presence['from'].bare, (SENT, UNCONFIRMED, PENDING))
+        if outcome is not None:
+            error = presence['error']
+            self._set_status(outcome, FAILED, error['text'] or error['condition'] or "Rejected by the server")
+
+    def progress(self):
+        """
+        Return the number of contacts per status, the number of contacts whose request is
+        settled, the total and whether the import is finished.
+        """
+        total = len(self.outcomes)
+        return {'statuses': dict(self._counts), 'settled': total - self._in_progress, 'total': total,
+                'finished': self.task is not None and self.task.done()}
+
+    def failures(self):
+        return list(self._not_added.values())
+
+    def cancel(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    def close(self):
+        """
+        Cancel the import and stop tracking the answers of the contacts.
+        """
+        self.cancel()
+        for event, handler in self._handlers:
+            self.client.del_event_handler(event, handler)
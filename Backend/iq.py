@@ -0,0 +1,72 @@
+import time
+from Backend.log import get_logger
+from Backend.metrics import get_metrics
+
+log = get_logger("session")
+
+# Seconds an IQ request waits for its answer by default
+DEFAULT_IQ_TIMEOUT = 15
+
+
+class IqRequests:
+    """
+    The IqRequests class sends the IQ requests of a session and keeps track of the ones
+    waiting for their answer. Every request gets a timeout and a result future: awaiting
+    it returns the result stanza or raises IqError (error answer) or IqTimeout (no answer
+    in time). Front ends that can not await, like Tk callbacks, add a done callback to the
+    future instead, so the event loop is never blocked waiting for the server.
+
+    Cancelling a future stops waiting for its answer: the response handler and the
+    timeout of the request are removed. Pending requests are cancelled together when
+    the session ends, and the duration and outcome of every request are recorded in
+    the shared MetricsRegistry as the operation iq_<name>.
+
+    Attributes:
+        - client: The XMPP_Client sending the requests
+        - timeout: Default number of seconds a request waits for its answer
+        - pending: The futures of the requests waiting for their answer, keyed by IQ id
+
+    Methods:
+        - send: Send an IQ request and return its result future
+        - cancel: Stop waiting for the answer of a request
+        - cancel_all: Stop waiting for the answer of every pending request
+    """
+
+    def __init__(self, client, timeout=DEFAULT_IQ_TIMEOUT):
+        self.client = client
+        self.timeout = timeout
+        self.pending = {}
+        client.add_event_handler("session_end", self.on_session_end)
+
+    def send(self, iq, timeout=None, name="request"):
+        """
+        Send an IQ get or set and return the future of its answer.
+        """
+        iq_id = iq['id']
+        start = time.perf_counter()
+        future = iq.send(timeout=timeout if timeout is not None else self.timeout)
+        self.pending[iq_id] = future
+        future.add_done_callback(lambda done: self._finished(iq_id, name, start, done))
+        return future
+
+    def _finished(self, iq_id, name, start, future):
+        self.pending.pop(iq_id, None)
+        if future.cancelled():
+            # The answer is no longer awaited, drop its handler and its timeout
+            self.client.cancel_schedule(f'IqTimeout_{iq_id}')
+            self.client.remove_handler(f'IqCallback_{iq_id}')
+            log.debug("IQ request cancelled", extra={'iq': name, 'id': iq_id})
+            return
+        get_metrics().record(f"iq_{name}", time.perf_counter() - start, failed=future.exception() is not None)
+
+    def cancel(self, iq_id):
+        future = self.pending.get(iq_id)
+        if future is not None:
+            future.cancel()
+
+    def cancel_all(self):
+        for future in list(self.pending.values()):
+            future.cancel()
+
+    def on_session_end(self, event):
+        self.cancel_all()
@@ -0,0 +1,131 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# Name of the logger every subsystem logger descends from
+ROOT_LOGGER = "xmpp_chat"
+
+# Default level of the application loggers
+DEFAULT_LOG_LEVEL = "INFO"
+
+# Attributes of every LogRecord, the other attributes are the fields given with extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def get_logger(subsystem):
+    """
+    Return the logger of a subsystem of the application (session, connection, gui...).
+    """
+    return logging.getLogger(f"{ROOT_LOGGER}.{subsystem}")
+
+
+def record_fields(record):
+    """
+    Return the structured fields given to a log call with extra=.
+    """
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    The StructuredFormatter class renders a log record as one line, either as text
+    followed by its fields as key=value pairs, or as a JSON object.
+
+    Attributes:
+        - json_output: Whether the records are rendered as JSON objects
+    """
+
+    def __init__(self, json_output=False):
+        super().__init__()
+        self.json_output = json_output
+
+    def format(self, record):
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+        timestamp = f"{timestamp}.{int(record.msecs):03d}"
+        subsystem = record.name[len(ROOT_LOGGER) + 1:] if record.name.startswith(ROOT_LOGGER + ".") else record.name
+        fields = record_fields(record)
+        message = record.getMessage()
+        if self.json_output:
+            entry = {'time': timestamp, 'level': record.levelname, 'subsystem': subsystem, 'message': message}
+            entry.update(fields)
+            if record.exc_text:
+                entry['exception'] = record.exc_text
+            return json.dumps(entry, default=str)
+
+        line = f"{timestamp} {record.levelname:<7} {subsystem:<10} {message}"
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    The DeferredQueueHandler class only queues the records on the calling thread: the
+    message is merged with its arguments and the traceback rendered, everything else
+    (formatting, writing) happens on the listener thread.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+# Handler queueing the records and listener writing them, while logging is configured
+_queue_handler = None
+_listener = None
+
+
+def configure_logging(level=DEFAULT_LOG_LEVEL, json_output=False, stream=None, filename=None):
+    """
+    Send the records of the application (and the warnings of the libraries) through a
+    queue to a listener thread, which formats and writes them. A log call on the event
+    loop then only costs the creation of a record, never a write to the terminal.
+    The records are written to the given file, or to the given stream (stderr by default).
+    """
+    global _queue_handler, _listener
+    shutdown_logging()
+
+    if filename:
+        output = logging.FileHandler(filename, encoding='utf-8')
+    else:
+        output = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    output.setFormatter(StructuredFormatter(json_output))
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = DeferredQueueHandler(log_queue)
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    root.setLevel(logging.WARNING)
+    logging.getLogger(ROOT_LOGGER).setLevel(level.upper() if isinstance(level, str) else level)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """
+    Write the records still queued and stop the listener thread.
+    """
+    global _queue_handler, _listener
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,165 @@
+import asyncio
+from Backend.client import XMPP_Client
+
+# Connection options used for the alumchat.lol server
+DEFAULT_CONNECT_OPTIONS = {'disable_starttls': True, 'use_ssl': False}
+
+# Maximum number of sessions negotiating their stream at the same time
+DEFAULT_MAX_CONCURRENT_CONNECTS = 50
+
+
+class ConnectionManager:
+    """
+    The ConnectionManager class owns any number of XMPP_Client sessions running on
+    the same asyncio event loop. Each session keeps its own state, and sessions are
+    indexed by their bare JID so bots and support accounts can share a single process.
+
+    Attributes:
+        - sessions: The managed XMPP_Client instances, keyed by bare JID
+        - connect_options: Keyword arguments passed to XMPP_Client.connect
+        - max_concurrent_connects: Limit of sessions negotiating their stream at once
+
+    Methods:
+        - create_session: Create a new session and start managing it
+        - get_session: Return the session of a JID
+        - connect: Connect a session with the manager connection options
+        - open_session: Connect a session and wait until it is authenticated
+        - open_sessions: Open many sessions concurrently
+        - close_session: Disconnect a session and stop managing it
+        - discard: Stop managing a session without disconnecting it
+        - close_all: Disconnect every managed session
+    """
+
+    def __init__(self, connect_options=None, max_concurrent_connects=DEFAULT_MAX_CONCURRENT_CONNECTS):
+        self.sessions = {}
+        self.connect_options = dict(connect_options or DEFAULT_CONNECT_OPTIONS)
+        self.max_concurrent_connects = max_concurrent_connects
+        self._connect_slots = None
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __iter__(self):
+        return iter(list(self.sessions.values()))
+
+    def __contains__(self, jid):
+        return self._key(jid) in self.sessions
+
+    def _key(self, jid):
+        """
+        Return the key of a JID in the sessions dictionary (its bare JID).
+        """
+        return str(jid).split('/')[0].lower()
+
+    def create_session(self, jid, password, client_class=XMPP_Client, **kwargs):
+        """
+        Create a new session for the given credentials.
+        A previous session of the same JID is closed and replaced.
+        """
+        key = self._key(jid)
+        if key in self.sessions:
+            self.close_session(key)
+
+        client = client_class(jid, password, **kwargs)
+        client.manager = self
+        self.sessions[key] = client
+        return client
+
+    def get_session(self, jid):
+        """
+        Return the session of a JID, or None if it is not managed.
+        """
+        return self.sessions.get(self._key(jid))
+
+    def connect(self, client, **kwargs):
+        """
+        Connect a session to the server using the manager connection options.
+        """
+        options = dict(self.connect_options)
+        options.update(kwargs)
+        client.connect_options = options
+        client.connect(**options)
+
+    async def open_session(self, client, timeout=30, **kwargs):
+        """
+        Connect a session and wait until its stream is authenticated.
+        Returns True on session start, False on failed authentication,
+        connection failure or timeout. The number of sessions negotiating
+        at the same time is bounded by max_concurrent_connects.
+        """
+        if self._connect_slots is None:
+            self._connect_slots = asyncio.Semaphore(self.max_concurrent_connects)
+
+        async with self._connect_slots:
+            loop = asyncio.get_running_loop()
+            outcome = loop.create_future()
+
+            def resolve(result):
+                if not outcome.done():
+                    outcome.set_result(result)
+
+            handlers = {
+                'session_start': lambda event: resolve(True),
+                'failed_auth': lambda event: resolve(False),
+                'connection_failed': lambda event: resolve(False),
+            }
+            for name, handler in handlers.items():
+                client.add_event_handler(name, handler, disposable=True)
+
+            self.connect(client, **kwargs)
+            try:
+                return await asyncio.wait_for(outcome, timeout)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                for name, handler in handlers.items():
+                    client.del_event_handler(name, handler)
+
+    async def open_sessions(self, clients, timeout=30, **kwargs):
+        """
+        Open many sessions concurrently and return a dictionary of bare JID to success flag.
+        """
+        clients = list(clients)
+        results = await asyncio.gather(*(self.open_session(client, timeout, **kwargs) for client in clients))
+        return {client.boundjid.bare: result for client, result in zip(clients, results)}
+
+    def close_session(self, jid):
+        """
+        Log out the session of a JID and stop managing it.
+        The client releases its workers, pending requests and timers like any other logout.
+        """
+        client = self.sessions.get(self._key(jid))
+        if client is not None:
+            # Also removes the session from the manager
+            client.logout()
+        return client
+
+    def discard(self, client):
+        """
+        Stop managing a session without disconnecting it.
+        """
+        key = self._key(client.boundjid.bare)
+        if self.sessions.get(key) is client:
+            del self.sessions[key]
+        client.manager = None
+
+    def close_all(self):
+        """
+        Disconnect every managed session.
+        """
+        for key in list(self.sessions):
+            self.close_session(key)
+
+
+# Connection manager shared by the application
+_manager = None
+
+
+def get_connection_manager():
+    """
+    Return the connection manager shared by the application, creating it on first use.
+    """
+    global _manager
+    if _manager is None:
+        _manager = ConnectionManager()
+    return _manager
@@ -0,0 +1,132 @@
+import time
+from collections import deque
+from typing import NamedTuple, Optional
+
+# Number of recent messages kept in memory for every conversation
+HISTORY_LIMIT = 500
+
+# Number of messages waiting to be rendered kept for every conversation
+PENDING_LIMIT = 5000
+
+
+class ChatMessage(NamedTuple):
+    """
+    A chat message exchanged with a contact.
+    """
+    peer: str
+    body: str
+    timestamp: float
+    direction: str  # 'in' for received messages, 'out' for sent ones
+    id: Optional[int] = None  # Identifier in the local history, once read back from it
+
+    @property
+    def cursor(self):
+        """
+        Position of the message in the history, used to page through it.
+        """
+        return (self.timestamp, self.id)
+
+    def format(self, own_label="Me"):
+        """
+        Return the line displayed in the chat view for this message.
+        """
+        sender = self.peer if self.direction == 'in' else own_label
+        clock = time.strftime('%H:%M:%S', time.localtime(self.timestamp))
+        return f"[{clock}] {sender}: {self.body}\n"
+
+
+class Conversation:
+    """
+    The Conversation class holds the messages exchanged with one contact.
+
+    Attributes:
+        - peer: The bare JID of the contact
+        - history: The most recent messages of the conversation
+        - pending: The messages not rendered by the GUI yet
+    """
+
+    def __init__(self, peer):
+        self.peer = peer
+        self.history = deque(maxlen=HISTORY_LIMIT)
+        self.pending = deque(maxlen=PENDING_LIMIT)
+
+    def append(self, message):
+        self.history.append(message)
+        self.pending.append(message)
+
+    def drain(self, limit=None):
+        """
+        Remove and return up to limit pending messages, oldest first.
+        """
+        if limit is None or limit >= len(self.pending):
+            messages = list(self.pending)
+            self.pending.clear()
+            return messages
+        return [self.pending.popleft() for _ in range(limit)]
+
+
+class MessageRouter:
+    """
+    The MessageRouter class dispatches chat messages to per-conversation queues.
+    Stanza handlers only append to a queue, and the GUI drains the queues in batches,
+    so a burst of messages costs one render per frame instead of one per stanza.
+
+    Attributes:
+        - conversations: The conversations, keyed by bare JID of the contact
+        - unread: Bare JIDs of the conversations with messages waiting to be rendered
+        - store: The MessageStore persisting the messages, if any
+        - account: The bare JID of the account owning the messages
+
+    Methods:
+        - receive: Queue a received message stanza
+        - record: Queue a message exchanged with a contact
+        - conversation: Return the conversation with a contact
+        - drain: Return the pending messages of a conversation
+    """
+
+    def __init__(self, store=None, account=''):
+        self.conversations = {}
+        self.unread = set()
+        self.store = store
+        self.account = account
+
+    def conversation(self, peer):
+        """
+        Return the conversation with a contact, creating it on first use.
+        """
+        conversation = self.conversations.get(peer)
+        if conversation is None:
+            conversation = self.conversations[peer] = Conversation(peer)
+        return conversation
+
+    def receive(self, msg):
+        """
+        Queue a received message stanza and return the ChatMessage created.
+        Delayed messages keep the timestamp of their delivery delay.
+        """
+        timestamp = time.time()
+        if msg['delay']['stamp']:
+            timestamp = msg['delay']['stamp'].timestamp()
+        return self.record(ChatMessage(msg['from'].bare, msg['body'], timestamp, 'in'))
+
+    def record(self, message):
+        """
+        Queue a message exchanged with a contact, storing it first when a store is set.
+        """
+        if self.store is not None:
+            self.store.add(self.account, message)
+        self.conversation(message.peer).append(message)
+        self.unread.add(message.peer)
+        return message
+
+    def drain(self, peer, limit=None):
+        """
+        Return up to limit pending messages of a conversation, oldest first.
+        """
+        conversation = self.conversations.get(peer)
+        if conversation is None:
+            return []
+        messages = conversation.drain(limit)
+        if not conversation.pending:
+            self.unread.discard(peer)
+        return messages
@@ -0,0 +1,456 @@
+import abc
+import asyncio
+import functools
+import inspect
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from Backend.log import get_logger
+
+log = get_logger("metrics")
+
+# Upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Seconds between two samples of the event loop lag
+LOOP_LAG_INTERVAL = 0.1
+
+# Content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    """
+    Return the {name="value",...} part of a sample line, escaped as Prometheus expects.
+    """
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class CounterChild:
+    """
+    The value of a counter for one set of label values.
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class GaugeChild:
+    """
+    The value of a gauge for one set of label values.
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+
+class HistogramChild:
+    """
+    The observations of a histogram for one set of label values.
+    Observations are counted in fixed buckets, so recording one is a bisection
+    and an increment, whatever the number of observations.
+    """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'max')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, fraction):
+        """
+        Estimate a quantile by interpolating inside the bucket holding it.
+        """
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        lower = 0.0
+        for index, count in enumerate(self.counts):
+            upper = self.buckets[index] if index < len(self.buckets) else self.max
+            if count and seen + count >= rank:
+                return min(self.max, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+            lower = upper
+        return self.max
+
+
+class Metric(abc.ABC):
+    """
+    The Metric class holds the children of a metric, one per set of label values.
+    Every type of metric creates its own kind of child.
+
+    Attributes:
+        - name: The name of the metric
+        - help: The description of the metric
+        - labelnames: The names of the labels of the metric
+        - children: The child of every set of label values
+
+    Methods:
+        - labels: Return the child of a set of label values, creating it on first use
+        - samples: Return the (suffix, labels, value) samples of the metric
+    """
+
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+
+    def labels(self, *labelvalues):
+        child = self.children.get(labelvalues)
+        if child is None:
+            child = self.children[labelvalues] = self._new_child()
+        return child
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """
+        Return the child of a new set of label values.
+        """
+
+    def samples(self):
+        for labelvalues, child in sorted(self.children.items()):
+            yield "", _format_labels(self.labelnames, labelvalues), child.value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return CounterChild()
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return GaugeChild()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def samples(self):
+        for labelvalues, child in sorted(self.children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, [('le', _format_value(bound))])
+                yield "_bucket", labels, cumulative
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield "_sum", labels, child.sum
+            yield "_count", labels, child.count
+
+
+class MetricsRegistry:
+    """
+    The MetricsRegistry class holds the counters, gauges and latency histograms of the
+    application and renders them in the Prometheus text format. Operations (stanza
+    handlers, roster fetches, GUI refreshes) are measured with instrument or time,
+    which count the calls and errors and record the duration of every call.
+
+    Attributes:
+        - metrics: The registered metrics, keyed by name
+        - operation_calls: Counter of the calls of every operation
+        - operation_errors: Counter of the calls of every operation that raised
+        - operation_duration: Histogram of the duration of every operation
+        - loop_lag: Histogram of the delay of the event loop
+        - loop_lag_last: Gauge of the last delay of the event loop
+
+    Methods:
+        - counter: Return a counter, registering it on first use
+        - gauge: Return a gauge, registering it on first use
+        - histogram: Return a histogram, registering it on first use
+        - time: Context manager measuring an operation
+        - instrument: Decorator measuring every call of a function or coroutine
+        - record: Record a call of an operation measured by the caller
+        - record_loop_lag: Record a measurement of the event loop delay
+        - operations: Return the summary of every measured operation
+        - render: Return every metric in the Prometheus text format
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.operation_calls = self.counter(
+            "xmpp_operation_calls_total", "Calls of the measured operations", ("operation",))
+        self.operation_errors = self.counter(
+            "xmpp_operation_errors_total", "Calls of the measured operations that raised", ("operation",))
+        self.operation_duration = self.histogram(
+            "xmpp_operation_duration_seconds", "Duration of the measured operations", ("operation",))
+        self.loop_lag = self.histogram(
+            "xmpp_event_loop_lag_seconds", "Delay of the event loop with respect to its schedule")
+        self.loop_lag_last = self.gauge(
+            "xmpp_event_loop_lag_last_seconds", "Last measured delay of the event loop")
+
+    def _register(self, metric_class, name, *args):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = metric_class(name, *args)
+        elif not isinstance(metric, metric_class):
+            raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help, labelnames, buckets)
+
+    def _operation(self, name):
+        """
+        Return the (calls, errors, duration) children of an operation.
+        """
+        return (self.operation_calls.labels(name), self.operation_errors.labels(name),
+                self.operation_duration.labels(name))
+
+    @contextmanager
+    def time(self, name):
+        """
+        Measure the block as one call of the named operation.
+        """
+        calls, errors, duration = self._operation(name)
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            errors.inc()
+            raise
+        finally:
+            calls.inc()
+            duration.observe(time.perf_counter() - start)
+
+    def instrument(self, name):
+        """
+        Return a decorator measuring every call of a function as the named operation.
+        Coroutine functions stay coroutine functions, so Slixmpp still schedules them
+        as tasks, and their duration includes the time spent awaiting.
+        """
+        calls, errors, duration = self._operation(name)
+
+        def decorator(function):
+            if inspect.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def measured(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return await function(*args, **kwargs)
+                    except BaseException:
+                        errors.inc()
+                        raise
+                    finally:
+                        calls.inc()
+                        duration.observe(time.perf_counter() - start)
+            else:
+                @functools.wraps(function)
+                def measured(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return function(*args, **kwargs)
+                    except BaseException:
+                        errors.inc()
+                        raise
+                    finally:
+                        calls.inc()
+                        duration.observe(time.perf_counter() - start)
+            return measured
+
+        return decorator
+
+    def record(self, name, duration, failed=False):
+        """
+        Record one call of the named operation measured by the caller.
+        """
+        calls, errors, histogram = self._operation(name)
+        calls.inc()
+        if failed:
+            errors.inc()
+        histogram.observe(duration)
+
+    def record_loop_lag(self, lag):
+        self.loop_lag.labels().observe(lag)
+        self.loop_lag_last.labels().set(lag)
+
+    def operations(self):
+        """
+        Return the calls, errors and latency percentiles (in seconds) of every operation.
+        """
+        summary = {}
+        for (name,), duration in sorted(self.operation_duration.children.items()):
+            summary[name] = {
+                'calls': self.operation_calls.labels(name).value,
+                'errors': self.operation_errors.labels(name).value,
+                'p50': duration.quantile(0.50),
+                'p99': duration.quantile(0.99),
+                'max': duration.max,
+                'mean': duration.sum / duration.count if duration.count else 0.0,
+            }
+        return summary
+
+    def render(self):
+        """
+        Return every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Registry shared by the application
+_metrics = MetricsRegistry()
+
+
+def get_metrics():
+    """
+    Return the metrics registry shared by the application.
+    """
+    return _metrics
+
+
+def instrument(name):
+    """
+    Decorator measuring every call of a function in the shared registry.
+    """
+    return _metrics.instrument(name)
+
+
+class LoopLagMonitor:
+    """
+    The LoopLagMonitor class measures how late the event loop runs a task scheduled on a
+    fixed interval. Handlers that block the loop (long stanza handlers, slow GUI updates,
+    synchronous I/O) show up as lag. The GUI measures the lag on every tick of the
+    EventLoopBridge instead, so the monitor is only needed without the GUI.
+
+    Attributes:
+        - metrics: The MetricsRegistry the lag is recorded in
+        - interval: Seconds between two measurements
+
+    Methods:
+        - start: Start measuring on the running loop
+        - stop: Stop measuring
+    """
+
+    def __init__(self, metrics=None, interval=LOOP_LAG_INTERVAL):
+        self.metrics = metrics if metrics is not None else get_metrics()
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.metrics.record_loop_lag(max(0.0, loop.time() - expected))
+
+
+class MetricsServer:
+    """
+    The MetricsServer class serves the metrics in the Prometheus text format over HTTP
+    (GET /metrics), on the event loop of the sessions, so a scrape only reads the
+    counters and never touches the XMPP streams.
+
+    Attributes:
+        - metrics: The MetricsRegistry served
+        - host: The address the server listens on
+        - port: The port the server listens on (0 picks a free port)
+
+    Methods:
+        - start: Start listening, returns the (host, port) of the server
+        - stop: Stop listening
+    """
+
+    def __init__(self, metrics=None, host="127.0.0.1", port=9100):
+        self.metrics = metrics if metrics is not None else get_metrics()
+        self.host = host
+        self.port = port
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.host, self.port = self._server.sockets[0].getsockname()[:2]
+        log.info("Metrics served on http://%s:%s/metrics", self.host, self.port)
+        return self.host, self.port
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 10)
+            # Skip the headers of the request
+            while (await asyncio.wait_for(reader.readline(), 10)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split('?')[0] == "/metrics":
+                status, content_type, body = "200 OK", PROMETHEUS_CONTENT_TYPE, self.metrics.render()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain; charset=utf-8", "Not Found\n"
+            payload = body.encode('utf-8')
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode('latin-1'))
+            writer.write(payload)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            log.warning("Metrics request failed: %s", e)
+        finally:
+            writer.close()
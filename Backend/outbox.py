@@ -0,0 +1,176 @@
+import asyncio
+import time
+from collections import OrderedDict
+from Backend.messages import ChatMessage
+
+# Maximum number of messages waiting to be sent
+DEFAULT_OUTBOX_SIZE = 1000
+
+# Number of messages sent before yielding to the event loop
+SEND_BATCH_SIZE = 50
+
+
+class Outbox:
+    """
+    The Outbox class is the outbound path of chat messages of a session.
+    Messages are queued in a bounded queue and sent by a worker task once the session is
+    ready. A full queue is reported to the caller instead of growing without limit, which
+    lets the GUI apply backpressure.
+
+    With XEP-0198 stream management, every sent message is kept until the server acks it.
+    When the stream is resumed, Slixmpp resends the unacked stanzas itself; when a new
+    session has to be started instead, the messages still unacked are sent again with the
+    same stanza id once stream management is enabled on it, so nothing is lost and the
+    receiver can detect duplicates.
+
+    Attributes:
+        - client: The XMPP_Client sending the messages
+        - maxsize: Maximum number of messages waiting to be sent
+        - in_flight: Sent messages not acked by the server yet, keyed by stanza id
+        - sent_count: Number of messages sent
+        - acked_count: Number of messages acked by the server
+
+    Methods:
+        - submit: Queue a message without waiting, returns None if the outbox is full
+        - send: Queue a message, waiting for room in the outbox
+        - pending: Return the number of messages waiting to be sent
+        - close: Stop the worker task
+    """
+
+    def __init__(self, client, maxsize=DEFAULT_OUTBOX_SIZE):
+        self.client = client
+        self.maxsize = maxsize
+        self.in_flight = OrderedDict()
+        self.sent_count = 0
+        self.acked_count = 0
+        self.session_active = False
+        self._queue = None
+        self._ready = None
+        self._worker = None
+
+        client.add_event_handler("session_start", self.on_session_start)
+        client.add_event_handler("session_resumed", self.on_session_resumed)
+        client.add_event_handler("sm_enabled", self.on_sm_enabled)
+        client.add_event_handler("disconnected", self.on_disconnected)
+        client.add_event_handler("stanza_acked", self.on_stanza_acked)
+
+    def _ensure_worker(self):
+        """
+        Create the queue and the worker task on first use, inside the running event loop.
+        """
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.maxsize)
+            self._ready = asyncio.Event()
+            if self.session_active:
+                self._ready.set()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self._run())
+
+    def submit(self, peer, body):
+        """
+        Queue a chat message for a contact without waiting.
+        Returns the queued ChatMessage, or None if the outbox is full.
+        """
+        self._ensure_worker()
+        item = self._make_item(peer, body)
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            return None
+        return self._record(item)
+
+    async def send(self, peer, body):
+        """
+        Queue a chat message for a contact, waiting for room in the outbox if it is full.
+        """
+        self._ensure_worker()
+        item = self._make_item(peer, body)
+        await self._queue.put(item)
+        return self._record(item)
+
+    def pending(self):
+        """
+        Return the number of messages waiting to be sent.
+        """
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def is_full(self):
+        return self._queue is not None and self._queue.full()
+
+    def _make_item(self, peer, body):
+        return (self.client.new_id(), ChatMessage(peer, body, time.time(), 'out'))
+
+    def _record(self, item):
+        """
+        Add a queued message to its conversation so the GUI displays it.
+        """
+        return self.client.conversations.record(item[1])
+
+    async def _run(self):
+        """
+        Worker task sending the queued messages while the session is ready.
+        """
+        sent_in_batch = 0
+        while True:
+            stanza_id, message = await self._queue.get()
+            await self._ready.wait()
+            self._transmit(stanza_id, message)
+
+            # Let the event loop breathe during long bursts
+            sent_in_batch += 1
+            if sent_in_batch >= SEND_BATCH_SIZE:
+                sent_in_batch = 0
+                await asyncio.sleep(0)
+
+    def _transmit(self, stanza_id, message):
+        """
+        Send a message stanza and keep it until the server acks it.
+        """
+        stanza = self.client.make_message(mto=message.peer, mbody=message.body, mtype='chat')
+        stanza['id'] = stanza_id
+        if 'stream_management' in self.client.features:
+            self.in_flight[stanza_id] = message
+        stanza.send()
+        self.sent_count += 1
+
+    def on_session_start(self, event):
+        """
+        A session started, sending can start.
+        """
+        self.session_active = True
+        if self._ready is not None:
+            self._ready.set()
+
+    def on_sm_enabled(self, event):
+        """
+        Stream management was enabled on a new session (the previous one could not be
+        resumed): the messages left unacked by the previous session are sent again.
+        """
+        unacked, self.in_flight = self.in_flight, OrderedDict()
+        for stanza_id, message in unacked.items():
+            self._transmit(stanza_id, message)
+
+    def on_session_resumed(self, event):
+        """
+        The stream was resumed: Slixmpp resent the unacked stanzas, sending can continue.
+        """
+        self.session_active = True
+        if self._ready is not None:
+            self._ready.set()
+
+    def on_disconnected(self, event):
+        self.session_active = False
+        if self._ready is not None:
+            self._ready.clear()
+
+    def on_stanza_acked(self, stanza):
+        if self.in_flight.pop(stanza['id'], None) is not None:
+            self.acked_count += 1
+
+    def close(self):
+        """
+        Stop the worker task, the queued messages are dropped.
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
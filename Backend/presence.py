@@ -0,0 +1,228 @@
+import asyncio
+from typing import NamedTuple
+from Backend.metrics import get_metrics, instrument
+from Backend.log import get_logger
+
+log = get_logger("session")
+
+# Ordering of the presence show values, from the most to the least available
+SHOW_RANK = {'chat': 0, '': 1, 'away': 2, 'xa': 3, 'dnd': 4}
+
+# Seconds between two applications of the buffered presence stanzas
+PRESENCE_FLUSH_INTERVAL = 0.05
+
+# Maximum number of buffered presence stanzas applied at once
+PRESENCE_BATCH_SIZE = 250
+
+# Human readable labels of the presence show values
+SHOW_LABELS = {
+    'chat': 'Free to Chat',
+    '': 'Available',
+    'away': 'Away',
+    'xa': 'Extended Away',
+    'dnd': 'Do Not Disturb',
+}
+
+
+class PresenceInfo(NamedTuple):
+    """
+    The presence announced by one resource of a contact.
+    """
+    resource: str
+    show: str
+    status: str
+    priority: int
+
+    @property
+    def label(self):
+        return SHOW_LABELS.get(self.show, self.show)
+
+    def sort_key(self):
+        # Highest priority first, then the most available show value
+        return (-self.priority, SHOW_RANK.get(self.show, len(SHOW_RANK)))
+
+
+class PresenceIndex:
+    """
+    The PresenceIndex class keeps the best presence of every contact, by bare JID.
+    It is updated on every presence stanza: the best presence is replaced in constant
+    time when a resource becomes better, and the few resources of a single contact are
+    only rescanned when its best resource degrades or goes offline.
+
+    Attributes:
+        - resources: The presence of every online resource, keyed by bare JID and resource
+        - best: The best presence of every online contact, keyed by bare JID
+
+    Methods:
+        - update: Apply a presence stanza and tell whether the best presence changed
+        - set_available: Store the presence of an online resource
+        - set_unavailable: Forget a resource that went offline
+        - clear: Forget every presence, when a new session starts
+        - get: Return the best presence of a contact
+        - describe: Return the (presence label, status) pair shown to the user
+    """
+
+    def __init__(self):
+        self.resources = {}
+        self.best = {}
+
+    def __contains__(self, jid):
+        return jid in self.best
+
+    def update(self, presence):
+        """
+        Apply an available or unavailable presence stanza.
+        Returns True if the best presence of the sender changed.
+        """
+        jid = presence['from']
+        if presence['type'] == 'unavailable':
+            return self.set_unavailable(jid.bare, jid.resource)
+        return self.set_available(jid.bare, jid.resource, presence['show'],
+                                  presence['status'], presence['priority'])
+
+    def set_available(self, jid, resource, show='', status='', priority=0):
+        """
+        Store the presence of an online resource.
+        Returns True if the best presence of the contact changed.
+        """
+        info = PresenceInfo(resource, show or '', status or '', int(priority or 0))
+        self.resources.setdefault(jid, {})[resource] = info
+
+        current = self.best.get(jid)
+        if current is None or info.sort_key() <= current.sort_key():
+            self.best[jid] = info
+        elif current.resource == resource:
+            # The best resource degraded, another one may be better now
+            self.best[jid] = self._elect(jid)
+        return self.best[jid] != current
+
+    def set_unavailable(self, jid, resource):
+        """
+        Forget a resource that went offline.
+        Returns True if the best presence of the contact changed.
+        """
+        resources = self.resources.get(jid)
+        if not resources or resources.pop(resource, None) is None:
+            return False
+
+        if not resources:
+            del self.resources[jid]
+            del self.best[jid]
+            return True
+
+        if self.best[jid].resource == resource:
+            self.best[jid] = self._elect(jid)
+            return True
+        return False
+
+    def _elect(self, jid):
+        """
+        Return the best presence among the resources of a contact.
+        """
+        return min(self.resources[jid].values(), key=PresenceInfo.sort_key)
+
+    def clear(self):
+        """
+        Forget every presence and return the bare JIDs that were online.
+        """
+        online = list(self.best)
+        self.resources.clear()
+        self.best.clear()
+        return online
+
+    def get(self, jid):
+        """
+        Return the best presence of a contact, or None if it is offline.
+        """
+        return self.best.get(jid)
+
+    def describe(self, jid):
+        """
+        Return the presence label and status message of a contact, as shown to the user.
+        """
+        info = self.best.get(jid)
+        if info is None:
+            return 'Offline', 'None'
+        return info.label, info.status or 'None'
+
+
+class PresenceBuffer:
+    """
+    The PresenceBuffer class absorbs the presence floods of large rosters, like the
+    presence of every online contact pushed by the server right after login.
+    Incoming stanzas are only stored, keyed by full JID so a later stanza of the same
+    resource replaces an earlier one, and are applied to the PresenceIndex in batches
+    every interval seconds, at most batch_size at a time. The contacts whose best
+    presence changed are reported with a single ContactList delta per batch, so the
+    GUI refreshes once per batch instead of once per stanza.
+
+    The handled stanzas and the stanzas waiting in the buffer are exported in the
+    shared MetricsRegistry; the rate of the first one is the presence stanzas per second.
+
+    Attributes:
+        - index: The PresenceIndex the stanzas are applied to
+        - contacts: The ContactList told about the contacts whose presence changed
+        - interval: Seconds between two batches
+        - batch_size: Maximum number of stanzas applied per batch
+        - pending: The stanzas waiting to be applied, keyed by full JID
+
+    Methods:
+        - add: Buffer a presence stanza
+        - flush: Apply a batch of buffered stanzas
+        - clear: Drop the buffered stanzas, when a new session starts
+    """
+
+    def __init__(self, index, contacts, interval=PRESENCE_FLUSH_INTERVAL, batch_size=PRESENCE_BATCH_SIZE):
+        self.index = index
+        self.contacts = contacts
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pending = {}
+        self._timer = None
+        metrics = get_metrics()
+        self.stanzas = metrics.counter(
+            "xmpp_presence_stanzas_total", "Presence stanzas received from the contacts").labels()
+        self.buffered = metrics.gauge(
+            "xmpp_presence_buffered", "Presence stanzas waiting to be applied").labels()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, presence):
+        """
+        Buffer a presence stanza, it is applied with the next batch.
+        """
+        key = presence['from'].full
+        # Move the resource to the end, so the batches follow the order of arrival
+        self.pending.pop(key, None)
+        self.pending[key] = presence
+        self.stanzas.inc()
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.interval, self.flush)
+
+    @instrument("presence_flush")
+    def flush(self):
+        """
+        Apply up to batch_size buffered stanzas and report the changed contacts at once.
+        The rest is applied on the next batch.
+        """
+        self._timer = None
+        changed = {}
+        for _ in range(min(self.batch_size, len(self.pending))):
+            key = next(iter(self.pending))
+            presence = self.pending.pop(key)
+            if self.index.update(presence):
+                changed[presence['from'].bare] = None
+        if self.pending:
+            self._timer = asyncio.get_running_loop().call_later(self.interval, self.flush)
+        self.buffered.set(len(self.pending))
+        if changed:
+            self.contacts.touch(list(changed))
+            log.debug("Presence batch applied", extra={'changed': len(changed), 'buffered': len(self.pending)})
+
+    def clear(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.pending.clear()
+        self.buffered.set(0)
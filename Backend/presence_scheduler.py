@@ -0,0 +1,214 @@
+from Backend.log import get_logger
+from Backend.metrics import get_metrics
+
+log = get_logger("session")
+
+# Seconds during which presence changes are coalesced into a single broadcast
+DEFAULT_COALESCE_WINDOW = 1.0
+
+# Seconds without user activity before the presence becomes away, and extended away
+DEFAULT_IDLE_AWAY = 300.0
+DEFAULT_IDLE_XA = 1800.0
+
+# Show values the idle transitions apply to, the others (dnd, away, xa) are kept as chosen
+IDLE_OVERRIDABLE = ('', 'chat')
+
+
+class PresenceScheduler:
+    """
+    The PresenceScheduler class decides when the presence of a session is broadcast.
+    Every broadcast fans out to all the subscribed contacts, so the changes asked by the
+    user or by scripts are not sent one by one:
+
+        - The first change is sent at once, the changes that follow within window seconds
+          are coalesced and only the last one is sent when the window ends.
+        - A presence equal to the one last broadcast (same show and status) is not sent.
+        - Once enabled, the presence becomes away, then extended away, after a period
+          without user activity, and comes back on the next activity. Reporting activity
+          only records a timestamp; a single timer checks the idle time, and a stanza is
+          only sent when the idle state changes.
+
+    The presence is broadcast again when a new session starts, since the server forgot
+    it; a resumed stream keeps it, only the changes made while disconnected are sent.
+    The sent, suppressed and coalesced updates are counted in the shared MetricsRegistry.
+
+    Attributes:
+        - client: The XMPP_Client whose presence is broadcast
+        - window: Seconds during which changes are coalesced
+        - desired: The (show, status) chosen by the user
+        - sent: The (show, status) last broadcast, None before the first one
+        - idle_show: The show value of the idle state (away or xa), None while active
+        - idle_away: Seconds without activity before away, None when idle tracking is off
+        - idle_xa: Seconds without activity before extended away, None to stop at away
+
+    Methods:
+        - request: Ask for a presence change
+        - effective: Return the (show, status) that should be broadcast now
+        - flush: Broadcast the effective presence if it differs from the last one sent
+        - enable_idle: Start switching to away and extended away on inactivity
+        - disable_idle: Stop the idle transitions
+        - activity: Report user activity
+        - close: Cancel the timers, when the session is closed
+    """
+
+    def __init__(self, client, window=DEFAULT_COALESCE_WINDOW):
+        self.client = client
+        self.window = window
+        self.desired = ('', '')
+        self.sent = None
+        self.idle_show = None
+        self.idle_away = None
+        self.idle_xa = None
+        self.session_active = False
+        self._last_sent_at = None
+        self._last_activity = None
+        self._flush_timer = None
+        self._idle_timer = None
+        self.updates = get_metrics().counter(
+            "xmpp_presence_updates_total", "Presence updates by outcome (sent, suppressed, coalesced)",
+            ("outcome",))
+
+        client.add_event_handler("session_start", self.on_session_start)
+        client.add_event_handler("session_resumed", self.on_session_resumed)
+        client.add_event_handler("disconnected", self.on_disconnected)
+
+    def request(self, show, status=''):
+        """
+        Ask for a presence change. It is sent at once, or at the end of the coalescing window.
+        """
+        self.desired = (show or '', status or '')
+        self._schedule()
+
+    def effective(self):
+        """
+        Return the (show, status) that should be broadcast, with the idle state applied.
+        """
+        show, status = self.desired
+        if self.idle_show is not None and show in IDLE_OVERRIDABLE:
+            return (self.idle_show, status)
+        return (show, status)
+
+    def _schedule(self):
+        """
+        Flush now when the last broadcast is older than the window, otherwise once it ends.
+        """
+        if self._flush_timer is not None:
+            # A flush is already planned, it will send the latest presence
+            self.updates.labels("coalesced").inc()
+            return
+        now = self.client.loop.time()
+        delay = 0 if self._last_sent_at is None else self._last_sent_at + self.window - now
+        if delay <= 0:
+            self.flush()
+        else:
+            self._flush_timer = self.client.loop.call_later(delay, self.flush)
+
+    def flush(self, force=False):
+        """
+        Broadcast the effective presence unless it is the one last sent.
+        """
+        self._cancel_flush()
+        if not self.session_active:
+            # Sent once the session is established
+            return
+        presence = self.effective()
+        if presence == self.sent and not force:
+            self.updates.labels("suppressed").inc()
+            return
+        show, status = presence
+        self.client.send_presence(pshow=show or None, pstatus=status or None)
+        self.sent = presence
+        self._last_sent_at = self.client.loop.time()
+        self.updates.labels("sent").inc()
+        log.debug("Presence broadcast", extra={'show': show or 'available', 'status': status,
+                                               'idle': self.idle_show is not None})
+
+    def _cancel_flush(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+    def enable_idle(self, away_after=DEFAULT_IDLE_AWAY, xa_after=DEFAULT_IDLE_XA):
+        """
+        Switch to away after away_after seconds without activity, and to extended away
+        after xa_after seconds (None to stay away).
+        """
+        self.idle_away = away_after
+        self.idle_xa = xa_after
+        self._last_activity = self.client.loop.time()
+        self._arm_idle_timer(self.idle_away)
+
+    def disable_idle(self):
+        self.idle_away = self.idle_xa = None
+        self._cancel_idle_timer()
+        if self.idle_show is not None:
+            self.idle_show = None
+            self._schedule()
+
+    def activity(self):
+        """
+        Report user activity. Called on every input event, so it only records the time
+        unless the presence was idle.
+        """
+        if self.idle_away is None:
+            return
+        self._last_activity = self.client.loop.time()
+        if self.idle_show is not None:
+            self.idle_show = None
+            log.debug("User is back from idle")
+            self._schedule()
+            self._arm_idle_timer(self.idle_away)
+
+    def _arm_idle_timer(self, delay):
+        self._cancel_idle_timer()
+        self._idle_timer = self.client.loop.call_later(max(0, delay), self._check_idle)
+
+    def _cancel_idle_timer(self):
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    def _check_idle(self):
+        """
+        Update the idle state from the time since the last activity, and plan the next check.
+        """
+        self._idle_timer = None
+        if self.idle_away is None:
+            return
+        idle_for = self.client.loop.time() - self._last_activity
+        if self.idle_xa is not None and idle_for >= self.idle_xa:
+            idle_show, next_check = 'xa', None
+        elif idle_for >= self.idle_away:
+            idle_show = 'away'
+            next_check = self.idle_xa - idle_for if self.idle_xa is not None else None
+        else:
+            # There was activity since the timer was armed
+            idle_show, next_check = None, self.idle_away - idle_for
+
+        if idle_show != self.idle_show:
+            self.idle_show = idle_show
+            log.debug("User is idle", extra={'show': idle_show, 'idle_seconds': round(idle_for)})
+            self._schedule()
+        if next_check is not None:
+            self._arm_idle_timer(next_check)
+
+    def on_session_start(self, event):
+        # A new session: the server does not know the presence
+        self.session_active = True
+        self.sent = None
+        self._last_sent_at = None
+        self.flush()
+
+    def on_session_resumed(self, event):
+        # The server kept the presence, only send the changes made while disconnected
+        self.session_active = True
+        self.flush()
+
+    def on_disconnected(self, event):
+        self.session_active = False
+        self._cancel_flush()
+
+    def close(self):
+        self.session_active = False
+        self._cancel_flush()
+        self._cancel_idle_timer()
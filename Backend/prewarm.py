@@ -0,0 +1,86 @@
+import importlib
+import threading
+import time
+from Backend.log import get_logger
+
+log = get_logger("app")
+
+# Modules needed to open a session, imported ahead of the first login: Slixmpp with
+# the client and the plugins it registers, and the local storage of the sessions
+PREWARM_MODULES = (
+    "Backend.manager",
+    "Backend.store",
+    "Backend.roster_cache",
+    "slixmpp.plugins.xep_0077",
+    "slixmpp.plugins.xep_0198",
+    "slixmpp.plugins.xep_0203",
+    "slixmpp.plugins.xep_0045",
+)
+
+
+class BackendPrewarmer:
+    """
+    The BackendPrewarmer class imports the modules of the XMPP backend on a background
+    thread once the first window is on screen. The welcome screen only needs Tk, so it
+    is shown without waiting for Slixmpp, and by the time the user submits the login
+    or registration form the backend is usually loaded already. A form opened earlier
+    simply imports the remaining modules itself, the import lock keeps both safe.
+
+    Attributes:
+        - modules: The names of the modules imported
+        - started: Time the import started, from time.perf_counter
+        - duration: Seconds the import took, once finished
+        - error: The exception raised by the import, if any
+
+    Methods:
+        - start: Start importing on a background thread
+        - wait: Wait until the import is finished
+        - finished: Whether the import is finished
+    """
+
+    def __init__(self, modules=PREWARM_MODULES):
+        self.modules = modules
+        self.started = None
+        self.duration = None
+        self.error = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="backend-prewarm", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            for name in self.modules:
+                importlib.import_module(name)
+        except Exception as e:
+            # The module is imported again, and the error raised, when it is needed
+            self.error = e
+            log.warning("Backend pre-warm failed: %s", e)
+        self.duration = time.perf_counter() - self.started
+        log.debug("Backend pre-warmed", extra={'seconds': round(self.duration, 3)})
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.finished()
+
+    def finished(self):
+        return self.duration is not None
+
+
+# Pre-warmer shared by the application
+_prewarmer = None
+
+
+def get_prewarmer():
+    """
+    Return the pre-warmer shared by the application, creating it on first use.
+    """
+    global _prewarmer
+    if _prewarmer is None:
+        _prewarmer = BackendPrewarmer()
+    return _prewarmer
@@ -0,0 +1,240 @@
+import asyncio
+import csv
+import json
+import math
+import time
+from slixmpp.exceptions import IqTimeout
+from Backend.callbacks import UICallbacks
+from Backend.manager import ConnectionManager
+from Backend.log import get_logger
+
+log = get_logger("provisioning")
+
+# Registrations running at the same time by default
+DEFAULT_CONCURRENCY = 10
+
+# Attempts after the first one when the server does not answer
+DEFAULT_RETRIES = 3
+
+# Seconds an attempt waits for the registration to be acknowledged
+DEFAULT_ATTEMPT_TIMEOUT = 30
+
+# Seconds before the first retry, doubled after every failed attempt
+DEFAULT_RETRY_DELAY = 1.0
+
+
+def read_accounts(path, domain):
+    """
+    Read the (JID, password) of the accounts to create from a CSV file.
+    The file has a username and a password column, with or without a header row;
+    usernames without a domain get the given one.
+    """
+    accounts = []
+    with open(path, newline='', encoding='utf-8') as csv_file:
+        rows = [row for row in csv.reader(csv_file) if row and any(cell.strip() for cell in row)]
+    if rows and [cell.strip().lower() for cell in rows[0][:2]] == ['username', 'password']:
+        rows = rows[1:]
+    for line, row in enumerate(rows, start=1):
+        if len(row) < 2 or not row[0].strip() or not row[1]:
+            raise ValueError(f"Row {line} of {path} needs a username and a password")
+        username = row[0].strip()
+        jid = username if '@' in username else f"{username}@{domain}"
+        accounts.append((jid.lower(), row[1]))
+    return accounts
+
+
+class RegistrationOutcome(UICallbacks):
+    """
+    Resolves a future with the outcome of the registration of a provisioning session.
+    """
+
+    def __init__(self, future):
+        self.future = future
+
+    def registration_succeeded(self, client):
+        if not self.future.done():
+            self.future.set_result(None)
+
+    def registration_failed(self, client, reason):
+        if not self.future.done():
+            self.future.set_result(client.registration_error or RuntimeError(reason))
+
+
+class ProvisioningResult:
+    """
+    The ProvisioningResult class holds the outcome of the registration of one account.
+
+    Attributes:
+        - jid: The bare JID of the account
+        - status: created, exists (the username is taken) or failed
+        - attempts: Number of registration attempts
+        - seconds: Time of the successful attempt, or of all the attempts when it failed
+        - error: The reason of the failure
+    """
+
+    def __init__(self, jid, status, attempts, seconds, error=None):
+        self.jid = jid
+        self.status = status
+        self.attempts = attempts
+        self.seconds = seconds
+        self.error = error
+
+    def to_dict(self):
+        return {'jid': self.jid, 'status': self.status, 'attempts': self.attempts,
+                'seconds': self.seconds, 'error': self.error}
+
+
+class AccountProvisioner:
+    """
+    The AccountProvisioner class creates accounts in bulk with the XEP-0077 registration
+    of XMPP_Client. Registrations run concurrently on the event loop, at most concurrency
+    at a time; an attempt the server does not answer (IqTimeout, or no acknowledgement
+    within attempt_timeout) is retried after an exponential delay, while a rejected
+    registration is reported as is. Every session is closed once its registration is
+    acknowledged, the accounts are not logged in.
+
+    Attributes:
+        - manager: The ConnectionManager of the registration sessions
+        - concurrency: Maximum number of registrations running at the same time
+        - retries: Attempts after the first one when the server does not answer
+        - attempt_timeout: Seconds an attempt waits for the registration to be acknowledged
+        - retry_delay: Seconds before the first retry, doubled after every attempt
+        - connect_options: Keyword arguments passed to the connection of every session
+
+    Methods:
+        - provision: Register a list of accounts and return their results
+        - register: Register one account, retrying when the server does not answer
+        - summarize: Return the summary report of a list of results
+    """
+
+    def __init__(self, manager=None, concurrency=DEFAULT_CONCURRENCY, retries=DEFAULT_RETRIES,
+                 attempt_timeout=DEFAULT_ATTEMPT_TIMEOUT, retry_delay=DEFAULT_RETRY_DELAY, **connect_options):
+        self.manager = manager if manager is not None else ConnectionManager()
+        self.concurrency = concurrency
+        self.retries = retries
+        self.attempt_timeout = attempt_timeout
+        self.retry_delay = retry_delay
+        self.connect_options = connect_options
+        self._slots = None
+
+    async def provision(self, accounts):
+        """
+        Register every (JID, password) and return the results in the same order.
+        """
+        self._slots = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(self.register(jid, password) for jid, password in accounts))
+
+    async def register(self, jid, password):
+        """
+        Register one account, retrying the attempts the server did not answer.
+        """
+        async with self._slots:
+            start = time.perf_counter()
+            error = None
+            for attempt in range(1, self.retries + 2):
+                if attempt > 1:
+                    await asyncio.sleep(self.retry_delay * 2 ** (attempt - 2))
+                attempt_start = time.perf_counter()
+                error = await self._attempt(jid, password)
+                if error is None:
+                    log.info("Account created", extra={'jid': jid, 'attempts': attempt})
+                    return ProvisioningResult(jid, 'created', attempt, time.perf_counter() - attempt_start)
+                if not isinstance(error, (IqTimeout, asyncio.TimeoutError)):
+                    break
+                log.warning("Registration not answered", extra={'jid': jid, 'attempt': attempt})
+
+            seconds = time.perf_counter() - start
+            if getattr(error, 'condition', None) == 'conflict':
+                log.info("Account already exists", extra={'jid': jid})
+                return ProvisioningResult(jid, 'exists', attempt, seconds, "conflict")
+            reason = describe_error(error)
+            log.error("Could not create account: %s", reason, extra={'jid': jid, 'attempts': attempt})
+            return ProvisioningResult(jid, 'failed', attempt, seconds, reason)
+
+    async def _attempt(self, jid, password):
+        """
+        Connect a registration session and return None once the account is created,
+        or the error that prevented it.
+        """
+        outcome = asyncio.get_running_loop().create_future()
+        client = self.manager.create_session(jid, password, ui=RegistrationOutcome(outcome), register=True)
+        client.add_event_handler("connection_failed",
+                                 lambda error: outcome.done() or outcome.set_result(ConnectionError(str(error))),
+                                 disposable=True)
+        try:
+            self.manager.connect(client, **self.connect_options)
+            return await asyncio.wait_for(outcome, self.attempt_timeout)
+        except asyncio.TimeoutError as e:
+            return e
+        finally:
+            # Wait for the stream to be closed, so the session is released cleanly
+            try:
+                await asyncio.wait_for(client.logout(), self.attempt_timeout)
+            except asyncio.TimeoutError:
+                log.warning("Registration session did not close in time", extra={'jid': jid})
+
+    def summarize(self, results, seconds):
+        """
+        Return the summary report of a provisioning run, with the registration timings in milliseconds.
+        """
+        timings = sorted(result.seconds for result in results if result.status == 'created')
+        counts = {status: sum(1 for result in results if result.status == status)
+                  for status in ('created', 'exists', 'failed')}
+        summary = {
+            'accounts': len(results),
+            **counts,
+            'retried': sum(1 for result in results if result.attempts > 1),
+            'seconds': seconds,
+            'accounts_per_sec': len(results) / seconds if seconds else 0.0,
+        }
+        if timings:
+            summary.update({
+                'p50_ms': timings[max(0, math.ceil(0.50 * len(timings)) - 1)] * 1000,
+                'p95_ms': timings[max(0, math.ceil(0.95 * len(timings)) - 1)] * 1000,
+                'max_ms': timings[-1] * 1000,
+            })
+        return summary
+
+
+def describe_error(error):
+    """
+    Return a readable reason for the failure of a registration attempt.
+    """
+    if isinstance(error, (IqTimeout, asyncio.TimeoutError)):
+        return "No response from server"
+    text = getattr(error, 'text', None) or getattr(error, 'condition', None)
+    return text or str(error) or type(error).__name__
+
+
+async def run_provisioning(path, domain, concurrency=DEFAULT_CONCURRENCY, retries=DEFAULT_RETRIES,
+                           attempt_timeout=DEFAULT_ATTEMPT_TIMEOUT, report=None, **connect_options):
+    """
+    Create the accounts listed in a CSV file and print the summary report as a JSON line.
+    The report, with the result of every account, is written as JSON when a path is given.
+    Returns the process exit code: 0 when no account failed.
+    """
+    accounts = read_accounts(path, domain)
+    provisioner = AccountProvisioner(concurrency=concurrency, retries=retries,
+                                     attempt_timeout=attempt_timeout, **connect_options)
+    log.info("Provisioning accounts", extra={'accounts': len(accounts), 'concurrency': concurrency})
+
+    start = time.perf_counter()
+    results = await provisioner.provision(accounts)
+    summary = provisioner.summarize(results, time.perf_counter() - start)
+
+    for result in results:
+        if result.status == 'failed':
+            log.error("Account not provisioned: %s", result.error,
+                      extra={'jid': result.jid, 'attempts': result.attempts})
+    log.info("Provisioning finished", extra={'accounts': summary['accounts'], 'accounts_created': summary['created'],
+                                             'accounts_existing': summary['exists'],
+                                             'accounts_failed': summary['failed']})
+    if report:
+        with open(report, 'w', encoding='utf-8') as report_file:
+            json.dump({'summary': summary, 'accounts': [result.to_dict() for result in results]},
+                      report_file, indent=2)
+        log.info("Provisioning report written", extra={'path': report})
+
+    # The summary is the output of the command, a single JSON line on the standard output
+    print(json.dumps(summary), flush=True)
+    return 1 if summary['failed'] else 0
@@ -0,0 +1,219 @@
+import asyncio
+import random
+import time
+from Backend.log import get_logger
+
+log = get_logger("connection")
+
+# Upper bound of the delay before the first reconnection attempt, in seconds
+RECONNECT_BASE_DELAY = 0.25
+
+# Upper bound of the delay between two reconnection attempts, in seconds
+RECONNECT_MAX_DELAY = 60.0
+
+# Growth of the delay bound after every failed attempt
+RECONNECT_FACTOR = 2.0
+
+# Seconds a resolved server endpoint is reused before it is resolved again
+ENDPOINT_TTL = 300.0
+
+
+class EndpointCache:
+    """
+    The EndpointCache class remembers the server endpoint every domain was last reached at,
+    so a reconnection, or another session of the same server, connects directly instead of
+    doing the SRV and address lookups again.
+
+    Attributes:
+        - ttl: Seconds an endpoint is reused before it is resolved again
+        - endpoints: The (host, address, port, expiry) of every domain
+
+    Methods:
+        - get: Return the cached (host, address, port) DNS answer of a domain
+        - put: Remember the endpoint a domain was reached at
+        - forget: Drop the endpoint of a domain, after a failed connection
+    """
+
+    def __init__(self, ttl=ENDPOINT_TTL):
+        self.ttl = ttl
+        self.endpoints = {}
+
+    def get(self, domain):
+        entry = self.endpoints.get(domain)
+        if entry is None:
+            return None
+        host, address, port, expiry = entry
+        if time.monotonic() >= expiry:
+            del self.endpoints[domain]
+            return None
+        return (host, address, port)
+
+    def put(self, domain, address, port):
+        self.endpoints[domain] = (domain, address, port, time.monotonic() + self.ttl)
+
+    def forget(self, domain):
+        self.endpoints.pop(domain, None)
+
+
+# Endpoint cache shared by the application
+_endpoints = None
+
+
+def get_endpoint_cache():
+    """
+    Return the endpoint cache shared by the application, creating it on first use.
+    """
+    global _endpoints
+    if _endpoints is None:
+        _endpoints = EndpointCache()
+    return _endpoints
+
+
+class ReconnectSupervisor:
+    """
+    The ReconnectSupervisor class brings a session back after an unexpected disconnection.
+    Attempts are spaced with a jittered exponential backoff (a random delay below a bound
+    that doubles after every failure), so many clients dropped at once do not reconnect
+    in lockstep. The server is reached at its cached endpoint, and the XEP-0198 stream is
+    resumed when the server still holds it: the roster, the presence and the GUI are then
+    kept as they are, and only the unacked stanzas are exchanged again.
+
+    The supervisor only acts once a session has been established, so a failed login is
+    still reported to the user instead of being retried, and it stops for good when the
+    session is closed on purpose or the credentials are rejected.
+
+    Attributes:
+        - client: The XMPP_Client supervised
+        - endpoints: The EndpointCache of the resolved server endpoints
+        - base_delay: Upper bound of the delay before the first attempt
+        - max_delay: Upper bound of the delay between two attempts
+        - factor: Growth of the delay bound after every failed attempt
+        - enabled: Whether an unexpected disconnection is followed by a reconnection
+        - attempts: Number of attempts since the connection was lost
+        - reconnections: Number of times the session was brought back
+        - resumptions: Number of those where the stream was resumed
+        - last_outage: Seconds between the last disconnection and the session coming back
+
+    Methods:
+        - backoff_delay: Return the delay before the next attempt
+        - schedule: Schedule the next reconnection attempt
+        - reconnect: Connect the session again
+        - stop: Stop reconnecting, when the session is closed on purpose
+    """
+
+    def __init__(self, client, endpoints=None, base_delay=RECONNECT_BASE_DELAY,
+                 max_delay=RECONNECT_MAX_DELAY, factor=RECONNECT_FACTOR):
+        self.client = client
+        self.endpoints = endpoints if endpoints is not None else get_endpoint_cache()
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.enabled = False
+        self.stopped = False
+        self.attempts = 0
+        self.reconnections = 0
+        self.resumptions = 0
+        self.last_outage = None
+        self._down_since = None
+        self._pending = None
+
+        client.add_event_handler("session_start", self.on_session_start)
+        client.add_event_handler("session_resumed", self.on_session_resumed)
+        client.add_event_handler("connected", self.on_connected)
+        client.add_event_handler("connection_failed", self.on_connection_failed)
+        client.add_event_handler("disconnected", self.on_disconnected)
+        client.add_event_handler("failed_auth", self.on_failed_auth)
+
+    def backoff_delay(self):
+        """
+        Return a random delay below the bound of the current attempt.
+        """
+        bound = min(self.max_delay, self.base_delay * self.factor ** self.attempts)
+        return random.uniform(0, bound)
+
+    def schedule(self):
+        """
+        Schedule the next reconnection attempt, unless one is already scheduled.
+        """
+        if self._pending is not None or not self.enabled:
+            return
+        delay = self.backoff_delay()
+        self.attempts += 1
+        log.info("Reconnecting in %.2fs", delay, extra={'jid': self.client.boundjid.bare, 'attempt': self.attempts})
+        self._pending = asyncio.get_event_loop().call_later(delay, self.reconnect)
+
+    def reconnect(self):
+        """
+        Connect the session again with the options of its first connection.
+        """
+        self._pending = None
+        if self.enabled:
+            self.client.connect(**self.client.connect_options)
+
+    def stop(self):
+        """
+        Stop reconnecting the session and cancel any attempt in progress.
+        """
+        reconnecting = self._down_since is not None
+        self.enabled = False
+        self.stopped = True
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        if reconnecting:
+            self.client.cancel_connection_attempt()
+
+    def on_connected(self, event):
+        """
+        Remember the endpoint the server was reached at, unless it was given as an address.
+        """
+        transport = self.client.transport
+        peer = transport.get_extra_info('peername') if transport is not None else None
+        if peer and self.client.default_domain:
+            self.endpoints.put(self.client.default_domain, peer[0], peer[1])
+
+    def on_connection_failed(self, error):
+        """
+        Forget the endpoint that could not be reached and, while reconnecting,
+        replace the fixed retry delay of Slixmpp with the jittered backoff.
+        """
+        self.endpoints.forget(self.client.default_domain)
+        if self.enabled and self._down_since is not None:
+            self.client.cancel_connection_attempt()
+            self.schedule()
+
+    def on_disconnected(self, reason):
+        if not self.enabled:
+            return
+        if self._down_since is None:
+            self._down_since = time.monotonic()
+            log.error("Connection lost", extra={'jid': self.client.boundjid.bare})
+            self.client.ui.connection_lost(self.client)
+        self.schedule()
+
+    def on_session_start(self, event):
+        self._session_established(resumed=False)
+
+    def on_session_resumed(self, event):
+        self._session_established(resumed=True)
+
+    def _session_established(self, resumed):
+        """
+        The session is up: supervise it, and report the end of the outage if there was one.
+        """
+        if self.stopped:
+            return
+        self.enabled = True
+        self.attempts = 0
+        if self._down_since is not None:
+            self.last_outage = time.monotonic() - self._down_since
+            self._down_since = None
+            self.reconnections += 1
+            self.resumptions += resumed
+            log.info("Session %s after %.3fs", 'resumed' if resumed else 'restarted', self.last_outage,
+                     extra={'jid': self.client.boundjid.bare})
+            self.client.ui.connection_restored(self.client, resumed)
+
+    def on_failed_auth(self, event):
+        # The credentials are no longer accepted, retrying would not help
+        self.stop()
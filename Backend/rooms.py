@@ -0,0 +1,442 @@
+import asyncio
+import math
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from typing import NamedTuple
+from slixmpp import Presence
+from slixmpp.exceptions import PresenceError
+from Backend.log import get_logger
+
+log = get_logger("session")
+
+# Number of recent messages kept in memory for every room
+ROOM_HISTORY_LIMIT = 500
+
+# Number of messages waiting to be rendered kept for every room, older ones are dropped
+ROOM_PENDING_LIMIT = 2000
+
+# Number of history messages requested when joining a room by default
+DEFAULT_HISTORY_STANZAS = 20
+
+# Maximum number of history messages asked when joining a room again after a lost session
+REJOIN_HISTORY_STANZAS = ROOM_HISTORY_LIMIT
+
+# Seconds of history asked again on a rejoin before the last message received, so no
+# message is missed because of the delivery time; the messages of the overlap are skipped
+REJOIN_OVERLAP = 2
+
+# Seconds a join waits for the room to accept the occupant
+DEFAULT_JOIN_TIMEOUT = 15
+
+# Prefix of the multi-user chat service of a domain
+MUC_SERVICE_PREFIX = 'conference.'
+
+# Status codes of the MUC presences (XEP-0045 section 15.6)
+STATUS_SELF_PRESENCE = 110
+STATUS_ROOM_CREATED = 201
+
+
+def room_jid(name, domain):
+    """
+    Return the bare JID of a room from its name, adding the conference service of the domain.
+    """
+    name = name.strip().lower()
+    return name if '@' in name else f"{name}@{MUC_SERVICE_PREFIX}{domain}"
+
+
+class Occupant(NamedTuple):
+    """
+    An occupant of a room, as announced by its last presence.
+    """
+    nick: str
+    jid: str  # Real JID, when the room discloses it
+    affiliation: str
+    role: str
+    show: str
+    status: str
+
+
+class RoomMessage(NamedTuple):
+    """
+    A message of a room.
+    """
+    room: str
+    nick: str
+    body: str
+    timestamp: float  # Delay stamp of the server for history messages, reception time otherwise
+    delayed: bool  # Whether the message comes from the room history
+    received: float = 0.0  # Local time the message was received
+
+    def format(self, own_nick=None):
+        """
+        Return the line displayed in the room view for this message.
+        """
+        sender = "Me" if self.nick == own_nick else self.nick
+        clock = time.strftime('%H:%M:%S', time.localtime(self.timestamp))
+        return f"[{clock}] {sender}: {self.body}\n"
+
+
+class Room:
+    """
+    The Room class holds the state of a joined room: its occupants indexed by nick and
+    its messages. The memory of a busy room stays bounded: only the last
+    ROOM_HISTORY_LIMIT messages are kept, and when the GUI falls behind, the messages
+    waiting to be rendered beyond ROOM_PENDING_LIMIT are dropped and counted.
+
+    Attributes:
+        - jid: The bare JID of the room
+        - nick: The nick of the account in the room
+        - occupants: The occupants of the room, keyed by nick
+        - occupants_version: Increased on every occupant change, so views only redraw when it moved
+        - subject: The subject of the room
+        - history: The most recent messages of the room
+        - pending: The messages not rendered by the GUI yet
+        - dropped: Number of messages dropped from pending before being rendered
+        - joined: Whether the account is an occupant of the room
+        - created: Whether the room was created by the join
+        - last_received: Local time the last message was received, to fetch only the missed history on rejoin
+        - rejoining: Whether a rejoin is in progress, its history is held until it is complete
+
+    Methods:
+        - append: Add a message to the room
+        - drain: Return the pending messages
+        - set_occupant: Add or update an occupant
+        - remove_occupant: Remove an occupant
+        - clear_occupants: Forget the occupants, when the room has to be joined again
+        - nicks: Return the sorted nicks of the occupants
+        - start_rejoin: Remember the history already received before joining again
+        - defer_replayed: Keep a history message of a rejoin until the whole history is received
+        - end_rejoin: Add the history of a rejoin that was not received yet
+    """
+
+    def __init__(self, jid, nick):
+        self.jid = jid
+        self.nick = nick
+        self.occupants = {}
+        self.occupants_version = 0
+        self.subject = ''
+        self.history = deque(maxlen=ROOM_HISTORY_LIMIT)
+        self.pending = deque(maxlen=ROOM_PENDING_LIMIT)
+        self.dropped = 0
+        self.joined = False
+        self.created = False
+        self.last_received = None
+        self.rejoining = False
+        self._replayed = []
+        self._rejoin_tail = []
+        self._nicks = None
+
+    def append(self, message):
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        self.history.append(message)
+        self.pending.append(message)
+        self.last_received = message.received
+
+    def start_rejoin(self, overlap=REJOIN_OVERLAP):
+        """
+        Prepare joining the room again and return the seconds of history to ask for, None
+        when no message was received yet. The window is measured on the local clock only
+        (the room applies it on its own clock), and covers overlap more seconds: the
+        messages received in that time are remembered to skip them when the room sends
+        them again.
+        """
+        self.rejoining = True
+        self._replayed = []
+        self._rejoin_tail = []
+        if self.last_received is None:
+            return None
+        cutoff = self.last_received - overlap
+        for message in reversed(self.history):
+            if message.received < cutoff:
+                break
+            self._rejoin_tail.append((message.nick, message.body))
+        self._rejoin_tail.reverse()
+        return math.ceil(time.time() - self.last_received) + overlap
+
+    def defer_replayed(self, message):
+        """
+        Keep a history message of a rejoin until the room sent its whole history, and
+        return whether it was kept.
+        """
+        if not message.delayed or not self.rejoining:
+            return False
+        self._replayed.append(message)
+        return True
+
+    def end_rejoin(self):
+        """
+        Add the history of a rejoin that follows the messages already received, and return
+        the number of messages added.
+        The history is matched by order against the last messages received: the longest
+        prefix of the history ending like them was already received. Without a match the
+        window of the rejoin did not reach them, and the whole history is new.
+        """
+        if not self.rejoining:
+            return 0
+        replayed, tail = self._replayed, self._rejoin_tail
+        self.rejoining = False
+        self._replayed, self._rejoin_tail = [], []
+        keys = [(message.nick, message.body) for message in replayed]
+        start = 0
+        for end in range(len(keys) if tail else 0, 0, -1):
+            size = min(end, len(tail))
+            if keys[end - size:end] == tail[len(tail) - size:]:
+                start = end
+                break
+        for message in replayed[start:]:
+            self.append(message)
+        return len(replayed) - start
+
+    def drain(self, limit=None):
+        """
+        Remove and return up to limit pending messages, oldest first.
+        """
+        if limit is None or limit >= len(self.pending):
+            messages = list(self.pending)
+            self.pending.clear()
+            return messages
+        return [self.pending.popleft() for _ in range(limit)]
+
+    def set_occupant(self, occupant):
+        if self.occupants.get(occupant.nick) != occupant:
+            if occupant.nick not in self.occupants:
+                self._nicks = None
+            self.occupants[occupant.nick] = occupant
+            self.occupants_version += 1
+
+    def remove_occupant(self, nick):
+        if self.occupants.pop(nick, None) is not None:
+            self._nicks = None
+            self.occupants_version += 1
+
+    def clear_occupants(self):
+        self.occupants.clear()
+        self._nicks = None
+        self.occupants_version += 1
+
+    def nicks(self):
+        """
+        Return the sorted nicks of the occupants, sorted again only after a join or a leave.
+        """
+        if self._nicks is None:
+            self._nicks = sorted(self.occupants, key=str.lower)
+        return self._nicks
+
+
+class RoomManager:
+    """
+    The RoomManager class joins, creates and leaves the XEP-0045 multi-user chat rooms of
+    a session, on top of the Slixmpp xep_0045 plugin. Like the chat conversations, the
+    stanza handlers of the rooms only update the Room objects (occupant index, bounded
+    message queues); the front end renders them in batches on its own tick.
+
+    A join asks the room for a part of its history: the last maxstanzas messages, or the
+    messages of the last seconds (at most maxstanzas). When a new session replaces a lost
+    stream, the rooms are joined again and only the history since the last message
+    received is requested, bounded to REJOIN_HISTORY_STANZAS messages.
+
+    Attributes:
+        - client: The XMPP_Client owning the rooms
+        - rooms: The joined rooms, keyed by bare JID
+        - unread: Bare JIDs of the rooms with messages waiting to be rendered
+
+    Methods:
+        - join: Join a room, creating it if it does not exist
+        - create: Create a room, configured as an instant room
+        - leave: Leave a room
+        - send: Send a message to a room
+        - drain: Return the pending messages of a room
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.rooms = {}
+        self.unread = set()
+        self._joining = set()
+
+        client.add_event_handler("groupchat_presence", self.on_presence)
+        client.add_event_handler("groupchat_message", self.on_message)
+        client.add_event_handler("groupchat_subject", self.on_subject)
+        client.add_event_handler("session_start", self.on_session_start)
+
+    def __contains__(self, jid):
+        return jid in self.rooms
+
+    def get(self, jid):
+        return self.rooms.get(jid)
+
+    async def join(self, jid, nick, password=None, maxstanzas=DEFAULT_HISTORY_STANZAS, seconds=None,
+                   timeout=DEFAULT_JOIN_TIMEOUT):
+        """
+        Join a room with the given nick and return its Room once the room accepted it.
+        The history sent by the room is limited to maxstanzas messages and, when seconds
+        is given, to the messages of the last seconds (measured by the room).
+        Raises PresenceError when the room refuses the join, asyncio.TimeoutError without answer.
+        """
+        room = self.rooms.get(jid)
+        if room is not None and room.joined:
+            return room
+        room = self.rooms[jid] = room or Room(jid, nick)
+        room.nick = nick
+
+        # The occupants and the history are received by the handlers while the plugin waits
+        # for the own presence and the subject, which complete the join
+        history = {'maxstanzas': maxstanzas}
+        limit_history = None
+        if seconds is not None:
+            history = {'seconds': seconds}
+            # The plugin only sends one history limit, the number of messages is added to
+            # the join presence on its way out
+            target = f"{jid}/{nick}"
+
+            def limit_history(stanza):
+                if (isinstance(stanza, Presence) and stanza['to'] == target
+                        and stanza.get_plugin('muc_join', check=True) is not None):
+                    stanza['muc_join']['history']['maxstanzas'] = str(maxstanzas)
+                return stanza
+
+            self.client.add_filter('out', limit_history)
+        self._joining.add(jid)
+        try:
+            await self.client.plugin['xep_0045'].join_muc_wait(jid, nick, password=password or None,
+                                                               timeout=timeout, **history)
+        except (PresenceError, asyncio.TimeoutError, asyncio.CancelledError):
+            # The plugin still counts the room as joined, and the room may accept a join it
+            # did not answer in time: leave it, rooms ignore the leave of a non-occupant
+            self._forget(jid)
+            raise
+        finally:
+            self._joining.discard(jid)
+            if limit_history is not None:
+                self.client.del_filter('out', limit_history)
+        log.info("Room joined", extra={'room': jid, 'nick': nick, 'room_created': room.created,
+                                       'occupants': len(room.occupants)})
+        return room
+
+    async def create(self, jid, nick, timeout=DEFAULT_JOIN_TIMEOUT):
+        """
+        Create a room and accept its default configuration (an instant room).
+        Returns the Room; its created attribute is False when the room already existed
+        and was joined instead.
+        """
+        room = await self.join(jid, nick, maxstanzas=0, timeout=timeout)
+        if room.created:
+            iq = self.client.make_iq_set(ito=jid)
+            query = ET.Element('{http://jabber.org/protocol/muc#owner}query')
+            ET.SubElement(query, '{jabber:x:data}x', {'type': 'submit'})
+            iq.append(query)
+            await self.client.iq_requests.send(iq, timeout=timeout, name="room_configure")
+        return room
+
+    def leave(self, jid):
+        """
+        Leave a room and forget its messages.
+        """
+        room = self.rooms.get(jid)
+        if room is None:
+            return
+        self._forget(jid)
+        log.info("Room left", extra={'room': jid})
+
+    def _forget(self, jid):
+        room = self.rooms.pop(jid, None)
+        self.unread.discard(jid)
+        muc = self.client.plugin['xep_0045']
+        if room is not None and jid in muc.get_joined_rooms():
+            muc.leave_muc(jid, room.nick)
+
+    def send(self, jid, body):
+        """
+        Send a message to a room. It is displayed when the room echoes it back.
+        """
+        self.client.send_message(mto=jid, mbody=body, mtype='groupchat')
+
+    def on_presence(self, presence):
+        """
+        Update the occupant index of a room, and mark it joined on the own presence.
+        """
+        jid = presence['from'].bare
+        room = self.rooms.get(jid)
+        if room is None:
+            return
+        nick = presence['from'].resource
+        muc = presence['muc']
+        codes = muc['status_codes']
+        own = STATUS_SELF_PRESENCE in codes or nick == room.nick
+        if presence['type'] == 'unavailable':
+            room.remove_occupant(nick)
+            if own:
+                room.joined = False
+            return
+
+        room.set_occupant(Occupant(nick, muc['jid'].bare, muc['affiliation'], muc['role'],
+                                   presence['show'], presence['status']))
+        if own and not room.joined:
+            room.joined = True
+            room.created = STATUS_ROOM_CREATED in codes
+
+    def on_message(self, msg):
+        """
+        Queue a message of a room. The history of a rejoin is held until the subject ends it.
+        """
+        room = self.rooms.get(msg['from'].bare)
+        if room is None:
+            return
+        received = time.time()
+        timestamp, delayed = received, False
+        if msg['delay']['stamp']:
+            timestamp, delayed = msg['delay']['stamp'].timestamp(), True
+        message = RoomMessage(room.jid, msg['from'].resource, msg['body'], timestamp, delayed, received)
+        if room.defer_replayed(message):
+            return
+        room.append(message)
+        self.unread.add(room.jid)
+
+    def on_subject(self, msg):
+        """
+        Keep the subject of a room. The subject follows the history of a join, the history
+        held by a rejoin is added then, before any live message.
+        """
+        room = self.rooms.get(msg['from'].bare)
+        if room is not None:
+            room.subject = msg['subject']
+            if room.end_rejoin():
+                self.unread.add(room.jid)
+
+    def drain(self, jid, limit=None):
+        """
+        Return up to limit pending messages of a room, oldest first.
+        """
+        room = self.rooms.get(jid)
+        if room is None:
+            return []
+        messages = room.drain(limit)
+        if not room.pending:
+            self.unread.discard(jid)
+        return messages
+
+    def on_session_start(self, event):
+        """
+        Join the rooms again after a new session, asking only for the history missed.
+        """
+        for room in list(self.rooms.values()):
+            if room.jid in self._joining:
+                # Still joining, the join is waiting for the answer on the new session
+                continue
+            room.joined = False
+            room.clear_occupants()
+            asyncio.ensure_future(self._rejoin(room))
+
+    async def _rejoin(self, room):
+        seconds = room.start_rejoin()
+        try:
+            await self.join(room.jid, room.nick, seconds=seconds,
+                            maxstanzas=REJOIN_HISTORY_STANZAS if seconds is not None else DEFAULT_HISTORY_STANZAS)
+        except (PresenceError, asyncio.TimeoutError) as e:
+            log.warning("Could not join the room again: %s", e, extra={'room': room.jid})
+        finally:
+            # Normally done by the subject, the history held is added if the join failed
+            if room.end_rejoin():
+                self.unread.add(room.jid)
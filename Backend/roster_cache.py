@@ -0,0 +1,171 @@
+import asyncio
+import json
+import os
+import sqlite3
+from Backend.store import DATA_DIR
+
+# Seconds a roster change may wait before being written to disk
+FLUSH_INTERVAL = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS roster_items (
+    owner TEXT NOT NULL,
+    jid TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (owner, jid)
+);
+CREATE TABLE IF NOT EXISTS roster_versions (
+    owner TEXT PRIMARY KEY,
+    version TEXT NOT NULL
+);
+"""
+
+
+class RosterCache:
+    """
+    The RosterCache class keeps a copy of the roster of every account on disk, together
+    with its XEP-0237 version token. It implements the datastore interface of the Slixmpp
+    roster, so the cached roster is available as soon as the client is created and the
+    login only requests the changes made since the cached version.
+
+    The whole cache is held in memory; changes are written in a single transaction shortly
+    after they happen, items and version together, so the version on disk always matches
+    the items on disk.
+
+    Attributes:
+        - path: Path of the SQLite database file
+        - items: The cached roster items, keyed by owner bare JID and contact bare JID
+        - versions: The roster version tokens, keyed by owner bare JID
+
+    Methods:
+        - entries: Return the cached owners, or the cached contacts of an owner
+        - load: Return the cached state of a roster item
+        - save: Store the state of a roster item
+        - version: Return the cached roster version of an owner
+        - set_version: Store the roster version of an owner
+        - flush: Write the pending changes to disk
+        - close: Write the pending changes and close the database
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DATA_DIR, "roster.db")
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connection = sqlite3.connect(self.path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+
+        # Load the whole cache in memory
+        self.items = {}
+        for owner, jid, state in self._connection.execute("SELECT owner, jid, state FROM roster_items"):
+            self.items.setdefault(owner, {})[jid] = json.loads(state)
+        self.versions = dict(self._connection.execute("SELECT owner, version FROM roster_versions"))
+
+        self._dirty_items = set()
+        self._dirty_versions = set()
+        self._flush_handle = None
+
+    def entries(self, owner, db_state=None):
+        """
+        Return the owners with a cached roster, or the cached contacts of an owner.
+        """
+        if owner is None:
+            return list(self.items)
+        return list(self.items.get(owner, {}))
+
+    def load(self, owner, jid, db_state):
+        return self.items.get(owner, {}).get(jid)
+
+    def save(self, owner, jid, item_state, db_state):
+        """
+        Store the state of a roster item, removed items are deleted from the cache.
+        """
+        if jid == owner:
+            return
+        if item_state.get('removed'):
+            self.items.get(owner, {}).pop(jid, None)
+        else:
+            state = {key: value for key, value in item_state.items() if key != 'removed'}
+            self.items.setdefault(owner, {})[jid] = state
+        self._dirty_items.add((owner, jid))
+        self._schedule_flush()
+
+    def version(self, owner):
+        return self.versions.get(owner, '')
+
+    def set_version(self, owner, version):
+        self.versions[owner] = version
+        self._dirty_versions.add(owner)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        """
+        Write the changes FLUSH_INTERVAL seconds later, or now without an event loop.
+        """
+        if self._flush_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+        else:
+            self._flush_handle = loop.call_later(FLUSH_INTERVAL, self.flush)
+
+    def flush(self):
+        """
+        Write the pending item and version changes in a single transaction.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._dirty_items and not self._dirty_versions:
+            return
+
+        upserts, deletes = [], []
+        for owner, jid in self._dirty_items:
+            state = self.items.get(owner, {}).get(jid)
+            if state is None:
+                deletes.append((owner, jid))
+            else:
+                upserts.append((owner, jid, json.dumps(state)))
+        versions = [(owner, self.versions[owner]) for owner in self._dirty_versions]
+        self._dirty_items.clear()
+        self._dirty_versions.clear()
+
+        with self._connection:
+            self._connection.executemany("DELETE FROM roster_items WHERE owner = ? AND jid = ?", deletes)
+            self._connection.executemany("INSERT OR REPLACE INTO roster_items (owner, jid, state) VALUES (?, ?, ?)",
+                                         upserts)
+            self._connection.executemany("INSERT OR REPLACE INTO roster_versions (owner, version) VALUES (?, ?)",
+                                         versions)
+
+    def close(self):
+        """
+        Write the pending changes and close the database.
+        """
+        self.flush()
+        self._connection.close()
+
+
+# Roster cache shared by the application
+_cache = None
+
+
+def get_roster_cache():
+    """
+    Return the roster cache shared by the application, opening it on first use.
+    """
+    global _cache
+    if _cache is None:
+        _cache = RosterCache()
+    return _cache
+
+
+def close_roster_cache():
+    """
+    Close the shared roster cache if it was opened.
+    """
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
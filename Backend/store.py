@@ -0,0 +1,305 @@
+import asyncio
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+from Backend.messages import ChatMessage
+from Backend.log import get_logger
+
+log = get_logger("store")
+
+# Directory where the local data of the application is stored
+DATA_DIR = os.environ.get("XMPP_CHAT_DATA_DIR", os.path.join(os.path.expanduser("~"), ".xmpp_chat"))
+
+# Seconds a received message may wait before being written to disk
+FLUSH_INTERVAL = 0.5
+
+# Number of pending messages that triggers an immediate write
+FLUSH_BATCH_SIZE = 200
+
+# Number of messages loaded per history page
+PAGE_SIZE = 50
+
+# Number of results returned by a search
+SEARCH_LIMIT = 50
+
+# Words of a search, punctuation is ignored like the FTS5 tokenizer does
+SEARCH_TERMS = re.compile(r'\w+')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account TEXT NOT NULL,
+    peer TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    direction TEXT NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_peer ON messages (account, peer, timestamp, id);
+"""
+
+# Full-text index of the message bodies, kept up to date by triggers on every write
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    body, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, body) VALUES (new.id, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, body) VALUES ('delete', old.id, old.body);
+END;
+"""
+
+
+def search_query(text):
+    """
+    Turn the text typed by the user into an FTS5 query matching messages containing all
+    its words, the last one as a prefix since it may still be being typed.
+    Returns None when the text has no word.
+    """
+    terms = SEARCH_TERMS.findall(text)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"' for term in terms) + "*"
+
+
+class SearchResult(NamedTuple):
+    """
+    A message matching a search, with the matched words marked in its snippet.
+    """
+    message: ChatMessage
+    snippet: str
+
+
+class MessageStore:
+    """
+    The MessageStore class persists the chat history in a local SQLite database (WAL mode).
+    Messages are keyed by account and contact bare JID. Writes are buffered and done in
+    batches by a dedicated worker thread, so the stanza handlers never wait for the disk,
+    and the history is read back in pages, newest first. Reads run on the same thread and
+    return asyncio futures, so the event loop (and the GUI it pumps) never waits for them.
+    Message identifiers are assigned by SQLite when a batch is written, so other processes
+    or sessions writing to the same database file never collide with them. The messages
+    queued keep no identifier: a page read from one of them locates it on disk first,
+    which is always possible since every read writes the queued messages before it.
+    Write failures are logged with the number of messages lost.
+
+    The bodies are indexed in an FTS5 table maintained by triggers, so every batch written
+    updates the index in the same transaction and searches never scan the history. When
+    SQLite is built without FTS5, searches fall back to a scan of the history.
+
+    Attributes:
+        - path: Path of the SQLite database file
+        - pending: Rows waiting to be written
+        - full_text: Whether the full-text index is available
+
+    Methods:
+        - add: Queue a message for writing, its identifier is assigned once written
+        - flush: Write the queued messages
+        - load_page: Read a page of the history of a conversation
+        - search: Read the messages matching a search, best matches first
+        - close: Write the queued messages and close the database
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DATA_DIR, "history.db")
+        self.pending = []
+        self._flush_handle = None
+        self._connection = None
+        self.full_text = False
+
+        # A single worker thread owns the connection and serializes every access
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="message-store")
+        self._executor.submit(self._open).result()
+
+    def _open(self):
+        """
+        Open the database, enable the write-ahead log and create the schema.
+        """
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        self._open_search_index()
+
+    def _open_search_index(self):
+        """
+        Create the full-text index, indexing the history written before it existed.
+        """
+        indexed = self._connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'").fetchone()
+        try:
+            self._connection.executescript(SEARCH_SCHEMA)
+        except sqlite3.OperationalError as e:
+            log.warning("Full-text search unavailable, searches will scan the history: %s", e)
+            return
+        self.full_text = True
+        count = self._connection.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        if indexed is None and count:
+            with self._connection:
+                self._connection.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+            log.info("History indexed for search", extra={'messages': count})
+
+    def add(self, account, message):
+        """
+        Queue a ChatMessage of the given account for writing.
+        The queue is flushed when it is full or FLUSH_INTERVAL seconds later.
+        """
+        self.pending.append((account, message.peer, message.timestamp, message.direction, message.body))
+
+        if len(self.pending) >= FLUSH_BATCH_SIZE:
+            self.flush()
+        elif self._flush_handle is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                # No event loop to delay the write, do it now
+                self.flush()
+            else:
+                self._flush_handle = loop.call_later(FLUSH_INTERVAL, self.flush)
+
+    def flush(self):
+        """
+        Hand the queued messages to the worker thread and return the write future.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        rows, self.pending = self.pending, []
+        written = self._executor.submit(self._write, rows)
+        written.add_done_callback(lambda future: self._on_written(future, len(rows)))
+        return written
+
+    def _write(self, rows):
+        if not rows:
+            return
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO messages (account, peer, timestamp, direction, body) VALUES (?, ?, ?, ?, ?)", rows)
+
+    def _on_written(self, future, count):
+        """
+        Report a batch that could not be written, its messages are not in the history.
+        """
+        error = None if future.cancelled() else future.exception()
+        if error is not None:
+            log.error("Could not write the history: %s", error, extra={'messages': count, 'path': self.path})
+
+    def load_page(self, account, peer, before=None, after=None, limit=PAGE_SIZE):
+        """
+        Return a future of up to limit ChatMessages of a conversation, sorted from the oldest
+        to the newest. With before, the messages just older than that ChatMessage are read,
+        with after, the messages just newer than it, and without any the newest messages of
+        the conversation. The messages queued before the call are written first, so they are
+        part of the page.
+        """
+        self.flush()
+        return asyncio.wrap_future(self._executor.submit(self._read_page, account, peer, before, after, limit))
+
+    def _cursor(self, account, message):
+        """
+        Return the (timestamp, id) position of a message in the history. A message queued
+        without identifier is located by its content, the last copy when it was repeated.
+        """
+        if message.id is not None:
+            return message.cursor
+        row = self._connection.execute(
+            "SELECT MAX(id) FROM messages WHERE account = ? AND peer = ? AND timestamp = ?"
+            " AND direction = ? AND body = ?",
+            (account, message.peer, message.timestamp, message.direction, message.body)).fetchone()
+        # A message whose write failed is not in the history, its timestamp alone positions it
+        return (message.timestamp, row[0] if row[0] is not None else 0)
+
+    def _read_page(self, account, peer, before, after, limit):
+        query = "SELECT id, peer, body, timestamp, direction FROM messages WHERE account = ? AND peer = ?"
+        params = [account, peer]
+        if after is not None:
+            query += " AND (timestamp, id) > (?, ?) ORDER BY timestamp ASC, id ASC LIMIT ?"
+            params.extend(self._cursor(account, after))
+        else:
+            if before is not None:
+                query += " AND (timestamp, id) < (?, ?)"
+                params.extend(self._cursor(account, before))
+            query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        params.append(limit)
+
+        rows = self._connection.execute(query, params).fetchall()
+        if after is None:
+            rows.reverse()
+        return [ChatMessage(peer, body, timestamp, direction, row_id)
+                for row_id, peer, body, timestamp, direction in rows]
+
+    def search(self, account, text, peer=None, limit=SEARCH_LIMIT):
+        """
+        Return a future of up to limit SearchResults of the messages of an account containing
+        all the words of text (the last one as a prefix), optionally only with one contact.
+        Results are ranked by relevance (BM25), the newest first among equal matches.
+        """
+        query = search_query(text)
+        if query is None:
+            results = asyncio.get_running_loop().create_future()
+            results.set_result([])
+            return results
+        self.flush()
+        return asyncio.wrap_future(self._executor.submit(self._search, account, text, query, peer, limit))
+
+    def _search(self, account, text, query, peer, limit):
+        if self.full_text:
+            sql = ("SELECT m.id, m.peer, m.body, m.timestamp, m.direction,"
+                   " snippet(messages_fts, 0, '[', ']', '...', 12)"
+                   " FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid"
+                   " WHERE messages_fts MATCH ? AND m.account = ?")
+            params = [query, account]
+            order = " ORDER BY rank, m.timestamp DESC LIMIT ?"
+        else:
+            # Without the index, every word has to appear in the body
+            terms = SEARCH_TERMS.findall(text)
+            sql = ("SELECT id, peer, body, timestamp, direction, body FROM messages m WHERE m.account = ?"
+                   + " AND m.body LIKE ?" * len(terms))
+            params = [account] + [f"%{term}%" for term in terms]
+            order = " ORDER BY m.timestamp DESC LIMIT ?"
+        if peer is not None:
+            sql += " AND m.peer = ?"
+            params.append(peer)
+        params.append(limit)
+
+        rows = self._connection.execute(sql + order, params).fetchall()
+        return [SearchResult(ChatMessage(peer, body, timestamp, direction, row_id), snippet)
+                for row_id, peer, body, timestamp, direction, snippet in rows]
+
+    def close(self):
+        """
+        Write the queued messages and close the database.
+        """
+        self.flush()
+        self._executor.submit(self._connection.close).result()
+        self._executor.shutdown()
+
+
+# Message store shared by the application
+_store = None
+
+
+def get_message_store():
+    """
+    Return the message store shared by the application, opening it on first use.
+    """
+    global _store
+    if _store is None:
+        _store = MessageStore()
+    return _store
+
+
+def close_message_store():
+    """
+    Close the shared message store if it was opened.
+    """
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
@@ -0,0 +1,333 @@
+"""
+Load generation harness.
+
+Simulates many users of the backend client (no GUI) to find how far one client process
+scales. Every simulated user registers an account with XEP-0077, logs in, subscribes to
+a few other users, and then sends chat messages and presence changes at the configured
+rates for the duration of the run. The users can share a single asyncio event loop or
+be spread over a pool of processes, each with its own loop.
+
+Unless an external server is given, the local XMPP server stand-in runs in a process of
+its own, so the figures only measure the clients. Reported per run:
+    - connection rate: sessions registered and established per second
+    - stanza rate: stanzas sent and received per second during the steady phase
+    - memory per session: growth of the resident memory divided by the sessions
+    - CPU: processor time of the client processes, per phase and as a share of a core
+
+Usage:
+    python -m Benchmarks.load --users 1000 --contacts 5 --message-rate 0.2 --duration 30
+    python -m Benchmarks.load --users 4000 --processes 4 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import resource
+import time
+from Backend.manager import ConnectionManager
+from Benchmarks.server import LocalXMPPServer
+from Backend.log import configure_logging, shutdown_logging
+
+PASSWORD = "load"
+
+# Sessions negotiating their stream at the same time, per process
+DEFAULT_CONNECT_CONCURRENCY = 100
+
+
+def raise_file_limit():
+    """
+    Allow as many open sockets as the hard limit permits.
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def resident_memory():
+    """
+    Return the resident memory of the process in bytes.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak instead of current memory, in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Phase:
+    """
+    Measures the wall clock and processor time of a phase of the run.
+    """
+
+    def __init__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+
+    def result(self):
+        return {'seconds': time.perf_counter() - self.wall, 'cpu_seconds': time.process_time() - self.cpu}
+
+
+class SimulatedUser:
+    """
+    The SimulatedUser class drives one XMPP_Client session of the load run.
+
+    Attributes:
+        - client: The XMPP_Client of the user
+        - contacts: The bare JIDs the user subscribes to and chats with
+        - stanzas_in: Number of stanzas received by the session
+        - stanzas_out: Number of stanzas sent by the session
+
+    Methods:
+        - subscribe: Send a subscription request to every contact
+        - chat: Send chat messages at a random rate until stopped
+        - change_presence: Alternate the presence at a random rate until stopped
+    """
+
+    def __init__(self, client, contacts):
+        self.client = client
+        self.contacts = contacts
+        self.stanzas_in = 0
+        self.stanzas_out = 0
+        client.add_filter('in', self.count_in)
+        client.add_filter('out', self.count_out)
+
+    def count_in(self, stanza):
+        self.stanzas_in += 1
+        return stanza
+
+    def count_out(self, stanza):
+        self.stanzas_out += 1
+        return stanza
+
+    def subscribe(self):
+        for contact in self.contacts:
+            self.client.send_presence_subscription(contact)
+
+    async def chat(self, rate, stop):
+        if rate <= 0 or not self.contacts:
+            return
+        while not stop.is_set():
+            # Exponential delays give a Poisson stream of messages
+            await asyncio.sleep(random.expovariate(rate))
+            self.client.send_chat_message(random.choice(self.contacts), "Load test message")
+
+    async def change_presence(self, rate, stop):
+        if rate <= 0:
+            return
+        shows = ("Away", "Available")
+        count = 0
+        while not stop.is_set():
+            await asyncio.sleep(random.expovariate(rate))
+            count += 1
+            self.client.update_presence(shows[count % 2], "Load test")
+
+
+async def run_worker(worker, users, options, address, barrier):
+    """
+    Run the simulated users of one process and return their measurements.
+    The phases of all the processes are kept in step with the barrier.
+    """
+    loop = asyncio.get_running_loop()
+    domain = options['domain']
+    jids = [f"load{i}@{domain}" for i in users]
+    manager = ConnectionManager(max_concurrent_connects=options['connect_concurrency'])
+    rss_before = resident_memory()
+
+    # Register and log in every user
+    phase = Phase()
+    simulated = []
+    for i, jid in zip(users, jids):
+        contacts = [f"load{(i + k) % options['users']}@{domain}" for k in range(1, options['contacts'] + 1)]
+        client = manager.create_session(jid, PASSWORD, register=True)
+        simulated.append(SimulatedUser(client, contacts))
+    opened = await manager.open_sessions([user.client for user in simulated], timeout=options['timeout'],
+                                         address=address)
+    connect = phase.result()
+    connect['connected'] = sum(opened.values())
+    connect['failed'] = len(opened) - connect['connected']
+    rss_connected = resident_memory()
+    await loop.run_in_executor(None, barrier.wait)
+
+    # Subscribe to the contacts, every account exists by now
+    phase = Phase()
+    for user in simulated:
+        user.subscribe()
+    await asyncio.sleep(options['settle'])
+    subscribe = phase.result()
+    await loop.run_in_executor(None, barrier.wait)
+
+    # Steady phase: messages and presence changes at the configured rates
+    stop = asyncio.Event()
+    counted_in = sum(user.stanzas_in for user in simulated)
+    counted_out = sum(user.stanzas_out for user in simulated)
+    phase = Phase()
+    tasks = [asyncio.ensure_future(task) for user in simulated for task in (
+        user.chat(options['message_rate'], stop), user.change_presence(options['presence_rate'], stop))]
+    await asyncio.sleep(options['duration'])
+    stop.set()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    steady = phase.result()
+    steady['stanzas_in'] = sum(user.stanzas_in for user in simulated) - counted_in
+    steady['stanzas_out'] = sum(user.stanzas_out for user in simulated) - counted_out
+    steady['messages_received'] = sum(1 for user in simulated
+                                      for conversation in user.client.conversations.conversations.values()
+                                      for message in conversation.history if message.direction == 'in')
+    rss_after = resident_memory()
+
+    await loop.run_in_executor(None, barrier.wait)
+    manager.close_all()
+    await asyncio.sleep(1)
+    return {
+        'worker': worker,
+        'users': len(jids),
+        'connect': connect,
+        'subscribe': subscribe,
+        'steady': steady,
+        'rss_before': rss_before,
+        'rss_connected': rss_connected,
+        'rss_after': rss_after,
+    }
+
+
+def worker_main(worker, users, options, address, barrier, results):
+    """
+    Entry point of a worker process.
+    """
+    raise_file_limit()
+    if options['verbose']:
+        configure_logging("DEBUG")
+    try:
+        result = asyncio.run(run_worker(worker, users, options, address, barrier))
+    finally:
+        shutdown_logging()
+    results.put(result)
+
+
+def server_main(domain, scram_iterations, ready, stop, results):
+    """
+    Entry point of the local server process: reports its address, serves until stopped
+    and reports its counters.
+    """
+    raise_file_limit()
+
+    async def serve():
+        server = LocalXMPPServer(domain, scram_iterations=scram_iterations)
+        ready.put(await server.start())
+        await asyncio.get_running_loop().run_in_executor(None, stop.wait)
+        results.put(dict(server.stats))
+        await server.stop()
+
+    asyncio.run(serve())
+
+
+def aggregate(workers, options):
+    """
+    Combine the measurements of the worker processes into the report of the run.
+    """
+    users = sum(worker['users'] for worker in workers)
+    connected = sum(worker['connect']['connected'] for worker in workers)
+    connect_seconds = max(worker['connect']['seconds'] for worker in workers)
+    steady_seconds = max(worker['steady']['seconds'] for worker in workers)
+    stanzas = sum(worker['steady']['stanzas_in'] + worker['steady']['stanzas_out'] for worker in workers)
+    memory = sum(worker['rss_connected'] - worker['rss_before'] for worker in workers)
+    cpu = {phase: sum(worker[phase]['cpu_seconds'] for worker in workers)
+           for phase in ('connect', 'subscribe', 'steady')}
+    return {
+        'users': users,
+        'processes': len(workers),
+        'connected': connected,
+        'failed': users - connected,
+        'connection_rate_per_sec': connected / connect_seconds if connect_seconds else 0.0,
+        'stanza_rate_per_sec': stanzas / steady_seconds if steady_seconds else 0.0,
+        'stanzas_in': sum(worker['steady']['stanzas_in'] for worker in workers),
+        'stanzas_out': sum(worker['steady']['stanzas_out'] for worker in workers),
+        'messages_received': sum(worker['steady']['messages_received'] for worker in workers),
+        'memory_per_session_kb': memory / max(connected, 1) / 1024,
+        'cpu_seconds': cpu,
+        'cpu_share_of_core': {
+            'connect': cpu['connect'] / connect_seconds if connect_seconds else 0.0,
+            'steady': cpu['steady'] / steady_seconds if steady_seconds else 0.0,
+        },
+    }
+
+
+def run(options):
+    """
+    Start the server (unless external) and the worker processes, and return the report.
+    """
+    context = multiprocessing.get_context("spawn")
+    server_process = None
+    if options['server']:
+        host, _, port = options['server'].rpartition(':')
+        address = (host, int(port))
+    else:
+        ready, server_stop, server_results = context.Queue(), context.Event(), context.Queue()
+        server_process = context.Process(target=server_main,
+                                         args=(options['domain'], options['scram_iterations'], ready,
+                                               server_stop, server_results))
+        server_process.start()
+        address = ready.get(timeout=30)
+
+    # Spread the users over the processes
+    processes = max(1, min(options['processes'], options['users']))
+    barrier = context.Barrier(processes)
+    results = context.Queue()
+    workers = []
+    for worker in range(processes):
+        users = range(worker, options['users'], processes)
+        process = context.Process(target=worker_main, args=(worker, users, options, address, barrier, results))
+        process.start()
+        workers.append(process)
+    measurements = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+
+    report = {'parameters': options, 'results': aggregate(measurements, options), 'workers': measurements}
+    if server_process is not None:
+        server_stop.set()
+        report['server'] = server_results.get(timeout=30)
+        server_process.join()
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Simulate many concurrent users of the XMPP client")
+    parser.add_argument("--users", type=int, default=100, help="Number of simulated users")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes sharing the users")
+    parser.add_argument("--contacts", type=int, default=5, help="Contacts each user subscribes to")
+    parser.add_argument("--message-rate", type=float, default=0.5, help="Messages sent per user per second")
+    parser.add_argument("--presence-rate", type=float, default=0.05, help="Presence changes per user per second")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of the steady phase")
+    parser.add_argument("--settle", type=float, default=2, help="Seconds left for the subscriptions to complete")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds allowed to establish a session")
+    parser.add_argument("--connect-concurrency", type=int, default=DEFAULT_CONNECT_CONCURRENCY,
+                        help="Sessions negotiating at the same time, per process")
+    parser.add_argument("--server", help="host:port of an external server instead of the local stand-in")
+    parser.add_argument("--domain", default="localhost", help="Domain of the simulated accounts")
+    parser.add_argument("--scram-iterations", type=int, default=4096,
+                        help="PBKDF2 iterations of the local server, the main cost of a login")
+    parser.add_argument("--output", help="File the JSON report is written to")
+    parser.add_argument("--verbose", action="store_true", help="Log the events of the client sessions")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    options = vars(args)
+    print(f"INFO: Simulating {args.users} users in {args.processes} process(es) for {args.duration}s")
+    report = run(options)
+    for name, value in report['results'].items():
+        print(f"RESULT: {name} = {value}")
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f"INFO: Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Message flood benchmark.
+
+Measures how fast a burst of inbound chat messages goes through the message pipeline:
+the XMPP_Client stanza handler, the per-conversation queue, and the rendering into a
+Tk Text widget, comparing one insert per message with one insert per tick.
+
+Usage:
+    python -m Benchmarks.message_flood --messages 10000
+"""
+import argparse
+import time
+from Backend.client import XMPP_Client
+from Backend.messages import ChatMessage
+
+def make_stanzas(client, count, peer):
+    """
+    Build the inbound chat message stanzas of the flood.
+    """
+    stanzas = []
+    for i in range(count):
+        msg = client.Message()
+        msg['type'] = 'chat'
+        msg['from'] = f"{peer}/bench"
+        msg['to'] = client.boundjid.bare
+        msg['body'] = f"Flood message number {i}"
+        stanzas.append(msg)
+    return stanzas
+
+def bench_pipeline(count, batch):
+    """
+    Time the stanza handler and the batched draining of the conversation queue.
+    """
+    client = XMPP_Client("bench@localhost", "bench")
+    peer = "flood@localhost"
+    stanzas = make_stanzas(client, count, peer)
+
+    start = time.perf_counter()
+    for msg in stanzas:
+        client.message(msg)
+    handled = time.perf_counter() - start
+
+    # Messages beyond the pending limit of a conversation are dropped from the queue
+    start = time.perf_counter()
+    frames = 0
+    rendered = 0
+    while True:
+        messages = client.conversations.drain(peer, batch)
+        if not messages:
+            break
+        "".join(message.format() for message in messages)
+        frames += 1
+        rendered += len(messages)
+    drained = time.perf_counter() - start
+
+    return {
+        'handler_msgs_per_sec': count / handled,
+        'drain_msgs_per_sec': rendered / drained,
+        'frames': frames,
+    }
+
+def bench_rendering(count, batch):
+    """
+    Compare one Text insert per message with one insert per batch.
+    Returns None when no display is available.
+    """
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:
+        print(f"INFO: Rendering benchmark skipped, Tk is not available: {e}")
+        return None
+
+    lines = [ChatMessage("flood@localhost", f"Flood message number {i}", time.time(), 'in').format()
+             for i in range(count)]
+    results = {}
+    for name, size in (('per_message', 1), ('batched', batch)):
+        text = tk.Text(root)
+        start = time.perf_counter()
+        for i in range(0, count, size):
+            text.insert(tk.END, "".join(lines[i:i + size]))
+            text.see(tk.END)
+        root.update()
+        results[f'{name}_msgs_per_sec'] = count / (time.perf_counter() - start)
+        text.destroy()
+    root.destroy()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Inbound message flood benchmark")
+    parser.add_argument("--messages", type=int, default=10000, help="Number of messages in the flood")
+    parser.add_argument("--batch", type=int, default=500, help="Messages rendered per tick")
+    args = parser.parse_args()
+
+    print(f"INFO: Flooding {args.messages} messages, {args.batch} rendered per tick")
+    for name, value in bench_pipeline(args.messages, args.batch).items():
+        print(f"RESULT: pipeline {name} = {value:,.0f}")
+
+    rendering = bench_rendering(args.messages, args.batch)
+    for name, value in (rendering or {}).items():
+        print(f"RESULT: rendering {name} = {value:,.0f}")
+
+if __name__ == "__main__":
+    main()
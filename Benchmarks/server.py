@@ -0,0 +1,1309 @@
+"""
+Local XMPP server stand-in.
+
+A small in-process XMPP server for tests and benchmarks, so XMPP_Client can be driven
+offline instead of against alumchat.lol. It implements the parts of the protocol the
+application uses: SASL SCRAM-SHA-1 and PLAIN authentication, XEP-0077 in-band registration
+and account removal, resource binding, the roster with XEP-0237 versioning and roster
+pushes, presence subscriptions and broadcast, message routing with offline storage,
+XEP-0199 pings, XEP-0198 stream management with resumption and a XEP-0045 multi-user chat
+service on conference.<domain> (join, instant rooms, history, groupchat messages and
+leave; no moderation or room configuration). There is no TLS, no server
+to server traffic and no persistence: the accounts only live as long as the server object.
+Slixmpp never sends PLAIN credentials over an unencrypted stream, so the clients use SCRAM.
+
+Usage:
+    python -m Benchmarks.server --port 5222 --account alice:secret --account bob:secret
+
+In a benchmark, start it on the running event loop and connect the clients to its address:
+    server = LocalXMPPServer()
+    host, port = await server.start()
+    manager.connect(client, address=(host, port))
+"""
+import argparse
+import asyncio
+import base64
+import calendar
+import hashlib
+import hmac
+import itertools
+import os
+import time
+import xml.etree.ElementTree as ET
+from collections import Counter, deque
+from slixmpp.xmlstream.tostring import tostring
+
+CLIENT_NS = 'jabber:client'
+STREAM_NS = 'http://etherx.jabber.org/streams'
+SASL_NS = 'urn:ietf:params:xml:ns:xmpp-sasl'
+BIND_NS = 'urn:ietf:params:xml:ns:xmpp-bind'
+SESSION_NS = 'urn:ietf:params:xml:ns:xmpp-session'
+STANZAS_NS = 'urn:ietf:params:xml:ns:xmpp-stanzas'
+ROSTER_NS = 'jabber:iq:roster'
+REGISTER_NS = 'jabber:iq:register'
+PING_NS = 'urn:xmpp:ping'
+DELAY_NS = 'urn:xmpp:delay'
+SM_NS = 'urn:xmpp:sm:3'
+MUC_NS = 'http://jabber.org/protocol/muc'
+MUC_USER_NS = 'http://jabber.org/protocol/muc#user'
+MUC_OWNER_NS = 'http://jabber.org/protocol/muc#owner'
+
+IQ = f'{{{CLIENT_NS}}}iq'
+MESSAGE = f'{{{CLIENT_NS}}}message'
+PRESENCE = f'{{{CLIENT_NS}}}presence'
+STANZA_TAGS = (IQ, MESSAGE, PRESENCE)
+
+# Seconds a stream management session is kept after its connection dropped
+DEFAULT_RESUME_TIMEOUT = 60
+
+# Number of stanzas sent to a client before the server requests an ack
+ACK_WINDOW = 10
+
+# PBKDF2 iterations of the SCRAM salted passwords
+DEFAULT_SCRAM_ITERATIONS = 4096
+
+# Stream management sequence numbers wrap at 2^32
+MAX_SEQ = 2 ** 32
+
+# Number of messages kept in the history of a room
+MUC_HISTORY_SIZE = 200
+
+STREAM_HEADER = ("<?xml version='1.0'?><stream:stream xmlns='jabber:client' "
+                 "xmlns:stream='http://etherx.jabber.org/streams' id='{id}' from='{domain}' version='1.0'>")
+STREAM_FOOTER = "</stream:stream>"
+
+FEATURES_BEFORE_AUTH = ("<stream:features>"
+                        "<mechanisms xmlns='urn:ietf:params:xml:ns:xmpp-sasl'>"
+                        "<mechanism>SCRAM-SHA-1</mechanism><mechanism>PLAIN</mechanism></mechanisms>"
+                        "<register xmlns='http://jabber.org/features/iq-register'/>"
+                        "</stream:features>")
+FEATURES_AFTER_AUTH = ("<stream:features>"
+                       "<bind xmlns='urn:ietf:params:xml:ns:xmpp-bind'/>"
+                       "<ver xmlns='urn:xmpp:features:rosterver'/>"
+                       "<sm xmlns='urn:xmpp:sm:3'/>"
+                       "</stream:features>")
+
+
+def split_jid(jid):
+    """
+    Return the (bare JID, resource) pair of a JID, the bare JID in lower case.
+    """
+    bare, _, resource = (jid or '').partition('/')
+    return bare.lower(), resource
+
+
+def make_element(tag, attrib=None, text=None, children=()):
+    """
+    Build an element, dropping the attributes set to None.
+    """
+    element = ET.Element(tag, {key: str(value) for key, value in (attrib or {}).items() if value is not None})
+    element.text = text
+    element.extend(children)
+    return element
+
+
+class RosterItem:
+    """
+    A contact in the roster of an account, with the state of the subscriptions in both directions.
+
+    Attributes:
+        - name: The name given to the contact
+        - groups: The groups of the contact
+        - to: Whether the account receives the presence of the contact
+        - from_: Whether the contact receives the presence of the account
+        - ask: Whether a subscription request to the contact is pending
+    """
+
+    __slots__ = ('name', 'groups', 'to', 'from_', 'ask')
+
+    def __init__(self, name='', groups=()):
+        self.name = name
+        self.groups = list(groups)
+        self.to = False
+        self.from_ = False
+        self.ask = False
+
+    @property
+    def subscription(self):
+        if self.to and self.from_:
+            return 'both'
+        if self.to:
+            return 'to'
+        if self.from_:
+            return 'from'
+        return 'none'
+
+    def to_element(self, jid, subscription=None):
+        item = make_element(f'{{{ROSTER_NS}}}item', {
+            'jid': jid,
+            'name': self.name or None,
+            'subscription': subscription or self.subscription,
+            'ask': 'subscribe' if self.ask and subscription is None else None,
+        })
+        for group in self.groups:
+            ET.SubElement(item, f'{{{ROSTER_NS}}}group').text = group
+        return item
+
+
+class Account:
+    """
+    A registered account of the local server.
+
+    Attributes:
+        - jid: The bare JID of the account
+        - password: The password of the account
+        - roster: The contacts of the account, keyed by bare JID
+        - roster_version: Version of the roster, increased on every change
+        - offline: Messages received while no resource was available
+        - pending_in: Subscription requests received while no resource was available, keyed by bare JID
+
+    Methods:
+        - scram_keys: Return the SCRAM salt and keys of the password
+    """
+
+    def __init__(self, jid, password):
+        self.jid = jid
+        self.password = password
+        self.roster = {}
+        self.roster_version = 1
+        self.offline = []
+        self.pending_in = {}
+        self._scram = None
+
+    def scram_keys(self, iterations):
+        """
+        Return the (salt, stored key, server key) of the password, derived once per password.
+        """
+        if self._scram is None or self._scram[0] != (self.password, iterations):
+            salt = os.urandom(16)
+            salted = hashlib.pbkdf2_hmac('sha1', self.password.encode(), salt, iterations)
+            client_key = hmac.digest(salted, b"Client Key", 'sha1')
+            server_key = hmac.digest(salted, b"Server Key", 'sha1')
+            self._scram = ((self.password, iterations), salt, hashlib.sha1(client_key).digest(), server_key)
+        return self._scram[1:]
+
+
+class MucOccupant:
+    """
+    An occupant of a room. Occupants added with add_room have no session and receive nothing.
+
+    Attributes:
+        - nick: The nickname of the occupant in the room
+        - session: The Session of the occupant, None for simulated occupants
+        - jid: The full JID of the occupant
+        - affiliation: owner, admin, member or none
+        - role: moderator, participant or visitor
+        - presence: The presence of the occupant, without addresses
+    """
+
+    __slots__ = ('nick', 'session', 'jid', 'affiliation', 'role', 'presence')
+
+    def __init__(self, nick, session, jid, affiliation='none', role='participant', presence=None):
+        self.nick = nick
+        self.session = session
+        self.jid = jid
+        self.affiliation = affiliation
+        self.role = role
+        self.presence = presence if presence is not None else make_element(PRESENCE)
+
+
+class MucRoom:
+    """
+    A room of the multi-user chat service.
+
+    Attributes:
+        - jid: The bare JID of the room
+        - occupants: The occupants of the room, keyed by nick
+        - history: The last groupchat messages, as (reception time, message)
+        - subject: The subject of the room
+    """
+
+    def __init__(self, jid):
+        self.jid = jid
+        self.occupants = {}
+        self.history = deque(maxlen=MUC_HISTORY_SIZE)
+        self.subject = ''
+
+    def find(self, jid):
+        """
+        Return the occupant of a full JID, or None.
+        """
+        for occupant in self.occupants.values():
+            if occupant.jid == jid:
+                return occupant
+        return None
+
+
+class Session:
+    """
+    A bound resource of an account. With stream management, the session outlives its
+    connection for the resume timeout, and the stanzas sent to it are kept until acked.
+
+    Attributes:
+        - jid: The full JID of the session
+        - bare: The bare JID of the account
+        - connection: The ClientConnection carrying the session, None while detached
+        - available: Whether the resource sent an available presence
+        - presence: The last broadcast presence of the resource
+        - priority: The priority of the resource
+        - sm_id: The stream management identifier, if the session can be resumed
+        - sm_enabled: Whether stream management is enabled
+        - inbound: Number of stanzas received from the client (the XEP-0198 h value)
+        - outbound: Number of stanzas sent to the client
+        - unacked: Stanzas sent to the client and not acked yet, as (sequence, element, data)
+
+    Methods:
+        - send: Send a stanza to the client
+        - ack: Forget the stanzas acked by the client
+        - resend: Send the unacked stanzas again, after a resumption
+    """
+
+    def __init__(self, jid, connection):
+        self.jid = jid
+        self.bare, self.resource = split_jid(jid)
+        self.connection = connection
+        self.available = False
+        self.presence = None
+        self.priority = 0
+        self.sm_id = None
+        self.sm_enabled = False
+        self.inbound = 0
+        self.outbound = 0
+        self.unacked = deque()
+        self.expiry = None
+
+    def send(self, element):
+        """
+        Send a stanza to the client, keeping it until acked when stream management is enabled.
+        """
+        data = tostring(element, xmlns=CLIENT_NS)
+        if self.sm_enabled:
+            self.outbound = (self.outbound + 1) % MAX_SEQ
+            self.unacked.append((self.outbound, element, data))
+            if self.connection is not None:
+                self.connection.write(data)
+                if self.outbound % ACK_WINDOW == 0:
+                    self.connection.write(f"<r xmlns='{SM_NS}'/>")
+        elif self.connection is not None:
+            self.connection.write(data)
+
+    def ack(self, handled):
+        """
+        Forget the stanzas the client reports as handled.
+        """
+        while self.unacked and (handled - self.unacked[0][0]) % MAX_SEQ < MAX_SEQ // 2:
+            self.unacked.popleft()
+
+    def resend(self):
+        for _, _, data in self.unacked:
+            self.connection.write(data)
+
+
+class ClientConnection(asyncio.Protocol):
+    """
+    The server side of a client connection: parses the XML stream and drives the
+    negotiation (authentication, binding, stream management) before handing the
+    stanzas of the bound session to the server.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.parser = None
+        self.stream_root = None
+        self.depth = 0
+        self.user = None
+        self.session = None
+        self.closing = False
+        self.scram = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.connections.add(self)
+        self.server.stats['connections'] += 1
+        self.reset_parser()
+
+    def reset_parser(self):
+        """
+        Start parsing a new stream, after the connection or an authentication.
+        """
+        self.parser = ET.XMLPullParser(events=('start', 'end'))
+        self.stream_root = None
+        self.depth = 0
+
+    def write(self, data):
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.write(data.encode())
+
+    def data_received(self, data):
+        try:
+            self.parser.feed(data)
+            events = list(self.parser.read_events())
+        except ET.ParseError:
+            self.stream_error('not-well-formed')
+            return
+
+        parser = self.parser
+        for event, element in events:
+            if parser is not self.parser:
+                # The stream was restarted by the previous element
+                break
+            if event == 'start':
+                self.depth += 1
+                if self.depth == 1:
+                    self.stream_root = element
+                    self.stream_opened()
+            else:
+                self.depth -= 1
+                if self.depth == 1:
+                    root = self.stream_root
+                    self.handle(element)
+                    root.remove(element)
+                elif self.depth == 0:
+                    self.close()
+
+    def stream_opened(self):
+        self.write(STREAM_HEADER.format(id=next(self._ids), domain=self.server.domain))
+        self.write(FEATURES_AFTER_AUTH if self.user else FEATURES_BEFORE_AUTH)
+
+    def handle(self, element):
+        """
+        Dispatch a top level element of the stream.
+        """
+        tag = element.tag
+        if tag in STANZA_TAGS:
+            self.server.stats['stanzas_in'] += 1
+            if self.session is not None:
+                if self.session.sm_enabled:
+                    self.session.inbound = (self.session.inbound + 1) % MAX_SEQ
+                self.server.handle_stanza(self.session, element)
+            elif tag == IQ:
+                self.handle_negotiation_iq(element)
+        elif tag == f'{{{SASL_NS}}}auth':
+            self.authenticate(element)
+        elif tag == f'{{{SASL_NS}}}response':
+            self.scram_final(element)
+        elif tag.startswith(f'{{{SM_NS}}}'):
+            self.handle_stream_management(element)
+
+    def authenticate(self, element):
+        """
+        Check SASL PLAIN credentials, or start a SCRAM-SHA-1 exchange.
+        """
+        mechanism = element.get('mechanism')
+        if self.user is not None or mechanism not in ('PLAIN', 'SCRAM-SHA-1'):
+            self.sasl_failure('invalid-mechanism')
+            return
+        try:
+            message = base64.b64decode(element.text or '').decode()
+            if mechanism == 'PLAIN':
+                _, username, password = message.split('\0')
+            else:
+                gs2_flag, _, client_first_bare = message.split(',', 2)
+                fields = dict(field.split('=', 1) for field in client_first_bare.split(','))
+                username = fields['n']
+        except (ValueError, KeyError):
+            self.sasl_failure('malformed-request')
+            return
+
+        account = self.server.accounts.get(f"{username}@{self.server.domain}".lower())
+        if mechanism == 'PLAIN':
+            if account is None or account.password != password:
+                self.sasl_failure('not-authorized')
+            else:
+                self.sasl_success(account, '')
+            return
+
+        # SCRAM-SHA-1 (RFC 5802): send the salt and the combined nonce
+        if account is None:
+            self.sasl_failure('not-authorized')
+            return
+        salt, stored_key, server_key = account.scram_keys(self.server.scram_iterations)
+        nonce = fields['r'] + base64.b64encode(os.urandom(18)).decode()
+        server_first = f"r={nonce},s={base64.b64encode(salt).decode()},i={self.server.scram_iterations}"
+        self.scram = (account, f"{client_first_bare},{server_first}", nonce, stored_key, server_key)
+        self.write(f"<challenge xmlns='{SASL_NS}'>{base64.b64encode(server_first.encode()).decode()}</challenge>")
+
+    def scram_final(self, element):
+        """
+        Check the SCRAM client proof and answer with the server signature.
+        """
+        if self.scram is None:
+            self.sasl_failure('malformed-request')
+            return
+        account, auth_prefix, nonce, stored_key, server_key = self.scram
+        self.scram = None
+        try:
+            client_final = base64.b64decode(element.text or '').decode()
+            without_proof, _, proof = client_final.rpartition(',p=')
+            fields = dict(field.split('=', 1) for field in without_proof.split(','))
+            proof = base64.b64decode(proof)
+        except ValueError:
+            self.sasl_failure('malformed-request')
+            return
+
+        auth_message = f"{auth_prefix},{without_proof}".encode()
+        signature = hmac.digest(stored_key, auth_message, 'sha1')
+        client_key = bytes(a ^ b for a, b in zip(proof, signature))
+        if fields.get('r') != nonce or not hmac.compare_digest(hashlib.sha1(client_key).digest(), stored_key):
+            self.sasl_failure('not-authorized')
+            return
+        verifier = base64.b64encode(b"v=" + base64.b64encode(hmac.digest(server_key, auth_message, 'sha1')))
+        self.sasl_success(account, verifier.decode())
+
+    def sasl_success(self, account, data):
+        """
+        Authenticate the connection as an account and wait for the stream restart.
+        """
+        self.server.stats['auth_successes'] += 1
+        self.user = account.jid
+        self.write(f"<success xmlns='{SASL_NS}'>{data}</success>")
+        self.reset_parser()
+
+    def sasl_failure(self, condition):
+        self.server.stats['auth_failures'] += 1
+        self.write(f"<failure xmlns='{SASL_NS}'><{condition}/></failure>")
+
+    def handle_negotiation_iq(self, iq):
+        """
+        Handle the iq stanzas sent before a resource is bound: registration and binding.
+        """
+        query = iq.find(f'{{{REGISTER_NS}}}query')
+        bind = iq.find(f'{{{BIND_NS}}}bind')
+        if query is not None and self.user is None:
+            self.send(self.server.handle_registration(iq, query))
+        elif bind is not None and self.user is not None and iq.get('type') == 'set':
+            resource = bind.findtext(f'{{{BIND_NS}}}resource') or f"local{next(self._ids)}"
+            self.session = self.server.bind(self, f"{self.user}/{resource}")
+            reply = self.server.make_reply(iq)
+            reply.append(make_element(f'{{{BIND_NS}}}bind', children=[
+                make_element(f'{{{BIND_NS}}}jid', text=self.session.jid)]))
+            self.send(reply)
+        elif iq.get('type') in ('get', 'set'):
+            self.send(self.server.make_error(iq, 'auth', 'not-authorized'))
+
+    def handle_stream_management(self, element):
+        """
+        Handle the XEP-0198 elements: enable, resume, acks and ack requests.
+        """
+        name = element.tag.split('}')[1]
+        session = self.session
+        if name == 'enable' and session is not None and not session.sm_enabled:
+            session.sm_enabled = True
+            if element.get('resume') in ('true', '1'):
+                session.sm_id = self.server.register_resumable(session)
+                self.write(f"<enabled xmlns='{SM_NS}' id='{session.sm_id}' resume='true' "
+                           f"max='{self.server.resume_timeout}'/>")
+            else:
+                self.write(f"<enabled xmlns='{SM_NS}'/>")
+        elif name == 'r' and session is not None and session.sm_enabled:
+            self.write(f"<a xmlns='{SM_NS}' h='{session.inbound}'/>")
+        elif name == 'a' and session is not None and session.sm_enabled:
+            session.ack(int(element.get('h', 0)))
+        elif name == 'resume' and self.user is not None and session is None:
+            session = self.server.resume(self, element.get('previd'))
+            if session is None:
+                self.write(f"<failed xmlns='{SM_NS}'><item-not-found xmlns='{STANZAS_NS}'/></failed>")
+                return
+            self.session = session
+            self.write(f"<resumed xmlns='{SM_NS}' previd='{session.sm_id}' h='{session.inbound}'/>")
+            session.ack(int(element.get('h', 0)))
+            session.resend()
+
+    def send(self, element):
+        """
+        Send a stanza outside of a bound session.
+        """
+        if self.session is not None:
+            self.session.send(element)
+        else:
+            self.write(tostring(element, xmlns=CLIENT_NS))
+        self.server.stats['stanzas_out'] += 1
+
+    def stream_error(self, condition):
+        self.write(f"<stream:error><{condition} xmlns='urn:ietf:params:xml:ns:xmpp-streams'/></stream:error>")
+        self.close()
+
+    def close(self):
+        """
+        Close the stream cleanly: the session ends and can not be resumed.
+        """
+        if self.closing:
+            return
+        self.closing = True
+        self.write(STREAM_FOOTER)
+        if self.transport is not None:
+            self.transport.close()
+
+    def connection_lost(self, exc):
+        self.server.connections.discard(self)
+        self.transport = None
+        session, self.session = self.session, None
+        if session is None or session.connection is not self:
+            return
+        if session.sm_id is not None and not self.closing:
+            self.server.detach(session)
+        else:
+            self.server.end_session(session)
+
+
+class LocalXMPPServer:
+    """
+    The LocalXMPPServer class is an in-process XMPP server for tests and benchmarks.
+    It runs on the asyncio event loop of its caller, so clients, server and measurements
+    share a single loop and no network access is needed.
+
+    Attributes:
+        - domain: The domain served, the clients connect as user@domain
+        - resume_timeout: Seconds a stream management session is kept after a disconnection
+        - scram_iterations: PBKDF2 iterations of the SCRAM salted passwords
+        - accounts: The registered accounts, keyed by bare JID
+        - sessions: The bound sessions, keyed by bare JID and resource
+        - connections: The open client connections
+        - stats: Counters of connections, authentications, stanzas and messages
+
+    Methods:
+        - start: Start listening and return the (host, port) address
+        - stop: Close every connection and stop listening
+        - add_account: Register an account directly
+        - add_contact: Add a contact with a mutual subscription directly
+        - add_room: Create a room, optionally filled with simulated occupants
+        - room_say: Send a groupchat message from a simulated occupant
+        - handle_stanza: Process a stanza sent by a bound session
+        - route_message: Deliver a message to the sessions of its recipient
+    """
+
+    def __init__(self, domain='localhost', resume_timeout=DEFAULT_RESUME_TIMEOUT,
+                 scram_iterations=DEFAULT_SCRAM_ITERATIONS):
+        self.domain = domain
+        self.resume_timeout = resume_timeout
+        self.scram_iterations = scram_iterations
+        self.accounts = {}
+        self.sessions = {}
+        self.resumable = {}
+        self.connections = set()
+        self.muc_domain = f'conference.{domain}'
+        self.rooms = {}
+        self.stats = Counter()
+        self.address = None
+        self._server = None
+        self._ids = itertools.count(1)
+
+    async def start(self, host='127.0.0.1', port=0):
+        """
+        Start listening, on a free port by default, and return the (host, port) address.
+        """
+        loop = asyncio.get_running_loop()
+        self._server = await loop.create_server(lambda: ClientConnection(self), host, port)
+        self.address = self._server.sockets[0].getsockname()[:2]
+        return self.address
+
+    async def stop(self):
+        """
+        Close every connection and stop listening.
+        """
+        for connection in list(self.connections):
+            connection.close()
+        for session in list(self.resumable.values()):
+            self.end_session(session)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def add_account(self, username, password):
+        """
+        Register an account directly and return its bare JID.
+        """
+        jid = f"{username}@{self.domain}".lower()
+        self.accounts[jid] = Account(jid, password)
+        return jid
+
+    def add_contact(self, jid, contact, name=''):
+        """
+        Add a contact to the roster of an account with a mutual subscription, and the
+        account to the roster of the contact when it is local.
+        """
+        account = self.accounts[jid]
+        item = account.roster.setdefault(contact, RosterItem(name))
+        item.to = item.from_ = True
+        account.roster_version += 1
+        if contact in self.accounts:
+            other = self.accounts[contact]
+            item = other.roster.setdefault(jid, RosterItem())
+            item.to = item.from_ = True
+            other.roster_version += 1
+
+    # Sessions
+
+    def bind(self, connection, jid):
+        """
+        Bind a resource; a session already using it is closed with a conflict.
+        """
+        session = Session(jid, connection)
+        resources = self.sessions.setdefault(session.bare, {})
+        previous = resources.get(session.resource)
+        if previous is not None:
+            if previous.connection is not None:
+                previous.connection.session = None
+                previous.connection.stream_error('conflict')
+            self.end_session(previous)
+        resources[session.resource] = session
+        return session
+
+    def register_resumable(self, session):
+        sm_id = f"sm{next(self._ids)}"
+        self.resumable[sm_id] = session
+        return sm_id
+
+    def detach(self, session):
+        """
+        Keep a resumable session without connection until it is resumed or times out.
+        """
+        session.connection = None
+        session.expiry = asyncio.get_event_loop().call_later(self.resume_timeout, self.end_session, session)
+
+    def resume(self, connection, sm_id):
+        """
+        Attach a resumable session to a new connection, or return None if it is gone.
+        """
+        session = self.resumable.get(sm_id)
+        if session is None or session.bare != connection.user:
+            return None
+        if session.expiry is not None:
+            session.expiry.cancel()
+            session.expiry = None
+        if session.connection is not None:
+            # The client came back before the old connection was noticed as dead
+            old, session.connection = session.connection, None
+            old.session = None
+            old.transport.abort()
+        session.connection = connection
+        self.stats['resumptions'] += 1
+        return session
+
+    def end_session(self, session):
+        """
+        Destroy a session: its presence goes offline and its unacked messages are stored offline.
+        """
+        if session.expiry is not None:
+            session.expiry.cancel()
+            session.expiry = None
+        self.resumable.pop(session.sm_id, None)
+        resources = self.sessions.get(session.bare, {})
+        if resources.get(session.resource) is not session:
+            return
+        del resources[session.resource]
+        if not resources:
+            del self.sessions[session.bare]
+
+        if session.available:
+            self.broadcast_presence(session, make_element(PRESENCE, {'type': 'unavailable'}))
+        for room in list(self.rooms.values()):
+            occupant = room.find(session.jid)
+            if occupant is not None:
+                self.muc_leave(room, occupant)
+        account = self.accounts.get(session.bare)
+        if account is not None:
+            for _, element, _ in session.unacked:
+                # Like routing, groupchat messages are not stored offline: the room keeps them
+                if element.tag == MESSAGE and element.get('type') in (None, 'chat', 'normal'):
+                    self.store_offline(account, element)
+        session.unacked.clear()
+
+    def available_sessions(self, jid):
+        return [session for session in self.sessions.get(jid, {}).values() if session.available]
+
+    def find_session(self, jid):
+        bare, resource = split_jid(jid)
+        return self.sessions.get(bare, {}).get(resource)
+
+    def deliver(self, session, element):
+        session.send(element)
+        self.stats['stanzas_out'] += 1
+
+    # Stanzas
+
+    def make_reply(self, iq):
+        return make_element(IQ, {'type': 'result', 'id': iq.get('id'), 'to': iq.get('from')})
+
+    def make_error(self, stanza, error_type, condition):
+        """
+        Build the error reply of a stanza.
+        """
+        reply = make_element(stanza.tag, {'type': 'error', 'id': stanza.get('id'),
+                                          'to': stanza.get('from'), 'from': stanza.get('to')})
+        error = ET.SubElement(reply, f'{{{CLIENT_NS}}}error', {'type': error_type})
+        ET.SubElement(error, f'{{{STANZAS_NS}}}{condition}')
+        return reply
+
+    def handle_stanza(self, session, stanza):
+        """
+        Process a stanza sent by a bound session, stamped with its full JID.
+        """
+        stanza.set('from', session.jid)
+        if split_jid(stanza.get('to'))[0].partition('@')[2] == self.muc_domain:
+            self.handle_muc(session, stanza)
+        elif stanza.tag == MESSAGE:
+            self.stats['messages_in'] += 1
+            if stanza.get('to'):
+                self.route_message(stanza)
+        elif stanza.tag == PRESENCE:
+            self.handle_presence(session, stanza)
+        else:
+            self.handle_iq(session, stanza)
+
+    def handle_iq(self, session, iq):
+        """
+        Answer the iq stanzas addressed to the server or the account, route the others.
+        """
+        iq_type = iq.get('type')
+        to = iq.get('to')
+        if to and split_jid(to)[0] not in (self.domain, session.bare):
+            target = self.find_session(to)
+            if target is not None:
+                self.deliver(target, iq)
+            elif iq_type in ('get', 'set'):
+                self.deliver(session, self.make_error(iq, 'cancel', 'service-unavailable'))
+            return
+        if iq_type not in ('get', 'set'):
+            return
+
+        account = self.accounts[session.bare]
+        payload = iq[0] if len(iq) else None
+        tag = payload.tag if payload is not None else ''
+        if tag == f'{{{ROSTER_NS}}}query':
+            reply = self.handle_roster(account, iq, payload)
+        elif tag == f'{{{REGISTER_NS}}}query':
+            reply = self.handle_registration(iq, payload, account)
+        elif tag in (f'{{{PING_NS}}}ping', f'{{{SESSION_NS}}}session'):
+            reply = self.make_reply(iq)
+        else:
+            reply = self.make_error(iq, 'cancel', 'service-unavailable')
+        if reply is not None:
+            self.deliver(session, reply)
+        if tag == f'{{{REGISTER_NS}}}query' and account.jid not in self.accounts:
+            self.close_account_sessions(account.jid)
+
+    def handle_registration(self, iq, query, account=None):
+        """
+        XEP-0077: return the registration form, create an account or remove the current one.
+        """
+        if iq.get('type') == 'get':
+            reply = self.make_reply(iq)
+            form = ET.SubElement(reply, f'{{{REGISTER_NS}}}query')
+            ET.SubElement(form, f'{{{REGISTER_NS}}}instructions').text = "Choose a username and password"
+            if account is not None:
+                ET.SubElement(form, f'{{{REGISTER_NS}}}registered')
+            ET.SubElement(form, f'{{{REGISTER_NS}}}username')
+            ET.SubElement(form, f'{{{REGISTER_NS}}}password')
+            return reply
+
+        if query.find(f'{{{REGISTER_NS}}}remove') is not None:
+            if account is None:
+                return self.make_error(iq, 'auth', 'not-authorized')
+            del self.accounts[account.jid]
+            self.stats['unregistrations'] += 1
+            return self.make_reply(iq)
+
+        username = query.findtext(f'{{{REGISTER_NS}}}username')
+        password = query.findtext(f'{{{REGISTER_NS}}}password')
+        if not username or not password:
+            return self.make_error(iq, 'modify', 'not-acceptable')
+        jid = f"{username}@{self.domain}".lower()
+        if account is not None:
+            if jid != account.jid:
+                return self.make_error(iq, 'modify', 'bad-request')
+            account.password = password
+            return self.make_reply(iq)
+        if jid in self.accounts:
+            return self.make_error(iq, 'cancel', 'conflict')
+        self.add_account(username, password)
+        self.stats['registrations'] += 1
+        return self.make_reply(iq)
+
+    def close_account_sessions(self, jid):
+        """
+        Close the sessions of a removed account.
+        """
+        for session in list(self.sessions.get(jid, {}).values()):
+            session.sm_id = None
+            if session.connection is not None:
+                session.connection.close()
+            else:
+                self.end_session(session)
+
+    # Roster
+
+    def handle_roster(self, account, iq, query):
+        """
+        Return the roster (empty when the client version is current) or apply a roster set.
+        """
+        if iq.get('type') == 'get':
+            reply = self.make_reply(iq)
+            if query.get('ver') != str(account.roster_version):
+                items = [item.to_element(jid) for jid, item in account.roster.items()]
+                reply.append(make_element(f'{{{ROSTER_NS}}}query', {'ver': account.roster_version}, children=items))
+            return reply
+
+        item = query.find(f'{{{ROSTER_NS}}}item')
+        if item is None or not item.get('jid'):
+            return self.make_error(iq, 'modify', 'bad-request')
+        jid = split_jid(item.get('jid'))[0]
+        if item.get('subscription') == 'remove':
+            self.remove_contact(account, jid)
+        else:
+            contact = account.roster.setdefault(jid, RosterItem())
+            contact.name = item.get('name', '')
+            contact.groups = [group.text or '' for group in item.findall(f'{{{ROSTER_NS}}}group')]
+            self.push_roster(account, jid)
+        return self.make_reply(iq)
+
+    def push_roster(self, account, jid, removed=False):
+        """
+        Bump the roster version and push the item to every session of the account.
+        """
+        account.roster_version += 1
+        item = account.roster.get(jid)
+        element = RosterItem().to_element(jid, 'remove') if removed or item is None else item.to_element(jid)
+        for session in list(self.sessions.get(account.jid, {}).values()):
+            push = make_element(IQ, {'type': 'set', 'id': f"push{next(self._ids)}", 'to': session.jid}, children=[
+                make_element(f'{{{ROSTER_NS}}}query', {'ver': account.roster_version}, children=[element])])
+            self.deliver(session, push)
+
+    def remove_contact(self, account, jid):
+        """
+        Remove a contact and cancel the subscriptions in both directions.
+        """
+        item = account.roster.pop(jid, None)
+        if item is None:
+            return
+        self.push_roster(account, jid, removed=True)
+        contact = self.accounts.get(jid)
+        contact_item = contact.roster.get(account.jid) if contact is not None else None
+        if contact_item is not None and (item.to or item.from_ or item.ask):
+            contact_item.from_ = contact_item.from_ and not item.to and not item.ask
+            contact_item.to = contact_item.to and not item.from_
+            self.push_roster(contact, account.jid)
+        for session in self.available_sessions(account.jid):
+            self.send_unavailable(session, jid)
+        if contact is not None:
+            contact.pending_in.pop(account.jid, None)
+
+    # Presence
+
+    def handle_presence(self, session, presence):
+        presence_type = presence.get('type')
+        to = presence.get('to')
+        if presence_type in ('subscribe', 'subscribed', 'unsubscribe', 'unsubscribed'):
+            if to:
+                self.handle_subscription(session, presence_type, split_jid(to)[0])
+        elif presence_type == 'probe':
+            if to:
+                self.answer_probe(session, split_jid(to)[0])
+        elif to:
+            # Directed presence
+            target = self.find_session(to)
+            targets = [target] if target is not None else self.available_sessions(split_jid(to)[0])
+            for target in targets:
+                self.deliver(target, presence)
+        else:
+            self.broadcast_presence(session, presence)
+
+    def broadcast_presence(self, session, presence):
+        """
+        Send the presence of a session to the subscribed contacts and the other resources of the
+        account. The initial presence also collects the presence of the contacts and delivers
+        the requests and messages stored while the account was offline.
+        """
+        presence.set('from', session.jid)
+        initial = not session.available and presence.get('type') != 'unavailable'
+        if presence.get('type') == 'unavailable':
+            session.available = False
+            session.presence = None
+        else:
+            session.available = True
+            session.presence = presence
+            try:
+                session.priority = int(presence.findtext(f'{{{CLIENT_NS}}}priority') or 0)
+            except ValueError:
+                session.priority = 0
+
+        account = self.accounts.get(session.bare)
+        if account is None:
+            return
+        recipients = [target for target in self.available_sessions(session.bare) if target is not session]
+        for jid, item in account.roster.items():
+            if item.from_:
+                recipients.extend(self.available_sessions(jid))
+        for target in recipients:
+            presence.set('to', target.jid)
+            self.deliver(target, presence)
+        presence.attrib.pop('to', None)
+
+        if initial:
+            # Presence of the contacts and of the other resources of the account
+            for jid, item in account.roster.items():
+                if item.to:
+                    for contact in self.available_sessions(jid):
+                        self.send_presence_of(contact, session)
+            for other in self.available_sessions(session.bare):
+                if other is not session:
+                    self.send_presence_of(other, session)
+            for request in account.pending_in.values():
+                self.deliver(session, request)
+            self.deliver_offline(account)
+
+    def send_presence_of(self, source, target):
+        presence = source.presence
+        presence.set('to', target.jid)
+        self.deliver(target, presence)
+        presence.attrib.pop('to', None)
+
+    def send_unavailable(self, session, jid):
+        """
+        Tell a session that all the resources of a contact are unavailable.
+        """
+        for contact in self.available_sessions(jid):
+            self.deliver(session, make_element(PRESENCE, {'type': 'unavailable', 'from': contact.jid,
+                                                          'to': session.jid}))
+
+    def answer_probe(self, session, jid):
+        account = self.accounts[session.bare]
+        item = account.roster.get(jid)
+        if item is not None and item.to:
+            for contact in self.available_sessions(jid):
+                self.send_presence_of(contact, session)
+
+    def handle_subscription(self, session, presence_type, jid):
+        """
+        Apply a subscription request or answer to both rosters and notify the contact.
+        """
+        account = self.accounts[session.bare]
+        contact = self.accounts.get(jid)
+        stamped = make_element(PRESENCE, {'type': presence_type, 'from': account.jid, 'to': jid})
+
+        if presence_type == 'subscribe':
+            item = account.roster.setdefault(jid, RosterItem())
+            if item.to:
+                return
+            if contact is not None and account.jid in contact.roster and contact.roster[account.jid].from_:
+                # Already approved by the contact, answer on its behalf
+                item.to = True
+                self.push_roster(account, jid)
+                return
+            item.ask = True
+            self.push_roster(account, jid)
+            if contact is not None:
+                targets = self.available_sessions(jid)
+                if not targets:
+                    contact.pending_in[account.jid] = stamped
+                for target in targets:
+                    self.deliver(target, stamped)
+
+        elif presence_type == 'subscribed':
+            item = account.roster.setdefault(jid, RosterItem())
+            item.from_ = True
+            account.pending_in.pop(jid, None)
+            self.push_roster(account, jid)
+            if contact is not None:
+                contact_item = contact.roster.setdefault(account.jid, RosterItem())
+                contact_item.to = True
+                contact_item.ask = False
+                self.push_roster(contact, account.jid)
+                for target in self.available_sessions(jid):
+                    self.deliver(target, stamped)
+                    for source in self.available_sessions(account.jid):
+                        self.send_presence_of(source, target)
+
+        elif presence_type == 'unsubscribe':
+            item = account.roster.get(jid)
+            if item is not None:
+                item.to = item.ask = False
+                self.push_roster(account, jid)
+            if contact is not None and account.jid in contact.roster:
+                contact.roster[account.jid].from_ = False
+                self.push_roster(contact, account.jid)
+                for target in self.available_sessions(jid):
+                    self.deliver(target, stamped)
+
+        else:
+            item = account.roster.get(jid)
+            account.pending_in.pop(jid, None)
+            if item is not None:
+                item.from_ = False
+                self.push_roster(account, jid)
+            if contact is not None and account.jid in contact.roster:
+                contact_item = contact.roster[account.jid]
+                contact_item.to = contact_item.ask = False
+                self.push_roster(contact, account.jid)
+                for target in self.available_sessions(jid):
+                    self.deliver(target, stamped)
+                    self.send_unavailable(target, account.jid)
+
+    # Multi-user chat
+
+    def add_room(self, name, occupants=0):
+        """
+        Create a room with the given number of simulated occupants, named user1, user2...
+        Returns the JID of the room.
+        """
+        jid = f"{name}@{self.muc_domain}".lower()
+        room = self.rooms.setdefault(jid, MucRoom(jid))
+        for i in range(1, occupants + 1):
+            nick = f"user{i}"
+            room.occupants[nick] = MucOccupant(nick, None, f"{nick}@{self.domain}/sim")
+        return jid
+
+    def room_say(self, room_jid, nick, body):
+        """
+        Send a groupchat message to a room from one of its occupants.
+        """
+        room = self.rooms[room_jid]
+        message = make_element(MESSAGE, {'type': 'groupchat'},
+                               children=[make_element(f'{{{CLIENT_NS}}}body', text=body)])
+        self.muc_broadcast_message(room, room.occupants[nick], message)
+
+    def handle_muc(self, session, stanza):
+        """
+        Process a stanza addressed to a room or to an occupant.
+        """
+        room_jid, nick = split_jid(stanza.get('to'))
+        room = self.rooms.get(room_jid)
+        if stanza.tag == PRESENCE:
+            self.muc_presence(session, stanza, room_jid, nick)
+        elif stanza.tag == MESSAGE:
+            occupant = room.find(session.jid) if room is not None else None
+            if stanza.get('type') == 'error':
+                return
+            if occupant is None:
+                self.deliver(session, self.make_error(stanza, 'modify', 'not-acceptable'))
+            elif stanza.get('type') == 'groupchat' and not nick:
+                self.muc_broadcast_message(room, occupant, stanza)
+            else:
+                self.deliver(session, self.make_error(stanza, 'modify', 'bad-request'))
+        elif stanza.get('type') in ('get', 'set'):
+            payload = stanza[0] if len(stanza) else None
+            if room is not None and payload is not None and payload.tag == f'{{{MUC_OWNER_NS}}}query':
+                # The room configuration is not implemented, an instant room is accepted as is
+                reply = self.make_reply(stanza)
+                reply.set('from', room_jid)
+                self.deliver(session, reply)
+            else:
+                self.deliver(session, self.make_error(stanza, 'cancel', 'service-unavailable'))
+
+    def muc_presence(self, session, presence, room_jid, nick):
+        room = self.rooms.get(room_jid)
+        occupant = room.find(session.jid) if room is not None else None
+        if presence.get('type') == 'unavailable':
+            if occupant is not None:
+                self.muc_leave(room, occupant, presence)
+            return
+        if presence.get('type') is not None:
+            return
+        if not nick:
+            self.deliver(session, self.muc_error(presence, 'modify', 'jid-malformed'))
+            return
+        if occupant is not None:
+            # Presence change of an occupant, a nick change is not supported
+            occupant.presence = self.muc_strip(presence)
+            for target in room.occupants.values():
+                self.muc_send_presence(room, occupant, target)
+            return
+        if room is not None and nick in room.occupants:
+            self.deliver(session, self.muc_error(presence, 'cancel', 'conflict'))
+            return
+        self.muc_join(session, presence, room_jid, nick)
+
+    def muc_error(self, presence, error_type, condition):
+        """
+        Build the error reply of a join presence, which echoes its MUC payload (XEP-0045 7.2).
+        """
+        reply = self.make_error(presence, error_type, condition)
+        reply.insert(0, make_element(f'{{{MUC_NS}}}x'))
+        return reply
+
+    def muc_strip(self, presence):
+        """
+        Copy a presence without its addresses and MUC payloads.
+        """
+        copy = make_element(PRESENCE, {'type': presence.get('type')})
+        copy.extend(child for child in presence if child.tag.split('}')[0][1:] not in (MUC_NS, MUC_USER_NS))
+        return copy
+
+    def muc_join(self, session, presence, room_jid, nick):
+        """
+        Add an occupant to a room, creating it when it does not exist: the occupant receives
+        the presence of the others, its own presence, the history it asked for and the subject.
+        """
+        created = room_jid not in self.rooms
+        room = self.rooms[room_jid] = self.rooms.get(room_jid) or MucRoom(room_jid)
+        occupant = MucOccupant(nick, session, session.jid, 'owner' if created else 'none',
+                               'moderator' if created else 'participant', self.muc_strip(presence))
+        for other in room.occupants.values():
+            self.muc_send_presence(room, other, occupant)
+        room.occupants[nick] = occupant
+        for target in room.occupants.values():
+            codes = ((110, 201) if created else (110,)) if target is occupant else ()
+            self.muc_send_presence(room, occupant, target, codes)
+        self.stats['muc_joins'] += 1
+
+        join = presence.find(f'{{{MUC_NS}}}x')
+        history = join.find(f'{{{MUC_NS}}}history') if join is not None else None
+        for message in self.muc_history(room, history, session.jid):
+            self.deliver(session, message)
+        subject = make_element(MESSAGE, {'type': 'groupchat', 'from': room.jid, 'to': session.jid},
+                               children=[make_element(f'{{{CLIENT_NS}}}subject', text=room.subject or None)])
+        self.deliver(session, subject)
+
+    def muc_history(self, room, history, to):
+        """
+        Return the history messages asked with the history element of a join, stamped with their delay.
+        """
+        messages = list(room.history)
+        if history is not None:
+            if history.get('since'):
+                try:
+                    since = calendar.timegm(time.strptime(history.get('since')[:19], '%Y-%m-%dT%H:%M:%S'))
+                except ValueError:
+                    since = 0
+                messages = [(stamp, message) for stamp, message in messages if stamp > since]
+            if history.get('seconds'):
+                messages = [(stamp, message) for stamp, message in messages
+                            if stamp > time.time() - int(history.get('seconds'))]
+            if history.get('maxstanzas'):
+                count = int(history.get('maxstanzas'))
+                messages = messages[len(messages) - count:] if count else []
+            if history.get('maxchars') is not None and int(history.get('maxchars')) < 10:
+                messages = []
+        result = []
+        for stamp, message in messages:
+            copy = make_element(MESSAGE, {**message.attrib, 'to': to}, children=list(message))
+            copy.append(make_element(f'{{{DELAY_NS}}}delay', {
+                'from': room.jid, 'stamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(stamp))}))
+            result.append(copy)
+        return result
+
+    def muc_send_presence(self, room, occupant, target, codes=(), unavailable=False):
+        """
+        Send the presence of an occupant to another one (or to itself, with status codes).
+        """
+        if target.session is None:
+            return
+        presence = make_element(PRESENCE, {'from': f"{room.jid}/{occupant.nick}", 'to': target.jid,
+                                           'type': 'unavailable' if unavailable else None},
+                                children=[] if unavailable else list(occupant.presence))
+        x = ET.SubElement(presence, f'{{{MUC_USER_NS}}}x')
+        ET.SubElement(x, f'{{{MUC_USER_NS}}}item', {'affiliation': occupant.affiliation,
+                                                   'role': 'none' if unavailable else occupant.role,
+                                                   'jid': occupant.jid})
+        for code in codes:
+            ET.SubElement(x, f'{{{MUC_USER_NS}}}status', {'code': str(code)})
+        self.deliver(target.session, presence)
+
+    def muc_leave(self, room, occupant, presence=None):
+        for target in room.occupants.values():
+            self.muc_send_presence(room, occupant, target, (110,) if target is occupant else (), unavailable=True)
+        del room.occupants[occupant.nick]
+
+    def muc_broadcast_message(self, room, occupant, message):
+        """
+        Send a groupchat message to every occupant from the nick of its sender, and keep it in the history.
+        """
+        room_nick = f"{room.jid}/{occupant.nick}"
+        subject = message.find(f'{{{CLIENT_NS}}}subject')
+        if subject is not None and message.find(f'{{{CLIENT_NS}}}body') is None:
+            room.subject = subject.text or ''
+        stamped = make_element(MESSAGE, {'type': 'groupchat', 'from': room_nick, 'id': message.get('id')},
+                               children=[child for child in message
+                                         if child.tag in (f'{{{CLIENT_NS}}}body', f'{{{CLIENT_NS}}}subject')])
+        if stamped.find(f'{{{CLIENT_NS}}}body') is not None:
+            room.history.append((time.time(), stamped))
+        for target in room.occupants.values():
+            if target.session is not None:
+                stamped.set('to', target.jid)
+                self.deliver(target.session, stamped)
+        stamped.attrib.pop('to', None)
+        self.stats['muc_messages'] += 1
+
+    # Messages
+
+    def route_message(self, message):
+        """
+        Deliver a message to the addressed resource, or to the available resources of the
+        recipient, or store it until the recipient comes online.
+        """
+        to = message.get('to')
+        bare, resource = split_jid(to)
+        account = self.accounts.get(bare)
+        if account is None:
+            if message.get('type') != 'error':
+                sender = self.find_session(message.get('from'))
+                if sender is not None:
+                    self.deliver(sender, self.make_error(message, 'cancel', 'service-unavailable'))
+            return
+
+        target = self.find_session(to) if resource else None
+        if target is not None:
+            targets = [target]
+        else:
+            targets = [session for session in self.available_sessions(bare) if session.priority >= 0]
+        if not targets:
+            if message.get('type') in (None, 'chat', 'normal'):
+                self.store_offline(account, message)
+            return
+        for target in targets:
+            self.deliver(target, message)
+        self.stats['messages_routed'] += 1
+
+    def store_offline(self, account, message):
+        """
+        Keep a message for an offline account, stamped with its reception time (XEP-0203).
+        """
+        if message.find(f'{{{DELAY_NS}}}delay') is None:
+            stamp = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+            message.append(make_element(f'{{{DELAY_NS}}}delay', {'from': self.domain, 'stamp': stamp}))
+        account.offline.append(message)
+        self.stats['offline_stored'] += 1
+
+    def deliver_offline(self, account):
+        messages, account.offline = account.offline, []
+        for message in messages:
+            self.route_message(message)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the local XMPP server stand-in")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on")
+    parser.add_argument('--port', type=int, default=5222, help="Port to listen on")
+    parser.add_argument('--domain', default='localhost', help="Domain of the accounts")
+    parser.add_argument('--account', action='append', default=[], metavar='USER:PASSWORD',
+                        help="Account created at startup, can be repeated")
+    return parser.parse_args()
+
+
+async def serve(args):
+    server = LocalXMPPServer(args.domain)
+    for account in args.account:
+        username, _, password = account.partition(':')
+        server.add_account(username, password)
+    host, port = await server.start(args.host, args.port)
+    print(f"INFO: Local XMPP server for {args.domain} listening on {host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        print(f"INFO: Server stats: {dict(server.stats)}")
+
+
+def main():
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
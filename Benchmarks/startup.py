@@ -0,0 +1,94 @@
+"""
+Startup benchmark.
+
+Launches the application with --startup-probe in fresh interpreters and measures, from
+the moment the process is spawned:
+    - imports: the modules of the welcome screen are imported
+    - first_window: the welcome window has been drawn (needs a display)
+    - backend_ready: Slixmpp and the session backend are loaded in the background
+
+It also checks that Slixmpp is not imported before the first window is on screen. The
+run fails (exit code 1) when the p50 time to the first window, or to the imports
+without a display, is over the budget.
+
+Usage:
+    python -m Benchmarks.startup --runs 20 --budget-ms 400
+    python -m Benchmarks.startup --no-prewarm --output startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from Benchmarks.suite import summarize
+
+# Default budget of the time to the first window, in milliseconds
+DEFAULT_BUDGET_MS = 500
+
+# Directory holding main.py
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def probe_startup(prewarm=True):
+    """
+    Start the application once and return its startup milestones, in seconds from the spawn.
+    """
+    command = [sys.executable, "main.py", "--startup-probe", "--log-level", "WARNING"]
+    if not prewarm:
+        command.append("--no-prewarm")
+    spawned = time.time()
+    result = subprocess.run(command, cwd=PROJECT_DIR, capture_output=True, text=True, timeout=60)
+    lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+    if not lines:
+        raise RuntimeError(f"The startup probe did not report: {result.stderr.strip()}")
+    probe = json.loads(lines[-1])
+    milestones = {name: probe[key] - spawned for name, key in (
+        ('imports', 'imports_done'), ('first_window', 'first_window'), ('backend_ready', 'backend_ready'))
+        if key in probe}
+    milestones['slixmpp_before_window'] = probe.get('slixmpp_before_window', False)
+    milestones['error'] = probe.get('error')
+    return milestones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to the first window of the XMPP client")
+    parser.add_argument("--runs", type=int, default=10, help="Number of application starts measured")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="Budget of the p50 time to the first window, in milliseconds")
+    parser.add_argument("--no-prewarm", action="store_true", help="Do not load the backend in the background")
+    parser.add_argument("--output", help="File the JSON results are written to")
+    args = parser.parse_args()
+
+    print(f"INFO: Starting the application {args.runs} times")
+    runs = [probe_startup(prewarm=not args.no_prewarm) for _ in range(args.runs)]
+    results = {}
+    for name in ('imports', 'first_window', 'backend_ready'):
+        samples = [run[name] for run in runs if name in run]
+        if samples:
+            results[name] = summarize(samples)
+    results['slixmpp_before_window'] = any(run['slixmpp_before_window'] for run in runs)
+
+    errors = {run['error'] for run in runs if run['error']}
+    if errors:
+        print(f"INFO: The window could not be opened, only the imports are measured: {', '.join(errors)}")
+    for name, summary in results.items():
+        print(f"RESULT: {name} = {summary}")
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({'parameters': vars(args), 'results': results}, output_file, indent=2)
+        print(f"INFO: Results written to {args.output}")
+
+    # Check the budget on the first window, or on the imports without a display
+    measured = results.get('first_window') or results.get('imports')
+    if results['slixmpp_before_window']:
+        print("ERROR: Slixmpp is imported before the first window")
+        return 1
+    if measured and measured['p50_ms'] > args.budget_ms:
+        print(f"ERROR: Startup over budget: p50 {measured['p50_ms']:.1f} ms > {args.budget_ms:.1f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
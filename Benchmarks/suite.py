@@ -0,0 +1,340 @@
+"""
+Client benchmark suite.
+
+Drives XMPP_Client sessions against the local XMPP server stand-in and measures the
+latency of the main operations of the application, from the client call to the event
+that completes it:
+    - login: connect -> session_start -> roster received, with a cold and a cached roster
+    - register: connect -> XEP-0077 registration acknowledged
+    - subscription: send_presence_subscription -> request delivered -> contact authorized
+    - message: send_chat_message -> message received by the contact, and the throughput
+      of a burst of messages
+
+The server runs on the same event loop as the clients, so the figures include its
+processing time and no network. Latencies are reported as p50/p99 in milliseconds and
+the results are written as JSON, which can be compared with a previous run.
+
+Usage:
+    python -m Benchmarks.suite --iterations 100 --output results.json
+    python -m Benchmarks.suite --compare results.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import platform
+import subprocess
+import time
+import slixmpp
+from Backend.manager import ConnectionManager
+from Backend.callbacks import UICallbacks
+from Backend.roster_cache import RosterCache
+from Benchmarks.server import LocalXMPPServer
+from Backend.log import configure_logging, shutdown_logging
+
+PASSWORD = "bench"
+
+
+def percentile(samples, fraction):
+    """
+    Return the nearest-rank percentile of a list of samples.
+    """
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples):
+    """
+    Return the latency summary of a list of samples in seconds, in milliseconds.
+    """
+    if not samples:
+        return {'count': 0}
+    return {
+        'count': len(samples),
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'mean_ms': sum(samples) / len(samples) * 1000,
+        'max_ms': max(samples) * 1000,
+    }
+
+
+class RegistrationRecorder(UICallbacks):
+    """
+    Resolves a future when the registration of a benchmark session is acknowledged.
+    """
+
+    def __init__(self, done):
+        self.done = done
+
+    def registration_succeeded(self, client):
+        if not self.done.done():
+            self.done.set_result(time.perf_counter())
+
+    def registration_failed(self, client, reason):
+        if not self.done.done():
+            self.done.set_exception(RuntimeError(reason))
+
+
+class BenchmarkSuite:
+    """
+    The BenchmarkSuite class owns the local server, the connection manager and the
+    accounts of the benchmarks, and runs every scenario on a single event loop.
+
+    Attributes:
+        - server: The LocalXMPPServer the clients connect to
+        - manager: The ConnectionManager of the benchmark sessions
+        - iterations: Number of samples per latency measurement
+        - roster_size: Number of contacts in the roster of the login account
+        - burst: Number of messages of the throughput measurement
+
+    Methods:
+        - run: Run every scenario and return the results
+    """
+
+    def __init__(self, iterations=50, roster_size=200, burst=5000):
+        self.server = LocalXMPPServer()
+        self.manager = ConnectionManager()
+        self.address = None
+        self.iterations = iterations
+        self.roster_size = roster_size
+        self.burst = burst
+
+    async def run(self):
+        self.address = await self.server.start()
+        try:
+            return {
+                'login': await self.bench_login(cached=False),
+                'login_cached_roster': await self.bench_login(cached=True),
+                'register': await self.bench_register(),
+                'subscription': await self.bench_subscription(),
+                'message_latency': await self.bench_message_latency(),
+                'message_throughput': await self.bench_message_throughput(),
+            }
+        finally:
+            self.manager.close_all()
+            await asyncio.sleep(0.1)
+            await self.server.stop()
+
+    async def open(self, jid, **kwargs):
+        """
+        Create a session and wait until it is established.
+        """
+        client = self.manager.create_session(jid, PASSWORD, **kwargs)
+        if not await self.manager.open_session(client, address=self.address):
+            raise RuntimeError(f"Could not open a session for {jid}")
+        return client
+
+    async def close(self, client):
+        await client.logout()
+
+    async def bench_login(self, cached):
+        """
+        Time the login of an account with a large roster, up to session_start and up to
+        the roster result. With a cached roster, only its version is checked by the server.
+        """
+        jid = self.server.add_account(f"login{int(cached)}", PASSWORD)
+        for i in range(self.roster_size):
+            self.server.add_contact(jid, f"contact{i}@{self.server.domain}", f"Contact {i}")
+        cache = RosterCache(":memory:") if cached else None
+        if cached:
+            # Warm the cache with a first login
+            await self.close(await self.open(jid, roster_cache=cache))
+
+        loop = asyncio.get_running_loop()
+        session_times, roster_times = [], []
+        for _ in range(self.iterations):
+            client = self.manager.create_session(jid, PASSWORD, roster_cache=cache)
+            roster_received = loop.create_future()
+            client.add_event_handler(
+                "roster_update",
+                lambda iq, future=roster_received: future.done() or future.set_result(time.perf_counter()),
+                disposable=True)
+
+            start = time.perf_counter()
+            if not await self.manager.open_session(client, address=self.address):
+                raise RuntimeError(f"Could not open a session for {jid}")
+            session_times.append(time.perf_counter() - start)
+            roster_times.append(await roster_received - start)
+            await self.close(client)
+        if cache is not None:
+            cache.close()
+        return {'session_start': summarize(session_times), 'roster_received': summarize(roster_times)}
+
+    async def bench_register(self):
+        """
+        Time the in-band registration of new accounts.
+        """
+        loop = asyncio.get_running_loop()
+        samples = []
+        for i in range(self.iterations):
+            done = loop.create_future()
+            client = self.manager.create_session(f"register{i}@{self.server.domain}", PASSWORD,
+                                                 register=True, ui=RegistrationRecorder(done))
+            start = time.perf_counter()
+            self.manager.connect(client, address=self.address)
+            samples.append(await asyncio.wait_for(done, 30) - start)
+            await self.close(client)
+        return summarize(samples)
+
+    async def bench_subscription(self):
+        """
+        Time a subscription request until the contact receives it, and until the
+        contact (auto-authorizing, as Slixmpp does by default) approves it.
+        """
+        loop = asyncio.get_running_loop()
+        subscriber = await self.open(self.server.add_account("subscriber", PASSWORD))
+        delivered, authorized = [], []
+        for i in range(self.iterations):
+            contact = await self.open(self.server.add_account(f"contact{i}", PASSWORD))
+            received = loop.create_future()
+            approved = loop.create_future()
+            contact.add_event_handler("presence_subscribe",
+                                      lambda presence: received.done() or received.set_result(time.perf_counter()),
+                                      disposable=True)
+            subscriber.add_event_handler("presence_subscribed",
+                                         lambda presence: approved.done() or approved.set_result(time.perf_counter()),
+                                         disposable=True)
+
+            start = time.perf_counter()
+            subscriber.send_presence_subscription(contact.boundjid.bare)
+            delivered.append(await asyncio.wait_for(received, 10) - start)
+            authorized.append(await asyncio.wait_for(approved, 10) - start)
+            await self.close(contact)
+        await self.close(subscriber)
+        return {'delivered': summarize(delivered), 'authorized': summarize(authorized)}
+
+    async def open_pair(self, name):
+        sender_jid = self.server.add_account(f"{name}_sender", PASSWORD)
+        receiver_jid = self.server.add_account(f"{name}_receiver", PASSWORD)
+        self.server.add_contact(sender_jid, receiver_jid)
+        return await self.open(sender_jid), await self.open(receiver_jid)
+
+    async def bench_message_latency(self):
+        """
+        Time single messages from send_chat_message until the contact receives them.
+        """
+        loop = asyncio.get_running_loop()
+        sender, receiver = await self.open_pair("latency")
+        samples = []
+        for i in range(self.iterations):
+            received = loop.create_future()
+            receiver.add_event_handler("message",
+                                       lambda msg: received.done() or received.set_result(time.perf_counter()),
+                                       disposable=True)
+            start = time.perf_counter()
+            sender.send_chat_message(receiver.boundjid.bare, f"Latency message {i}")
+            samples.append(await asyncio.wait_for(received, 10) - start)
+        await self.close(sender)
+        await self.close(receiver)
+        return summarize(samples)
+
+    async def bench_message_throughput(self):
+        """
+        Time a burst of messages until the contact has received all of them.
+        """
+        loop = asyncio.get_running_loop()
+        sender, receiver = await self.open_pair("throughput")
+        all_received = loop.create_future()
+        count = 0
+
+        def on_message(msg):
+            nonlocal count
+            count += 1
+            if count == self.burst and not all_received.done():
+                all_received.set_result(time.perf_counter())
+
+        receiver.add_event_handler("message", on_message)
+        start = time.perf_counter()
+        for i in range(self.burst):
+            await sender.outbox.send(receiver.boundjid.bare, f"Burst message {i}")
+        elapsed = await asyncio.wait_for(all_received, 120) - start
+        receiver.del_event_handler("message", on_message)
+        await self.close(sender)
+        await self.close(receiver)
+        return {'messages': self.burst, 'seconds': elapsed, 'msgs_per_sec': self.burst / elapsed}
+
+
+def environment():
+    """
+    Describe the code and the interpreter the results were measured with.
+    """
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                  text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        'revision': revision,
+        'python': platform.python_version(),
+        'slixmpp': slixmpp.__version__,
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def flatten(results, prefix=''):
+    """
+    Return the numeric results as a flat dictionary of dotted names.
+    """
+    values = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)):
+            values[name] = value
+    return values
+
+
+def compare(previous, current):
+    """
+    Print every result next to the one of a previous run, with the relative change.
+    """
+    old = flatten(previous['results'])
+    print(f"INFO: Comparing with revision {previous['environment'].get('revision')} "
+          f"from {previous['environment'].get('timestamp')}")
+    for name, value in flatten(current['results']).items():
+        if name.endswith('.count') or name not in old:
+            continue
+        change = (value - old[name]) / old[name] * 100 if old[name] else 0.0
+        print(f"RESULT: {name:45} {old[name]:12.3f} -> {value:12.3f} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="XMPP client benchmark suite against a local server")
+    parser.add_argument("--iterations", type=int, default=50, help="Samples per latency measurement")
+    parser.add_argument("--roster-size", type=int, default=200, help="Contacts in the roster of the login account")
+    parser.add_argument("--burst", type=int, default=5000, help="Messages of the throughput measurement")
+    parser.add_argument("--output", help="File the JSON results are written to")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare with")
+    parser.add_argument("--verbose", action="store_true", help="Log the events of the client sessions")
+    args = parser.parse_args()
+
+    suite = BenchmarkSuite(args.iterations, args.roster_size, args.burst)
+    print(f"INFO: Running the benchmark suite ({args.iterations} iterations)")
+    if args.verbose:
+        configure_logging("DEBUG")
+    try:
+        results = asyncio.run(suite.run())
+    finally:
+        shutdown_logging()
+
+    report = {
+        'environment': environment(),
+        'parameters': {'iterations': args.iterations, 'roster_size': args.roster_size, 'burst': args.burst},
+        'results': results,
+    }
+    for name, value in flatten(results).items():
+        print(f"RESULT: {name} = {value:,.3f}" if isinstance(value, float) else f"RESULT: {name} = {value:,}")
+    if args.compare:
+        with open(args.compare) as previous:
+            compare(json.load(previous), report)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f"INFO: Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+from Backend.callbacks import UICallbacks
+from Frontend.notice import NoticeWindow
+
+class TkCallbacks(UICallbacks):
+    """
+    The TkCallbacks class reports the XMPP_Client session events through the Tkinter GUI.
+    It is bound to the form (login or registration) that created the session.
+
+    The callbacks run inside the stanza handlers, and Tkinter is pumped from the same
+    event loop: a modal dialog, even one scheduled with after(0), would hold every stanza
+    until it is closed. The results of the forms are shown on their status label, and the
+    other messages in a NoticeWindow that nothing waits on.
+
+    Attributes:
+        - window: The LoginForm or RegisterForm that started the session
+        - home_window: The HomeWindow opened once the session started
+
+    Methods:
+        - session_started: Replaces the form with the home window
+        - authentication_failed: Displays the authentication error on the login form
+        - registration_succeeded: Displays the account creation on the registration form
+        - registration_failed: Displays the registration error on the registration form
+        - connection_lost: Displays the reconnection in the home window
+        - connection_restored: Clears the reconnection message of the home window
+        - show_info: Displays an information notice
+        - show_error: Displays an error notice
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.home_window = None
+
+    def session_started(self, client):
+        """
+        Replace the form that started the session with the home window.
+        """
+        from Frontend.home import HomeWindow  # Import the HomeWindow class
+        self.home_window = self.window.router.show(HomeWindow, client)
+
+    def form_displayed(self):
+        """
+        Whether the form that started the session is still on screen.
+        """
+        return self.window.router.current is self.window
+
+    def authentication_failed(self, client):
+        if self.form_displayed():
+            self.window.show_authentication_failed()
+
+    def registration_succeeded(self, client):
+        if self.form_displayed():
+            self.window.show_registration_succeeded(client.boundjid.bare)
+
+    def registration_failed(self, client, reason):
+        if self.form_displayed():
+            self.window.show_registration_failed(reason)
+
+    def connection_lost(self, client):
+        if self.home_window is not None and self.home_window.router.current is self.home_window:
+            self.home_window.show_connection_status("Connection lost, reconnecting...")
+
+    def connection_restored(self, client, resumed):
+        if self.home_window is not None and self.home_window.router.current is self.home_window:
+            self.home_window.show_connection_status("")
+
+    def show_info(self, title, message):
+        NoticeWindow(title, message, parent=self.window.root)
+
+    def show_error(self, title, message):
+        NoticeWindow(title, message, parent=self.window.root)
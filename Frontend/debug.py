@@ -0,0 +1,98 @@
+import time
+import tkinter as tk
+from Backend.metrics import get_metrics
+
+# Milliseconds between two refreshes of the panel
+REFRESH_INTERVAL = 1000
+
+class DebugPanel:
+    """
+    The DebugPanel class displays the metrics of the application in a window: the calls,
+    errors and latency percentiles of every measured operation, the event loop lag, the
+    presence stanzas received per second and the tick statistics of the GUI. The window
+    is refreshed every REFRESH_INTERVAL milliseconds while it is open.
+
+    Attributes:
+        root: The Tkinter Toplevel window.
+        metrics: The MetricsRegistry displayed.
+        bridge: The EventLoopBridge pumping the GUI, for its tick statistics.
+        presence_sample: The (time, count) of presence stanzas at the last refresh, for their rate.
+        text: The Tkinter Text displaying the metrics.
+
+    Methods:
+        refresh: Redraw the metrics and schedule the next refresh.
+        center_window: Center the window on the screen based on the width and height provided.
+    """
+    def __init__(self, bridge=None, metrics=None):
+        # Initialize the window
+        self.metrics = metrics if metrics is not None else get_metrics()
+        self.bridge = bridge
+        self.presence_sample = None
+        self.root = tk.Toplevel()
+        self.root.title("Debug Metrics")
+        self.center_window(720, 420)
+
+        # Create a read-only text box with a fixed width font for the table
+        self.text = tk.Text(self.root, state=tk.DISABLED, wrap=tk.NONE, font=("Courier", 10))
+        self.text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        self.refresh()
+
+    def refresh(self):
+        """
+        Redraw the metrics, then refresh again after REFRESH_INTERVAL milliseconds.
+        """
+        # The panel is destroyed with the screen that opened it
+        if not self.root.winfo_exists():
+            return
+
+        lines = [f"{'Operation':<18}{'Calls':>9}{'Errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'Max ms':>10}{'Mean ms':>10}"]
+        for name, summary in self.metrics.operations().items():
+            lines.append(f"{name:<18}{summary['calls']:>9}{summary['errors']:>8}"
+                         f"{summary['p50'] * 1000:>10.2f}{summary['p99'] * 1000:>10.2f}"
+                         f"{summary['max'] * 1000:>10.2f}{summary['mean'] * 1000:>10.2f}")
+
+        # Event loop lag, measured on every tick of the GUI
+        lag = self.metrics.loop_lag.labels()
+        lines.append("")
+        lines.append(f"Event loop lag: last {self.metrics.loop_lag_last.labels().value * 1000:.2f} ms, "
+                     f"p50 {lag.quantile(0.50) * 1000:.2f} ms, p99 {lag.quantile(0.99) * 1000:.2f} ms, "
+                     f"max {lag.max * 1000:.2f} ms")
+
+        # Presence stanzas per second, from the growth of their counter since the last refresh
+        presence = self.metrics.metrics.get("xmpp_presence_stanzas_total")
+        if presence is not None:
+            now, count = time.monotonic(), presence.labels().value
+            if self.presence_sample is not None:
+                rate = (count - self.presence_sample[1]) / max(now - self.presence_sample[0], 1e-6)
+                buffered = self.metrics.metrics["xmpp_presence_buffered"].labels().value
+                lines.append(f"Presence stanzas: {count} received, {rate:.0f}/s, {buffered} buffered")
+            self.presence_sample = (now, count)
+        if self.bridge is not None:
+            stats = self.bridge.stats()
+            lines.append(f"GUI ticks: {stats['ticks']} every {stats['tick_interval'] * 1000:.0f} ms, "
+                         f"longest tick {stats['max_tick_duration'] * 1000:.2f} ms")
+
+        # Keep the scroll position while the text is replaced
+        position = self.text.yview()[0]
+        self.text.config(state=tk.NORMAL)
+        self.text.delete(1.0, tk.END)
+        self.text.insert(tk.END, "\n".join(lines))
+        self.text.config(state=tk.DISABLED)
+        self.text.yview_moveto(position)
+
+        self.root.after(REFRESH_INTERVAL, self.refresh)
+
+    def center_window(self, width, height):
+        """
+        Center the window on the screen based on the width and height provided.
+        Calculates the x and y coordinates to position the window in the center of the
+        screen based on the screen width and height.
+        """
+        screen_width = self.root.winfo_screenwidth()        # Get the screen width
+        screen_height = self.root.winfo_screenheight()      # Get the screen height
+
+        # Calculate the x and y coordinates to center the window
+        x = (screen_width // 2) - (width // 2)
+        y = (screen_height // 2) - (height // 2)
+        self.root.geometry(f'{width}x{height}+{x}+{y}')
@@ -1,52 +1,114 @@
+import asyncio
+import time
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk
 from Frontend.status import UpdatePresenceWindow
 from Frontend.new_contact import AddContactWindow
+from Frontend.import_contacts import ImportContactsWindow
+from Frontend.rooms import JoinRoomWindow
+from Frontend.debug import DebugPanel
+from Frontend.notice import NoticeWindow
+from Backend.event_loop import get_event_loop_bridge
+from Frontend.transcript import TranscriptView
+from Backend.metrics import instrument
+from Backend.log import get_logger
+
+log = get_logger("gui")
+
+# Maximum number of messages rendered in the chat view per tick
+MAX_RENDER_PER_TICK = 500
+
+# Application-wide events counted as user activity
+ACTIVITY_SEQUENCES = ("<Any-KeyPress>", "<Motion>")
+
+# Milliseconds without typing before the history is searched
+SEARCH_DELAY = 200
 
 class HomeWindow:
     """
-    The HomeWindow class is used to create a home window for the application.
-    The home window is displayed after the user has successfully logged in.
+    The HomeWindow class is used to create a home screen for the application.
+    The home screen is displayed after the user has successfully logged in.
     """
-    def __init__(self, xmpp_client):
-        self.root = tk.Tk()
+    def __init__(self, router, xmpp_client):
+        # Build the screen in the main window of the application,
+        # the router calls on_close when the window is closed
+        self.router = router
+        self.root = router.root
+        self.frame = tk.Frame(self.root)
         self.root.title("XMPP Chat Home")
         self.client = xmpp_client
         self.root.resizable(False, False)
         self.configure_layout()
         self.center_window(900, 600)
 
-        # Handle the window close event
-        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
-
         # Display the current user's JID and presence
         self.update_user_info()
 
-        # Fetch and display contacts
+        # Fetch and display contacts, then follow the contact list deltas
+        self.contacts_refresh_pending = False
         self.update_contacts_list()
+        self.client.contacts.add_listener(self.on_contacts_changed)
+
+        # Render the received messages once per tick of the event loop
+        self.current_conversation = None
+
+        # Account deletion waiting for the answer of the server
+        self.deletion = None
+
+        # Search of the history planned while the user types, the search being read and its results
+        self.search_job = None
+        self.searching = None
+        self.search_results = []
+        get_event_loop_bridge().add_tick_callback(self.render_pending_messages)
+
+        # Switch to away while the user is idle, any key press or mouse move is activity
+        self.client.presence_scheduler.enable_idle()
+        self.activity_bindings = [(sequence, self.root.bind_all(sequence, self.on_user_activity, add="+"))
+                                  for sequence in ACTIVITY_SEQUENCES]
 
     def configure_layout(self):
         # Create the left-side menu
-        menu_frame = tk.Frame(self.root)
+        menu_frame = tk.Frame(self.frame)
         menu_frame.pack(side=tk.LEFT, fill=tk.Y, padx=10, pady=10)
 
         # Create buttons for the left-side menu
         tk.Button(menu_frame, text="Show Contacts", command=self.show_contacts).pack(fill=tk.X, pady=5)
         tk.Button(menu_frame, text="Add New Contact", command=self.open_add_contact_form).pack(fill=tk.X, pady=5)
-        tk.Button(menu_frame, text="Join Group").pack(fill=tk.X, pady=5)
-        tk.Button(menu_frame, text="Create New Group").pack(fill=tk.X, pady=5)
+        tk.Button(menu_frame, text="Import Contacts", command=self.open_import_contacts_form).pack(fill=tk.X, pady=5)
+        tk.Button(menu_frame, text="Join Group", command=self.open_join_room_form).pack(fill=tk.X, pady=5)
+        tk.Button(menu_frame, text="Create New Group", command=self.open_create_room_form).pack(fill=tk.X, pady=5)
         tk.Button(menu_frame, text="Update Presence", command=self.open_update_presence_window).pack(fill=tk.X, pady=5)
         tk.Button(menu_frame, text="Logout", command=self.logout).pack(fill=tk.X, pady=5)
-        tk.Button(menu_frame, text="Delete My Account", command=self.confirm_account_deletion).pack(fill=tk.X, pady=5)
+        self.delete_button = tk.Button(menu_frame, text="Delete My Account", command=self.confirm_account_deletion)
+        self.delete_button.pack(fill=tk.X, pady=5)
+        tk.Button(menu_frame, text="Debug Metrics", command=self.open_debug_panel).pack(fill=tk.X, pady=5)
 
         # Create a label or text box for displaying the current user's information at the bottom left
         self.user_info_label = tk.Label(menu_frame, text="User: Not logged in", anchor="w")
         self.user_info_label.pack(side=tk.BOTTOM, fill=tk.X, pady=5)
 
+        # Create a label reporting when the session is reconnecting
+        self.connection_status_label = tk.Label(menu_frame, text="", fg="red", anchor="w")
+        self.connection_status_label.pack(side=tk.BOTTOM, fill=tk.X)
+
         # Create the main chat area
-        chat_frame = tk.Frame(self.root)
+        chat_frame = tk.Frame(self.frame)
         chat_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=10, pady=10)
 
+        # Create a search box over the stored history, its results are listed below it
+        self.search_frame = search_frame = tk.Frame(chat_frame)
+        search_frame.pack(anchor=tk.W, fill=tk.X)
+        tk.Label(search_frame, text="Search history:").pack(side=tk.LEFT, padx=5)
+        self.search_entry = tk.Entry(search_frame)
+        self.search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.search_entry.bind("<KeyRelease>", self.on_search_typed)
+        self.search_entry.bind("<Return>", lambda event: self.search_history())
+        self.search_entry.bind("<Escape>", lambda event: self.clear_search())
+        self.search_status_label = tk.Label(search_frame, text="", anchor="e")
+        self.search_status_label.pack(side=tk.RIGHT, padx=5)
+        self.search_results_list = tk.Listbox(chat_frame, height=6)
+        self.search_results_list.bind("<<ListboxSelect>>", self.on_search_result_select)
+
         # Create a frame for the contact selection and info display
         contact_frame = tk.Frame(chat_frame)
         contact_frame.pack(anchor=tk.W, fill=tk.X, pady=5)
@@ -66,14 +128,9 @@ class HomeWindow:
         chat_display_frame = tk.Frame(chat_frame)
         chat_display_frame.pack(fill=tk.BOTH, expand=True, pady=5)
 
-        # Create a text widget for displaying messages with a scrollbar
-        self.message_box = tk.Text(chat_display_frame, state=tk.DISABLED, wrap=tk.WORD)
-        self.message_box.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-
-        # Add a scrollbar to the message box
-        scrollbar = tk.Scrollbar(chat_display_frame, command=self.message_box.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.message_box['yscrollcommand'] = scrollbar.set
+        # Create a virtualized transcript for displaying messages, with a scrollbar
+        self.transcript = TranscriptView(chat_display_frame, self.client.store, self.client.boundjid.bare)
+        self.transcript.pack(fill=tk.BOTH, expand=True)
 
         # Create a frame for the message input area
         message_input_frame = tk.Frame(chat_frame)
@@ -82,9 +139,14 @@ class HomeWindow:
         # Create an entry widget for message input
         self.message_entry = tk.Entry(message_input_frame)
         self.message_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.message_entry.bind("<Return>", lambda event: self.send_message())
 
         # Create a send button
-        tk.Button(message_input_frame, text="Send").pack(side=tk.RIGHT, padx=5)
+        tk.Button(message_input_frame, text="Send", command=self.send_message).pack(side=tk.RIGHT, padx=5)
+
+        # Create a label reporting when the outbound queue is full
+        self.send_status_label = tk.Label(chat_frame, text="", fg="red", anchor="w")
+        self.send_status_label.pack(fill=tk.X)
     
 
     def update_user_info(self):
@@ -100,31 +162,191 @@ class HomeWindow:
             
             # Update the UI with the user's own information
             self.user_info_label.config(text=f"User: {user_jid}\nPresence: {presence_type}\nStatus: {status_message}")
-            print(f"SUCCESS: User information retrieved: {user_jid}, Presence: {presence_type}, Status: {status_message}")
+            log.debug("User information displayed", extra={'jid': user_jid, 'show': presence_type, 'status': status_message})
         except Exception as e:
-            print(f"ERROR: Failed to update user information: {e}")
+            log.error("Failed to update user information: %s", e)
+
+    def show_connection_status(self, message):
+        """
+        Display the state of the connection, an empty message clears it.
+        """
+        self.connection_status_label.config(text=message)
 
     def on_contact_select(self, event):
         """
         Handle the contact selection event.
+        The contact list is kept up to date by on_contacts_changed,
+        so only the selected contact's information and conversation are displayed.
         """
-        # First, update the contacts list
-        self.update_contacts_list()
-        # Then, display the selected contact's information
         self.display_contact_info(event)
+        self.open_conversation(self.contact_selector.get())
+
+
+    def open_conversation(self, peer):
+        """
+        Display the recent messages of the conversation with the given contact.
+        Only a window of the history is rendered by the transcript view,
+        other pages are fetched when scrolling.
+        """
+        self.current_conversation = peer
 
+        # The loaded history already contains the pending messages
+        self.client.conversations.drain(peer)
+        self.transcript.open(peer, self.client.conversations.conversation(peer).history)
+
+
+    def open_conversation_at(self, peer, message):
+        """
+        Display the conversation with the given contact around a stored message,
+        with the message highlighted.
+        """
+        self.current_conversation = peer
+        self.contact_selector.set(peer)
+        self.display_contact_info(None)
+
+        # The pages loaded from the store already contain the pending messages
+        self.client.conversations.drain(peer)
+        self.transcript.open_at(peer, message)
+
+    def on_search_typed(self, event):
+        """
+        Search the history once the user stops typing for SEARCH_DELAY milliseconds.
+        """
+        if event.keysym in ("Return", "Escape"):
+            # Already handled by their own bindings
+            return
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(SEARCH_DELAY, self.search_history)
+
+    @instrument("gui_search_history")
+    def search_history(self):
+        """
+        Search the stored history of the account, on_search_results lists the best matches
+        once they are read.
+        """
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+            self.search_job = None
+        text = self.search_entry.get().strip()
+        if not text or self.client.store is None:
+            self.clear_search(keep_text=True)
+            return
+
+        if self.searching is not None:
+            self.searching.cancel()
+        self.searching = self.client.store.search(self.client.boundjid.bare, text)
+        self.searching.add_done_callback(self.on_search_results)
+
+    def on_search_results(self, searching):
+        """
+        List the results of the last search, the results of the previous ones are dropped.
+        """
+        if searching is not self.searching:
+            return
+        self.searching = None
+        if searching.cancelled() or self.router.current is not self:
+            return
+        if searching.exception() is not None:
+            log.error("Could not search the history: %s", searching.exception())
+            self.search_status_label.config(text="Search failed")
+            return
+
+        self.search_results = searching.result()
+        self.search_results_list.delete(0, tk.END)
+        self.search_results_list.insert(tk.END, *[
+            f"{result.message.peer}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(result.message.timestamp))}"
+            f"  {result.snippet}" for result in self.search_results])
+        self.search_status_label.config(text=f"{len(self.search_results)} results" if self.search_results
+                                        else "No results")
+        if self.search_results:
+            self.search_results_list.pack(fill=tk.X, padx=5, after=self.search_frame)
+        else:
+            self.search_results_list.pack_forget()
+
+    def on_search_result_select(self, event):
+        """
+        Jump to the selected search result in its conversation.
+        """
+        selection = self.search_results_list.curselection()
+        if not selection:
+            return
+        message = self.search_results[selection[0]].message
+        self.open_conversation_at(message.peer, message)
+
+    def clear_search(self, keep_text=False):
+        """
+        Hide the search results, and empty the search box unless keep_text is set.
+        """
+        if not keep_text:
+            self.search_entry.delete(0, tk.END)
+        if self.searching is not None:
+            self.searching.cancel()
+            self.searching = None
+        self.search_results = []
+        self.search_results_list.delete(0, tk.END)
+        self.search_results_list.pack_forget()
+        self.search_status_label.config(text="")
+
+    def send_message(self):
+        """
+        Queue the message typed in the entry for the selected contact.
+        When the outbound queue is full, the text is kept in the entry so
+        the user can send it again once the queue has drained.
+        """
+        body = self.message_entry.get().strip()
+        if not body or self.current_conversation is None:
+            return
 
+        if self.client.send_chat_message(self.current_conversation, body) is None:
+            self.send_status_label.config(text="Too many messages waiting to be sent, please try again")
+            return
+
+        self.send_status_label.config(text="")
+        self.message_entry.delete(0, tk.END)
+
+
+    @instrument("gui_render_messages")
+    def render_pending_messages(self):
+        """
+        Render the messages received in the open conversation since the last tick.
+        A burst of messages is coalesced into a single insert into the transcript,
+        and at most MAX_RENDER_PER_TICK messages are rendered per tick.
+        """
+        if self.current_conversation is None:
+            return
+
+        messages = self.client.conversations.drain(self.current_conversation, MAX_RENDER_PER_TICK)
+        self.transcript.append(messages)
+
+
+    @instrument("gui_contacts_refresh")
     def update_contacts_list(self):
         """
-        Fetch the contacts from the XMPP server and update the dropdown menu.
+        Update the dropdown menu with the contact list maintained by the client.
         """
+        self.contacts_refresh_pending = False
         try:
-            roster = self.client.client_roster
-            contacts = [jid for jid in roster.keys() if jid != str(self.client.boundjid.full).split('/')[0]]
-            self.contact_selector['values'] = contacts
-            print(f"SUCCESS: Contacts retrieved: {contacts}")
+            self.contact_selector['values'] = self.client.contacts.jids
+            log.debug("Contacts list updated", extra={'contacts': len(self.client.contacts)})
         except Exception as e:
-            print(f"ERROR: Failed to retrieve contacts: {e}")
+            log.error("Failed to update contacts: %s", e)
+
+
+    def on_contacts_changed(self, added, removed, changed):
+        """
+        Apply a contact list delta to the GUI.
+        Added and removed contacts are coalesced into a single dropdown refresh
+        on the next idle cycle, and the contact information is only redrawn
+        when the selected contact changed.
+        """
+        if (added or removed) and not self.contacts_refresh_pending:
+            self.contacts_refresh_pending = True
+            self.root.after_idle(self.update_contacts_list)
+
+        selected_contact = self.contact_selector.get()
+        if selected_contact in changed or selected_contact in removed:
+            self.display_contact_info(None)
 
 
     def display_contact_info(self, event):
@@ -136,20 +358,9 @@ class HomeWindow:
 
         # Display the contact information in the text box
         if selected_contact:
-            # Get the presence information for the selected contact
-            roster = self.client.client_roster
-
-            if selected_contact in roster:
-                # Default values
-                presence_value = "Offline"
-                status = "None"
-
-                # Check and iterate through presence information
-                for _, presence in roster.presence(selected_contact).items():
-                    presence_value = presence['show'] or 'Offline'
-                    status = presence['status'] or 'None'
-                    # Only check the first presence value
-                    break  
+            if selected_contact in self.client.contacts:
+                # Get the best presence of the selected contact from the presence index
+                presence_value, status = self.client.get_contact_presence(selected_contact)
 
                 contact_info_text = f"JID: {selected_contact}\nPresence: {presence_value}\nStatus: {status}"
                 self.contact_info.config(state=tk.NORMAL)
@@ -165,25 +376,15 @@ class HomeWindow:
 
     def show_contacts(self):
         """
-        Display all contacts and their details in a messagebox.
+        Display all contacts and their details in a notice.
         """
-        roster = self.client.client_roster
         contacts_info = ""
 
-        for jid in roster.keys():
-            if jid != str(self.client.boundjid.full).split('/')[0]:
-                presence_value = "Offline"
-                status = "None"
-                for _, presence in roster.presence(jid).items():
-                    presence_value = presence['show'] or "Offline"
-                    status = presence['status'] or "None"
-                    break
-                contacts_info += f"JID: {jid}\nPresence: {presence_value}\nStatus: {status}\n\n"
-
-        if contacts_info:
-            messagebox.showinfo("Contacts List", contacts_info)
-        else:
-            messagebox.showinfo("Contacts List", "No contacts found")
+        for jid in self.client.contacts:
+            presence_value, status = self.client.get_contact_presence(jid)
+            contacts_info += f"JID: {jid}\nPresence: {presence_value}\nStatus: {status}\n\n"
+
+        NoticeWindow("Contacts List", contacts_info or "No contacts found", parent=self.root)
 
 
     def open_update_presence_window(self):
@@ -191,60 +392,130 @@ class HomeWindow:
         Open the UpdatePresenceWindow to update the user's
         presence status and custom message.
         """
-        update_presence_window = UpdatePresenceWindow(self.client, self)
-        update_presence_window.root.mainloop()
+        # The Toplevel is pumped together with the home window, no nested mainloop needed
+        UpdatePresenceWindow(self.client, self)
 
 
     def confirm_account_deletion(self):
         """
-        Display confirmation dialogs before proceeding with account deletion.
+        Ask two confirmations before proceeding with account deletion.
+        The confirmations do not wait for the answer, each one opens the next.
         """
-        first_confirm = messagebox.askyesno("Confirm Deletion", "Are you sure you want to delete your account?")
-        if first_confirm:
-            second_confirm = messagebox.askyesno("Confirm Deletion", "This action is irreversible. Are you really sure?")
-            if second_confirm:
-                self.delete_account()
+        def confirm_again():
+            NoticeWindow("Confirm Deletion", "This action is irreversible. Are you really sure?",
+                         on_confirm=self.delete_account, parent=self.root)
+
+        NoticeWindow("Confirm Deletion", "Are you sure you want to delete your account?",
+                     on_confirm=confirm_again, parent=self.root)
 
     def delete_account(self):
         """
-        Delete the user's account and log out if successful.
+        Start deleting the user's account. The request runs on the event loop and
+        on_account_deleted handles its answer, so the GUI keeps responding meanwhile.
         """
-        try:
-            if self.client.delete_my_account():
-                messagebox.showinfo("Account Deleted", "Your account has been successfully deleted.")
-                self.logout()
-            else:
-                messagebox.showerror("Error", "Failed to delete your account. Please try again.")
-        except Exception as e:
-            messagebox.showerror("Error", f"An unexpected error occurred: {e}")
+        if self.deletion is not None or self.router.current is not self:
+            # Already deleting, or confirmed after the session was closed
+            return
+        self.delete_button.config(state=tk.DISABLED)
+        self.show_connection_status("Deleting the account...")
+        self.deletion = asyncio.ensure_future(self.client.delete_my_account())
+        self.deletion.add_done_callback(self.on_account_deleted)
+
+    def on_account_deleted(self, deletion):
+        """
+        Log out once the account is deleted, or let the user try again.
+        The errors reported by the server are already displayed by the client.
+        """
+        self.deletion = None
+        if deletion.cancelled() or self.router.current is not self:
+            # The session was closed meanwhile
+            return
+        self.show_connection_status("")
+        if deletion.exception() is not None:
+            NoticeWindow("Error", f"An unexpected error occurred: {deletion.exception()}", parent=self.root)
+        elif deletion.result():
+            NoticeWindow("Account Deleted", "Your account has been successfully deleted.", parent=self.root)
+            self.logout()
+            return
+        self.delete_button.config(state=tk.NORMAL)
+
+    def open_debug_panel(self):
+        """
+        Open the DebugPanel displaying the handler latencies and the event loop lag.
+        """
+        # The Toplevel is pumped together with the home window, no nested mainloop needed
+        DebugPanel(get_event_loop_bridge())
 
     def open_add_contact_form(self):
         """
         Open the AddContactWindow to add a new contact to the roster.
         """
-        add_contact_window = AddContactWindow(self.client)
-        add_contact_window.root.mainloop()
+        # The Toplevel is pumped together with the home window, no nested mainloop needed
+        AddContactWindow(self.client)
+
+    def open_import_contacts_form(self):
+        """
+        Open the ImportContactsWindow to add many contacts to the roster at once.
+        """
+        # The Toplevel is pumped together with the home window, no nested mainloop needed
+        ImportContactsWindow(self.client)
+
+    def open_join_room_form(self):
+        """
+        Open the JoinRoomWindow to join a group chat room.
+        """
+        # The Toplevel is pumped together with the home window, no nested mainloop needed
+        JoinRoomWindow(self.client)
+
+    def open_create_room_form(self):
+        """
+        Open the JoinRoomWindow to create a group chat room.
+        """
+        JoinRoomWindow(self.client, create=True)
     
+    def close(self):
+        """
+        Stop following the client before the screen is destroyed by the router.
+        """
+        self.client.contacts.remove_listener(self.on_contacts_changed)
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+        get_event_loop_bridge().remove_tick_callback(self.render_pending_messages)
+        self.unbind_activity()
+        self.client.presence_scheduler.disable_idle()
+
+    def unbind_activity(self):
+        """
+        Remove the activity bindings of this window only. unbind_all would also remove
+        the application-wide bindings of the other windows on the same sequences.
+        """
+        for sequence, funcid in self.activity_bindings:
+            script = self.root.bind_all(sequence)
+            kept = "\n".join(line for line in script.split("\n") if funcid not in line)
+            self.root.tk.call('bind', 'all', sequence, kept)
+            self.root.deletecommand(funcid)
+        self.activity_bindings = []
+
+    def on_user_activity(self, event):
+        # Only records the time, the presence scheduler checks the idle time on its own timer
+        self.client.presence_scheduler.activity()
+
     def logout(self):
         """
         Logout the user and disconnect the client from the server.
         """
-        self.client.disconnect()
-        print("INFO: Client disconnected from the server")
-        self.root.destroy()
-        print("INFO: Please wait while tasks are being cleaned up")
+        self.client.logout()
+        log.info("Please wait while tasks are being cleaned up")
         from Frontend.welcome import WelcomeWindow
-        welcome_window = WelcomeWindow()
-        welcome_window.root.mainloop()
+        self.router.show(WelcomeWindow)
 
     def on_close(self):
         """
         Handle the window close event.
         """
-        self.client.disconnect()
-        print("INFO: Client disconnected from the server")
-        self.root.destroy()
-        print("INFO: Please wait while tasks are being cleaned up")
+        self.client.logout()
+        self.router.quit()
+        log.info("Please wait while tasks are being cleaned up")
 
     def center_window(self, width, height):
         """
@@ -0,0 +1,179 @@
+import tkinter as tk
+from tkinter import ttk, filedialog
+from Frontend.notice import NoticeWindow
+from Backend.importer import ContactImport, parse_contacts, DEFAULT_SUBSCRIPTION_RATE
+from Backend.log import get_logger
+
+log = get_logger("gui")
+
+# Milliseconds between two refreshes of the progress
+REFRESH_INTERVAL = 250
+
+# Statuses displayed in the progress summary, with their labels
+PROGRESS_LABELS = (
+    ('pending', "Pending approval"),
+    ('subscribed', "Subscribed"),
+    ('skipped', "Already contacts"),
+    ('refused', "Refused"),
+    ('failed', "Failed"),
+    ('unconfirmed', "No answer"),
+    ('invalid', "Invalid"),
+)
+
+class ImportContactsWindow:
+    """
+    The ImportContactsWindow class is used to create a window for adding many contacts at once.
+    The contacts are pasted in the text box or loaded from a file, one per line or separated
+    by commas; usernames without a domain get the domain of the account.
+
+    The subscription requests are sent by a ContactImport on the event loop, so the window
+    only reads its progress every REFRESH_INTERVAL milliseconds and never waits for the server.
+    Closing the window stops the requests not sent yet.
+
+    Attributes:
+        client: The XMPP client instance the contacts are added to.
+        root: The Tkinter Toplevel window.
+        contacts_text: The Tkinter Text holding the list of contacts.
+        rate_var: The Tkinter IntVar of the subscription requests sent per second.
+        progress_bar: The ttk Progressbar of the settled requests.
+        summary_label: The Tkinter Label with the number of contacts per status.
+        failures_list: The Tkinter Listbox of the contacts that could not be added.
+        importer: The running ContactImport, None before the import starts.
+
+    Methods:
+        initialize_items: Initialize the UI elements of the window.
+        load_file: Load the list of contacts from a file.
+        start_import: Validate the contacts and start sending the subscription requests.
+        refresh: Redraw the progress and schedule the next refresh.
+        center_window: Center the window on the screen based on the width and height provided.
+    """
+    def __init__(self, xmpp_client):
+        self.client = xmpp_client
+        self.importer = None
+        self.root = tk.Toplevel()  # Use Toplevel to create a new window
+        self.root.title("Import Contacts")
+        self.root.resizable(False, False)
+        self.center_window(500, 560)
+
+        self.initialize_items()
+
+        # Stop the import when the window is closed or destroyed with the home screen
+        self.root.bind("<Destroy>", self.on_destroy)
+
+    def initialize_items(self):
+        """
+        Initialize the UI elements of the window.
+        """
+        # Create a text box for the list of contacts and a button to load it from a file
+        tk.Label(self.root, text=f"Contacts, one per line (e.g., user@{self.client.boundjid.domain}):").pack(pady=10)
+        self.contacts_text = tk.Text(self.root, width=55, height=12)
+        self.contacts_text.pack(padx=20)
+        tk.Button(self.root, text="Load From File...", command=self.load_file).pack(pady=5)
+
+        # Create a selector for the rate of the subscription requests
+        rate_frame = tk.Frame(self.root)
+        rate_frame.pack(pady=5)
+        tk.Label(rate_frame, text="Requests per second:").pack(side=tk.LEFT)
+        self.rate_var = tk.IntVar(value=DEFAULT_SUBSCRIPTION_RATE)
+        tk.Spinbox(rate_frame, from_=1, to=100, width=5, textvariable=self.rate_var).pack(side=tk.LEFT, padx=5)
+
+        # Create an "Import" button
+        self.import_button = tk.Button(self.root, text="Import", command=self.start_import)
+        self.import_button.pack(pady=10)
+
+        # Create the progress bar, the summary and the list of failures
+        self.progress_bar = ttk.Progressbar(self.root, length=440, mode='determinate')
+        self.progress_bar.pack(padx=20)
+        self.summary_label = tk.Label(self.root, text="", justify=tk.LEFT, wraplength=440)
+        self.summary_label.pack(pady=5)
+        tk.Label(self.root, text="Not added:").pack()
+        self.failures_list = tk.Listbox(self.root, width=60, height=8)
+        self.failures_list.pack(padx=20, pady=5)
+
+    def load_file(self):
+        """
+        Load the list of contacts from a text or CSV file into the text box.
+        """
+        path = filedialog.askopenfilename(parent=self.root, title="Import Contacts",
+                                          filetypes=[("Contact lists", "*.txt *.csv"), ("All files", "*")])
+        if not path:
+            return
+        try:
+            with open(path, encoding='utf-8') as contacts_file:
+                content = contacts_file.read()
+        except (OSError, UnicodeDecodeError) as e:
+            NoticeWindow("Error", f"Could not read the file: {e}", parent=self.root)
+            return
+        self.contacts_text.delete(1.0, tk.END)
+        self.contacts_text.insert(tk.END, content)
+
+    def start_import(self):
+        """
+        Validate the contacts and start sending the subscription requests.
+        """
+        jids, invalid = parse_contacts(self.contacts_text.get(1.0, tk.END),
+                                       domain=self.client.boundjid.domain, owner=self.client.boundjid.bare)
+        if not jids:
+            NoticeWindow("Invalid Contacts", "There is no valid contact to import.", parent=self.root)
+            return
+        try:
+            rate = self.rate_var.get()
+        except tk.TclError:
+            rate = 0
+        if rate <= 0:
+            NoticeWindow("Invalid Rate", "The number of requests per second must be positive.", parent=self.root)
+            return
+
+        # The requests are sent on the event loop, the window only follows the progress
+        first_import = self.importer is None
+        if not first_import:
+            self.importer.close()
+        self.importer = ContactImport(self.client, rate=rate)
+        self.importer.start(jids, invalid)
+        self.import_button.config(state=tk.DISABLED)
+        self.contacts_text.config(state=tk.DISABLED)
+        log.info("Importing contacts", extra={'contacts': len(jids), 'invalid': len(invalid)})
+        if first_import:
+            self.refresh()
+
+    def refresh(self):
+        """
+        Redraw the progress, then refresh again after REFRESH_INTERVAL milliseconds.
+        """
+        if self.importer is None or not self.root.winfo_exists():
+            return
+
+        progress = self.importer.progress()
+        statuses = progress['statuses']
+        self.progress_bar.config(maximum=max(1, progress['total']), value=progress['settled'])
+        summary = [f"{progress['settled']} of {progress['total']} processed"]
+        summary += [f"{label}: {statuses[status]}" for status, label in PROGRESS_LABELS if statuses[status]]
+        self.summary_label.config(text=" | ".join(summary))
+
+        # Only the failures are listed, the list is rebuilt when it changed
+        failures = [f"{outcome.jid}: {outcome.error or outcome.status}" for outcome in self.importer.failures()]
+        if failures != list(self.failures_list.get(0, tk.END)):
+            self.failures_list.delete(0, tk.END)
+            self.failures_list.insert(tk.END, *failures)
+
+        # Once the requests are sent, the answers of the contacts are still followed
+        if progress['finished'] and self.import_button['state'] == tk.DISABLED:
+            self.import_button.config(state=tk.NORMAL)
+            self.contacts_text.config(state=tk.NORMAL)
+        self.root.after(REFRESH_INTERVAL, self.refresh)
+
+    def on_destroy(self, event):
+        # The event is also received for every child widget
+        if event.widget is self.root and self.importer is not None:
+            self.importer.close()
+
+    def center_window(self, width, height):
+        """
+        Center the window on the screen based on the width and height provided.
+        """
+        screen_width = self.root.winfo_screenwidth()
+        screen_height = self.root.winfo_screenheight()
+
+        x = (screen_width // 2) - (width // 2)
+        y = (screen_height // 2) - (height // 2)
+        self.root.geometry(f'{width}x{height}+{x}+{y}')
@@ -1,22 +1,26 @@
 import tkinter as tk
-from tkinter import messagebox
-from Backend.client import XMPP_Client
+from Backend.manager import get_connection_manager
+from Backend.store import get_message_store
+from Backend.roster_cache import get_roster_cache
+from Frontend.callbacks import TkCallbacks
 
 class LoginForm:
     """
     The LoginForm class is used to create a login form for the application.
     The form contains two input fields for the username and password.
     The user can enter their credentials and submit the form to log in.
-    If the credentials are correct, a success message is displayed.
-    If the credentials are incorrect, an error message is displayed.
-    If one or both fields are empty, a warning message is displayed.
+    If the credentials are correct, the home window replaces the form.
+    If the credentials are incorrect, or a field is invalid, the error is displayed
+    on the status label of the form, which never blocks the event loop like a dialog.
 
     Attributes:
-        - root: The main window of the login form
+        - router: The ScreenRouter displaying the form
+        - root: The main window of the application
+        - frame: The frame holding the items of the form
         - username_entry: The entry field for the username
         - password_entry: The entry field for the password
         - show_password: A boolean flag to toggle password visibility
-        - loading_label: A label to display loading messages
+        - loading_label: The status label of the form, for the progress and the errors
 
     Methods:
         - initialize_items: Initializes the items on the login form (labels, entry fields, buttons)
@@ -24,12 +28,15 @@ class LoginForm:
         - submit_form: Validates the input fields and logs the user in
         - return_to_welcome: Closes the login form and returns to the welcome window
         - center_window: Centers the window on the screen
+        - show_status: Displays a message on the loading label
         - show_authentication_failed: Updates the loading label to show an authentication failure message
     """
 
-    def __init__(self):
-        # Create the main window of the login form
-        self.root = tk.Tk()
+    def __init__(self, router):
+        # Build the login form in the main window of the application
+        self.router = router
+        self.root = router.root
+        self.frame = tk.Frame(self.root)
         self.root.resizable(False, False)
         self.root.title("Login Form")
         self.username_entry = None
@@ -50,7 +57,7 @@ class LoginForm:
         The buttons are used to interact with the form (submit, return, show).
         """
         # Create a frame to hold the form items
-        form_frame = tk.Frame(self.root)
+        form_frame = tk.Frame(self.frame)
         form_frame.pack(pady=20, padx=20, fill=tk.BOTH, expand=True)
 
         # Create a label for the username field
@@ -82,7 +89,7 @@ class LoginForm:
         submit_button.grid(row=0, column=1, padx=10)
 
         # Add a loading label but keep it hidden initially
-        self.loading_label = tk.Label(self.root, text="Authenticating...", font=("Arial", 10))
+        self.loading_label = tk.Label(self.frame, text="Authenticating...", font=("Arial", 10))
         self.loading_label.pack(pady=10)
         self.loading_label.pack_forget()
 
@@ -105,9 +112,8 @@ class LoginForm:
     def submit_form(self):
         """
         Validate the input fields and log the user in.
-        If the username or password is empty, display a warning message.
-        If the credentials are correct, display a success message.
-        If the credentials are incorrect, display an error message.
+        If the username or password is empty or invalid, display the error on the form.
+        The answer of the server is reported by the TkCallbacks of the session.
         """
         # Get the username and password from the entry fields
         username = self.username_entry.get()
@@ -115,35 +121,32 @@ class LoginForm:
         
         # Check if the username or password is empty
         if not username or not password:
-            messagebox.showwarning("Input Error", "Please fill in both fields")
+            self.show_status("Please fill in both fields", "red")
             return
         
         # Check if the username ends with '@alumchat.lol' domain
         if not username.endswith("@alumchat.lol"):
-            messagebox.showerror("Invalid Username", "Username must end with '@alumchat.lol'")
+            self.show_status("Username must end with '@alumchat.lol'", "red")
             return
 
-        # Create an instance of the EchoBot class and connect to the server
-        xmpp = XMPP_Client(username, password, self)
+        # Create a new session for the user in the connection manager
+        manager = get_connection_manager()
+        xmpp = manager.create_session(username, password, ui=TkCallbacks(self), store=get_message_store(),
+                                      roster_cache=get_roster_cache())
 
         # Show the loading label
-        self.loading_label.config(text="Authenticating...", fg="black")  # Reset label text and color
-        self.loading_label.pack()
-        self.loading_label.update_idletasks()
+        self.show_status("Authenticating...")
 
-        # Connect to the server
-        xmpp.connect(disable_starttls=True, use_ssl=False)
-        xmpp.process(forever=False, timeout=10)
+        # Connect to the server, the stream is then serviced by the shared event loop
+        manager.connect(xmpp)
         
 
     def return_to_welcome(self):
         """
         Close the login form and return to the welcome window
         """
-        self.root.destroy()                             # Close the login form
         from Frontend.welcome import WelcomeWindow      # Import the WelcomeWindow class
-        welcome_window = WelcomeWindow()                # Recreate the welcome window
-        welcome_window.root.mainloop()                  # Open the welcome window
+        self.router.show(WelcomeWindow)                 # Replace the login form with the welcome screen
 
 
     def center_window(self, width, height):
@@ -160,10 +163,16 @@ class LoginForm:
         y = (screen_height // 2) - (height // 2)
         self.root.geometry(f'{width}x{height}+{x}+{y}')
 
+    def show_status(self, message, color="black"):
+        """
+        Display a message on the loading label, below the form.
+        """
+        self.loading_label.config(text=message, fg=color)
+        self.loading_label.pack()
+
     def show_authentication_failed(self):
         """
         Update the loading label to show an authentication failure message.
         """
-        self.loading_label.config(text="Authentication Failed. Try again...", fg="red")
-        self.loading_label.update_idletasks()
+        self.show_status("Authentication Failed. Try again...", "red")
 
@@ -1,5 +1,5 @@
 import tkinter as tk
-from tkinter import messagebox
+from Frontend.notice import NoticeWindow
 
 class AddContactWindow:
     """
@@ -12,7 +12,7 @@ class AddContactWindow:
         self.root = tk.Toplevel()  # Use Toplevel to create a new window
         self.root.title("Add New Contact")
         self.root.resizable(False, False)
-        self.center_window(400, 150)
+        self.center_window(400, 170)
 
         self.initialize_items()
 
@@ -26,7 +26,11 @@ class AddContactWindow:
         self.username_entry.pack(pady=5)
 
         # Create an "Add Contact" button
-        tk.Button(self.root, text="Add Contact", command=self.add_contact).pack(pady=20)
+        tk.Button(self.root, text="Add Contact", command=self.add_contact).pack(pady=10)
+
+        # Create the status label of the errors, a modal dialog would block the event loop
+        self.status_label = tk.Label(self.root, text="", fg="red")
+        self.status_label.pack()
 
     def add_contact(self):
         """
@@ -36,16 +40,17 @@ class AddContactWindow:
 
         # Validate that the username ends with '@alumchat.lol'
         if not username.endswith("@alumchat.lol"):
-            messagebox.showerror("Invalid Username", "Username must end with '@alumchat.lol'")
+            self.status_label.config(text="Username must end with '@alumchat.lol'")
             return
 
         # Send the subscription request to add the contact
         try:
             self.client.send_presence_subscription(username)
-            messagebox.showinfo("Success", f"Successfully added {username} to your contacts.")
+            # The contact still has to approve the request, the roster shows it as pending until then
+            NoticeWindow("Request Sent", f"A subscription request was sent to {username}.")
             self.root.destroy()  # Close the window on success
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to add the contact: {str(e)}")
+            self.status_label.config(text=f"Failed to add the contact: {str(e)}")
 
     def center_window(self, width, height):
         """
@@ -0,0 +1,48 @@
+import tkinter as tk
+
+# Width in pixels after which the message of a notice is wrapped
+WRAP_LENGTH = 360
+
+class NoticeWindow:
+    """
+    The NoticeWindow class displays a message, or asks for a confirmation, in a window that
+    nothing waits on. The GUI is pumped by the event loop, so the modal dialogs of
+    tkinter.messagebox would hold every stanza until they are closed; the answer of a
+    confirmation is given to a callback instead.
+
+    Attributes:
+        root: The Tkinter Toplevel window.
+        on_confirm: Called without argument when the user confirms, None for a plain message.
+
+    Methods:
+        initialize_items: Initialize the UI elements of the window.
+        confirm: Close the window and call on_confirm.
+    """
+    def __init__(self, title, message, on_confirm=None, parent=None):
+        self.on_confirm = on_confirm
+        self.root = tk.Toplevel(parent)  # Use Toplevel to create a new window
+        self.root.title(title)
+        self.root.resizable(False, False)
+        if parent is not None:
+            self.root.transient(parent)
+
+        self.initialize_items(message)
+
+    def initialize_items(self, message):
+        """
+        Initialize the UI elements of the window.
+        """
+        tk.Label(self.root, text=message, justify=tk.LEFT, wraplength=WRAP_LENGTH).pack(padx=20, pady=15)
+
+        # Create the "OK" button, or the "Yes" and "No" buttons of a confirmation
+        button_frame = tk.Frame(self.root)
+        button_frame.pack(pady=(0, 10))
+        if self.on_confirm is None:
+            tk.Button(button_frame, text="OK", width=8, command=self.root.destroy).pack()
+        else:
+            tk.Button(button_frame, text="Yes", width=8, command=self.confirm).pack(side=tk.LEFT, padx=5)
+            tk.Button(button_frame, text="No", width=8, command=self.root.destroy).pack(side=tk.LEFT, padx=5)
+
+    def confirm(self):
+        self.root.destroy()
+        self.on_confirm()
@@ -1,6 +1,8 @@
 import tkinter as tk
-from tkinter import messagebox
-from Backend.client import XMPP_Client
+from Backend.manager import get_connection_manager
+from Backend.store import get_message_store
+from Backend.roster_cache import get_roster_cache
+from Frontend.callbacks import TkCallbacks
 
 class RegisterForm:
     """
@@ -8,21 +10,29 @@ class RegisterForm:
     The form contains three input fields for the username, password, and confirm password.
 
     Attributes:
-        - root: The main window of the registration form
+        - router: The ScreenRouter displaying the form
+        - root: The main window of the application
+        - frame: The frame holding the items of the form
         - username_entry: The entry field for the username
         - password_entry: The entry field for the password
         - confirm_password_entry: The entry field for confirming the password
+        - loading_label: The status label of the form, for the progress, the result and the errors
 
     Methods:
         - initialize_items: Initializes the items on the registration form (labels, entry fields, buttons)
         - submit_form: Validates the input fields and creates a new account
         - return_to_welcome: Closes the registration form and returns to the welcome window
         - center_window: Centers the window on the screen
+        - show_status: Displays a message on the loading label
+        - show_registration_succeeded: Updates the loading label once the account is created
+        - show_registration_failed: Updates the loading label to show the registration error
     """
 
-    def __init__(self):
-        # Create the main window of the registration form
-        self.root = tk.Tk()
+    def __init__(self, router):
+        # Build the registration form in the main window of the application
+        self.router = router
+        self.root = router.root
+        self.frame = tk.Frame(self.root)
         self.root.title("Sign Up Form")
         self.root.resizable(False, False)
         self.username_entry = None
@@ -43,7 +53,7 @@ class RegisterForm:
         The buttons are used to interact with the form (register, return).
         """
         # Create a frame to hold the form items
-        form_frame = tk.Frame(self.root)
+        form_frame = tk.Frame(self.frame)
         form_frame.pack(pady=20, padx=20, fill=tk.BOTH, expand=True)
 
         # Create a label for the username field
@@ -77,7 +87,7 @@ class RegisterForm:
         signup_button.grid(row=0, column=2, padx=10)
 
         # Add a loading label but keep it hidden initially
-        self.loading_label = tk.Label(self.root, text="Registering...", font=("Arial", 10))
+        self.loading_label = tk.Label(self.frame, text="Registering...", font=("Arial", 10))
         self.loading_label.pack(pady=10)
         self.loading_label.pack_forget()
 
@@ -99,46 +109,37 @@ class RegisterForm:
 
         # Validate that username ends with '@alumchat.lol'
         if not username.endswith("@alumchat.lol"):
-            messagebox.showerror("Invalid Username", "Username must end with '@alumchat.lol'")
+            self.show_status("Username must end with '@alumchat.lol'", "red")
             return
 
         # Validate that all fields are filled
         if not username or not password or not confirm_password:
-            messagebox.showwarning("Input Error", "Please fill in all fields")
+            self.show_status("Please fill in all fields", "red")
             return
 
         # Validate that password and confirm password match
         if password != confirm_password:
-            messagebox.showerror("Password Mismatch", "Passwords do not match")
+            self.show_status("Passwords do not match", "red")
             return
 
-        # Create an isntance of the Client class
-        xmpp = XMPP_Client(username, password, window=self, register=True)
+        # Create a new registration session in the connection manager
+        manager = get_connection_manager()
+        xmpp = manager.create_session(username, password, ui=TkCallbacks(self), register=True,
+                                      store=get_message_store(), roster_cache=get_roster_cache())
         
         # Show the loading label
-        self.loading_label.config(text="Registering...", fg="black")
-        self.loading_label.pack()
-        self.loading_label.update_idletasks()
-
-        # Register the user with the server
-        # and connect to the server
-        xmpp.connect(disable_starttls=True, use_ssl=False)
-
-        # Register the xep_0077 plugin
-        xmpp.register_plugin('xep_0077')
+        self.show_status("Registering...")
 
-        # Register the user with the server    
-        xmpp.process(forever=False, timeout=10)
+        # Connect to the server, the xep_0077 plugin registers the user
+        manager.connect(xmpp)
 
 
     def return_to_welcome(self):
         """
         Close the registration form and return to the welcome window.
         """
-        self.root.destroy()                         # Close the registration form
         from Frontend.welcome import WelcomeWindow  # Import the WelcomeWindow class
-        welcome_window = WelcomeWindow()            # Create an instance of the WelcomeWindow class
-        welcome_window.root.mainloop()              # Open the welcome window
+        self.router.show(WelcomeWindow)             # Replace the registration form with the welcome screen
 
 
     def center_window(self, width, height):
@@ -155,9 +156,21 @@ class RegisterForm:
         y = (screen_height // 2) - (height // 2)
         self.root.geometry(f'{width}x{height}+{x}+{y}')
 
-    def show_registration_failed(self):
+    def show_status(self, message, color="black"):
+        """
+        Display a message on the loading label, below the form.
+        """
+        self.loading_label.config(text=message, fg=color)
+        self.loading_label.pack()
+
+    def show_registration_succeeded(self, jid):
+        """
+        Update the loading label once the account is created, the session then logs in.
+        """
+        self.show_status(f"Account created for {jid}, logging in...", "green")
+
+    def show_registration_failed(self, reason=None):
         """
         Update the loading label to show a registration failure message.
         """
-        self.loading_label.config(text="Registration Failed... Try again", fg="red")
-        self.loading_label.update_idletasks()
\ No newline at end of file
+        self.show_status(f"Registration Failed: {reason}" if reason else "Registration Failed... Try again", "red")
\ No newline at end of file
@@ -0,0 +1,332 @@
+import asyncio
+import time
+import tkinter as tk
+from slixmpp.exceptions import PresenceError
+from Backend.event_loop import get_event_loop_bridge
+from Backend.rooms import room_jid, ROOM_HISTORY_LIMIT, DEFAULT_HISTORY_STANZAS
+from Backend.metrics import instrument
+from Backend.log import get_logger
+
+log = get_logger("gui")
+
+# Maximum number of room messages rendered per tick
+MAX_RENDER_PER_TICK = 200
+
+# Seconds between two redraws of the occupant list of a busy room
+OCCUPANTS_REFRESH_INTERVAL = 0.5
+
+# History choices of the join form
+HISTORY_LAST = 'last'
+HISTORY_SINCE = 'since'
+HISTORY_NONE = 'none'
+
+
+class JoinRoomWindow:
+    """
+    The JoinRoomWindow class is used to create a window for joining or creating a group chat room.
+    The room is given by its name (the conference service of the account domain is added) or by
+    its full JID; when joining, the user chooses how much of the room history is fetched.
+
+    The join runs on the event loop, the window only handles its result and opens a RoomWindow.
+    Errors are displayed on the status label of the window, never in a modal dialog.
+
+    Attributes:
+        client: The XMPP client instance joining the room.
+        create: Whether the room is created instead of joined.
+        root: The Tkinter Toplevel window.
+        room_entry: The Tkinter Entry of the room name.
+        nick_entry: The Tkinter Entry of the nick in the room.
+        history_var: The Tkinter StringVar of the history choice.
+        history_entry: The Tkinter Entry of the number of messages or minutes of history.
+        joining: The running join, None when no join is in progress.
+        status_label: The Tkinter Label of the errors of the form.
+
+    Methods:
+        initialize_items: Initialize the UI elements of the window.
+        join_room: Validate the form and start joining the room.
+        on_joined: Open the room once joined, or report the error.
+        show_status: Display a message on the status label.
+        center_window: Center the window on the screen based on the width and height provided.
+    """
+    def __init__(self, xmpp_client, create=False):
+        self.client = xmpp_client
+        self.create = create
+        self.joining = None
+        self.root = tk.Toplevel()  # Use Toplevel to create a new window
+        self.root.title("Create New Group" if create else "Join Group")
+        self.root.resizable(False, False)
+        self.center_window(400, 220 if create else 330)
+
+        self.initialize_items()
+
+    def initialize_items(self):
+        """
+        Initialize the UI elements of the window.
+        """
+        # Create the entries for the room and the nick
+        domain = self.client.boundjid.domain
+        tk.Label(self.root, text=f"Room (e.g., room or room@conference.{domain}):").pack(pady=5)
+        self.room_entry = tk.Entry(self.root, width=40)
+        self.room_entry.pack(pady=5)
+        tk.Label(self.root, text="Nickname:").pack()
+        self.nick_entry = tk.Entry(self.root, width=40)
+        self.nick_entry.insert(0, self.client.boundjid.user)
+        self.nick_entry.pack(pady=5)
+
+        # A new room has no history, only joins offer the choice
+        self.history_var = tk.StringVar(value=HISTORY_LAST)
+        if not self.create:
+            history_frame = tk.LabelFrame(self.root, text="History")
+            history_frame.pack(padx=20, pady=5, fill=tk.X)
+            tk.Radiobutton(history_frame, text="Last messages", variable=self.history_var,
+                           value=HISTORY_LAST).grid(row=0, column=0, sticky=tk.W)
+            tk.Radiobutton(history_frame, text="Last minutes", variable=self.history_var,
+                           value=HISTORY_SINCE).grid(row=1, column=0, sticky=tk.W)
+            tk.Radiobutton(history_frame, text="None", variable=self.history_var,
+                           value=HISTORY_NONE).grid(row=2, column=0, sticky=tk.W)
+            self.history_entry = tk.Entry(history_frame, width=8)
+            self.history_entry.insert(0, str(DEFAULT_HISTORY_STANZAS))
+            self.history_entry.grid(row=0, column=1, rowspan=2, padx=10)
+
+        # Create a "Join" or "Create" button
+        self.join_button = tk.Button(self.root, text="Create" if self.create else "Join", command=self.join_room)
+        self.join_button.pack(pady=10)
+
+        # Create the status label of the errors
+        self.status_label = tk.Label(self.root, text="", fg="red", wraplength=360)
+        self.status_label.pack()
+
+    def join_room(self):
+        """
+        Validate the form and start joining or creating the room on the event loop.
+        """
+        name = self.room_entry.get().strip()
+        nick = self.nick_entry.get().strip()
+        if not name or not nick:
+            self.show_status("The room and the nickname are required.")
+            return
+        jid = room_jid(name, self.client.boundjid.domain)
+        if jid in self.client.rooms:
+            self.show_status(f"You are already in {jid}.")
+            return
+
+        if self.create:
+            join = self.client.rooms.create(jid, nick)
+        else:
+            choice = self.history_var.get()
+            amount = 0
+            if choice != HISTORY_NONE:
+                try:
+                    amount = int(self.history_entry.get())
+                except ValueError:
+                    amount = -1
+                if amount < 0:
+                    self.show_status("The history must be a positive number.")
+                    return
+            if choice == HISTORY_SINCE:
+                # Measured by the room on its own clock, the window never keeps more than the history limit
+                join = self.client.rooms.join(jid, nick, seconds=amount * 60, maxstanzas=ROOM_HISTORY_LIMIT)
+            else:
+                join = self.client.rooms.join(jid, nick, maxstanzas=amount)
+
+        self.show_status("")
+        self.join_button.config(state=tk.DISABLED)
+        self.joining = asyncio.ensure_future(join)
+        self.joining.add_done_callback(self.on_joined)
+
+    def on_joined(self, joining):
+        """
+        Open the RoomWindow of the joined room, or let the user try again.
+        """
+        self.joining = None
+        if joining.cancelled():
+            return
+        error = joining.exception()
+        if not self.root.winfo_exists():
+            # The window was closed meanwhile (or the session logged out), nobody waits for the room
+            if error is None:
+                self.client.rooms.leave(joining.result().jid)
+            return
+        self.join_button.config(state=tk.NORMAL)
+
+        if isinstance(error, PresenceError):
+            reason = error.text or error.condition
+            self.show_status(f"The room refused the join: {reason}")
+        elif isinstance(error, asyncio.TimeoutError):
+            self.show_status("The room did not answer, please try again.")
+        elif error is not None:
+            self.show_status(f"An unexpected error occurred: {error}")
+        else:
+            room = joining.result()
+            self.root.destroy()
+            window = RoomWindow(self.client, room)
+            if self.create and not room.created:
+                window.show_status(f"{room.jid} already exists, you joined it.")
+
+    def show_status(self, message):
+        self.status_label.config(text=message)
+
+    def center_window(self, width, height):
+        """
+        Center the window on the screen based on the width and height provided.
+        """
+        screen_width = self.root.winfo_screenwidth()
+        screen_height = self.root.winfo_screenheight()
+
+        x = (screen_width // 2) - (width // 2)
+        y = (screen_height // 2) - (height // 2)
+        self.root.geometry(f'{width}x{height}+{x}+{y}')
+
+
+class RoomWindow:
+    """
+    The RoomWindow class is used to create a window for a joined group chat room.
+    A busy room can receive hundreds of messages and presences per second, so the window
+    never reacts to them one by one: once per tick of the event loop it renders the pending
+    messages of the room with a single insert, keeps at most ROOM_HISTORY_LIMIT lines, and
+    redraws the occupant list only when it changed, at most every OCCUPANTS_REFRESH_INTERVAL.
+    Messages dropped because the window fell behind are reported with a single line.
+
+    Closing the window leaves the room.
+
+    Attributes:
+        client: The XMPP client instance in the room.
+        room: The Room displayed.
+        root: The Tkinter Toplevel window.
+        subject_label: The Tkinter Label with the subject of the room.
+        text: The Tkinter Text displaying the messages.
+        occupants_list: The Tkinter Listbox of the occupant nicks.
+        message_entry: The Tkinter Entry of the message to send.
+        status_label: The Tkinter Label of the notices of the room, such as a send refused.
+
+    Methods:
+        initialize_items: Initialize the UI elements of the window.
+        render: Render the pending messages and the changed occupants.
+        send_message: Send the message typed in the entry to the room.
+        show_status: Display a message on the status label.
+        center_window: Center the window on the screen based on the width and height provided.
+    """
+    def __init__(self, xmpp_client, room):
+        self.client = xmpp_client
+        self.room = room
+        self.root = tk.Toplevel()  # Use Toplevel to create a new window
+        self.root.title(room.jid)
+        self.center_window(700, 500)
+        self.line_count = 0
+        self.dropped = room.dropped
+        self.occupants_version = None
+        self.occupants_refreshed = 0.0
+        self.subject = None
+
+        self.initialize_items()
+
+        # Render the room once per tick of the event loop, and leave it when the window is closed
+        get_event_loop_bridge().add_tick_callback(self.render)
+        self.root.bind("<Destroy>", self.on_destroy)
+
+    def initialize_items(self):
+        """
+        Initialize the UI elements of the window.
+        """
+        # Create the subject label
+        self.subject_label = tk.Label(self.root, text="", anchor=tk.W, wraplength=660)
+        self.subject_label.pack(fill=tk.X, padx=10, pady=5)
+
+        # Create the entry and "Send" button for the messages
+        entry_frame = tk.Frame(self.root)
+        entry_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=10)
+        self.message_entry = tk.Entry(entry_frame)
+        self.message_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.message_entry.bind("<Return>", lambda event: self.send_message())
+        tk.Button(entry_frame, text="Send", command=self.send_message).pack(side=tk.RIGHT, padx=5)
+        self.status_label = tk.Label(self.root, text="", fg="red", anchor=tk.W)
+        self.status_label.pack(side=tk.BOTTOM, fill=tk.X, padx=10)
+
+        # Create the occupant list on the right
+        occupants_frame = tk.Frame(self.root)
+        occupants_frame.pack(side=tk.RIGHT, fill=tk.Y, padx=10)
+        self.occupants_label = tk.Label(occupants_frame, text="Occupants")
+        self.occupants_label.pack()
+        self.occupants_list = tk.Listbox(occupants_frame, width=22)
+        self.occupants_list.pack(fill=tk.Y, expand=True)
+
+        # Create the read-only message view
+        self.text = tk.Text(self.root, state=tk.DISABLED, wrap=tk.WORD)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(10, 0))
+
+    @instrument("gui_render_room")
+    def render(self):
+        """
+        Render the messages received since the last tick and the occupant list when it changed.
+        """
+        room = self.room
+        lines = []
+        if room.dropped != self.dropped:
+            lines.append(f"[{room.dropped - self.dropped} messages skipped]\n")
+            self.dropped = room.dropped
+        lines += [message.format(room.nick) for message in self.client.rooms.drain(room.jid, MAX_RENDER_PER_TICK)]
+        if lines:
+            self.write(lines)
+
+        if room.subject != self.subject:
+            self.subject = room.subject
+            self.subject_label.config(text=f"Subject: {room.subject}" if room.subject else "")
+
+        # A busy room changes its occupants constantly, the list is redrawn at a bounded rate
+        now = time.monotonic()
+        if room.occupants_version != self.occupants_version and now - self.occupants_refreshed >= OCCUPANTS_REFRESH_INTERVAL:
+            self.occupants_version = room.occupants_version
+            self.occupants_refreshed = now
+            self.occupants_list.delete(0, tk.END)
+            self.occupants_list.insert(tk.END, *room.nicks())
+            self.occupants_label.config(text=f"Occupants ({len(room.occupants)})")
+
+    def write(self, lines):
+        """
+        Append the lines with a single insert and drop the oldest ones beyond ROOM_HISTORY_LIMIT.
+        """
+        at_bottom = self.text.yview()[1] >= 1.0
+        self.text.config(state=tk.NORMAL)
+        self.text.insert(tk.END, "".join(lines))
+        self.line_count += sum(line.count('\n') for line in lines)
+        if self.line_count > ROOM_HISTORY_LIMIT:
+            removed = self.line_count - ROOM_HISTORY_LIMIT
+            self.text.delete(1.0, f"{removed + 1}.0")
+            self.line_count = ROOM_HISTORY_LIMIT
+        self.text.config(state=tk.DISABLED)
+        if at_bottom:
+            self.text.see(tk.END)
+
+    def send_message(self):
+        """
+        Send the message typed in the entry, it is displayed when the room echoes it.
+        """
+        body = self.message_entry.get().strip()
+        if not body:
+            return
+        if not self.room.joined:
+            self.show_status("You are not in the room anymore.")
+            return
+        self.show_status("")
+        self.client.rooms.send(self.room.jid, body)
+        self.message_entry.delete(0, tk.END)
+
+    def show_status(self, message):
+        self.status_label.config(text=message)
+
+    def on_destroy(self, event):
+        # The event is also received for every child widget
+        if event.widget is self.root:
+            get_event_loop_bridge().remove_tick_callback(self.render)
+            self.client.rooms.leave(self.room.jid)
+
+    def center_window(self, width, height):
+        """
+        Center the window on the screen based on the width and height provided.
+        """
+        screen_width = self.root.winfo_screenwidth()
+        screen_height = self.root.winfo_screenheight()
+
+        x = (screen_width // 2) - (width // 2)
+        y = (screen_height // 2) - (height // 2)
+        self.root.geometry(f'{width}x{height}+{x}+{y}')
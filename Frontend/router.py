@@ -0,0 +1,85 @@
+import tkinter as tk
+
+
+class ScreenRouter:
+    """
+    The ScreenRouter class owns the single Tk root of the application and displays one
+    screen at a time in it. Navigating builds the new screen in a frame of the same root
+    and destroys the frame of the previous one, so no Tcl interpreter is created or torn
+    down, and the call stack and memory stay flat however many times the user logs in
+    and out.
+
+    A screen is built with the router as its first argument, puts its widgets in its
+    frame attribute, and can define close() to release what it holds (listeners, tick
+    callbacks) before it is destroyed, and on_close() to handle the window being closed.
+
+    Attributes:
+        - root: The Tk root of the application
+        - current: The screen displayed
+
+    Methods:
+        - show: Replace the displayed screen with a new one
+        - close_dialogs: Destroy the Toplevel windows opened by the displayed screen
+        - quit: Close the displayed screen and the application window
+    """
+
+    def __init__(self, root=None):
+        self.root = root if root is not None else tk.Tk()
+        self.current = None
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def show(self, screen_class, *args, **kwargs):
+        """
+        Close the displayed screen and display a new screen_class(router, *args, **kwargs).
+        Returns the new screen.
+        """
+        self._close_current()
+        screen = screen_class(self, *args, **kwargs)
+        screen.frame.pack(fill=tk.BOTH, expand=True)
+        self.current = screen
+        return screen
+
+    def close_dialogs(self):
+        for child in self.root.winfo_children():
+            if isinstance(child, tk.Toplevel):
+                child.destroy()
+
+    def _close_current(self):
+        screen, self.current = self.current, None
+        if screen is None:
+            return
+        self.close_dialogs()
+        if hasattr(screen, 'close'):
+            screen.close()
+        screen.frame.destroy()
+
+    def on_close(self):
+        """
+        Let the displayed screen handle the window being closed, or quit.
+        """
+        if self.current is not None and hasattr(self.current, 'on_close'):
+            self.current.on_close()
+        else:
+            self.quit()
+
+    def quit(self):
+        try:
+            self._close_current()
+            self.root.destroy()
+        except tk.TclError:
+            # The root is already destroyed
+            pass
+
+
+# Router shared by the application
+_router = None
+
+
+def get_screen_router():
+    """
+    Return the router shared by the application, creating the Tk root on first use.
+    """
+    global _router
+    if _router is None:
+        _router = ScreenRouter()
+    return _router
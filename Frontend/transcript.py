@@ -0,0 +1,287 @@
+import asyncio
+import tkinter as tk
+from collections import deque
+from Backend.store import PAGE_SIZE
+from Backend.log import get_logger
+
+log = get_logger("gui")
+
+# Maximum number of messages rendered at the same time
+WINDOW_SIZE = 4 * PAGE_SIZE
+
+# Number of lines displayed above a message reached from a search
+CONTEXT_LINES = 5
+
+
+class TranscriptView:
+    """
+    The TranscriptView class displays a conversation in a Text widget while only keeping a
+    window of messages around the scroll position. Older and newer pages are fetched from the
+    MessageStore when the view reaches the top or the bottom, and the messages falling out of
+    the window on the other side are removed, so memory and redraw time stay flat no matter
+    how long the conversation is. Pages are read without blocking the event loop and
+    rendered once read; the live messages received meanwhile are rendered after them.
+
+    Attributes:
+        - store: The MessageStore holding the history (optional, without it only the live messages are shown)
+        - account: The bare JID of the account owning the history
+        - peer: The bare JID of the contact of the displayed conversation
+        - window_size: Maximum number of messages rendered
+        - page_size: Number of messages fetched per page
+        - frame: The frame holding the Text widget and its scrollbar
+        - text: The Text widget displaying the messages
+        - rendered: Every rendered message and its line count, top to bottom
+        - has_older: Whether older messages can be fetched from the store
+        - at_tail: Whether the newest message of the conversation is rendered
+        - loading: The future of the pages being read from the store, if any
+        - deferred: The live messages received while reading pages
+
+    Methods:
+        - open: Display the newest messages of a conversation
+        - open_at: Display the messages around a message of a conversation, highlighting it
+        - append: Display live messages at the end of the conversation
+        - clear: Remove every message from the view
+    """
+
+    def __init__(self, parent, store=None, account='', window_size=WINDOW_SIZE, page_size=PAGE_SIZE):
+        self.store = store
+        self.account = account
+        self.peer = None
+        self.window_size = window_size
+        self.page_size = page_size
+        self.rendered = deque()
+        self.line_count = 0
+        self.has_older = False
+        self.at_tail = True
+        self.load_scheduled = False
+        self.loading = None
+        self.deferred = []
+
+        # Create the text widget and its scrollbar
+        self.frame = tk.Frame(parent)
+        self.text = tk.Text(self.frame, state=tk.DISABLED, wrap=tk.WORD)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.text.tag_configure("match", background="yellow")
+        self.scrollbar = tk.Scrollbar(self.frame, command=self.text.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text['yscrollcommand'] = self.on_scroll
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def clear(self):
+        """
+        Remove every message from the view.
+        """
+        self.text.config(state=tk.NORMAL)
+        self.text.delete(1.0, tk.END)
+        self.text.config(state=tk.DISABLED)
+        self.rendered.clear()
+        self.line_count = 0
+        self.deferred = []
+
+    def open(self, peer, messages=()):
+        """
+        Display the newest messages of the conversation with a contact.
+        Without a store, the given messages are displayed instead.
+        """
+        self.peer = peer
+        self.clear()
+        self.at_tail = True
+        if self.store is None:
+            self.has_older = False
+            self.insert_bottom(list(messages)[-self.window_size:])
+            self.text.see(tk.END)
+            return
+        self.read(self.store.load_page(self.account, peer, limit=self.page_size), self.render_newest)
+
+    def render_newest(self, messages):
+        self.has_older = len(messages) == self.page_size
+        self.insert_bottom(messages)
+        self.text.see(tk.END)
+
+    def open_at(self, peer, message):
+        """
+        Display the pages of the conversation around a stored message, such as a search
+        result, with the message highlighted and scrolled into view. The older and newer
+        messages are fetched from the store as usual when scrolling away from it.
+        """
+        self.peer = peer
+        self.clear()
+        pages = asyncio.gather(self.store.load_page(self.account, peer, before=message, limit=self.page_size),
+                               self.store.load_page(self.account, peer, after=message, limit=self.page_size))
+        self.read(pages, lambda pages: self.render_around(message, *pages))
+
+    def render_around(self, message, older, newer):
+        self.has_older = len(older) == self.page_size
+        self.at_tail = len(newer) < self.page_size
+
+        self.insert_bottom(older)
+        first_line = self.line_count + 1
+        self.insert_bottom([message] + newer)
+        match_lines = self.rendered[len(older)][1]
+        self.text.tag_add("match", f"{first_line}.0", f"{first_line + match_lines}.0")
+        self.text.yview(f"{max(1, first_line - CONTEXT_LINES)}.0")
+
+    def append(self, messages):
+        """
+        Display live messages of the open conversation.
+        When the view is away from the end of the conversation, they are
+        left in the store and fetched once the user scrolls down to them.
+        """
+        if self.loading is not None:
+            self.deferred.extend(messages)
+            return
+        if not messages or not self.at_tail:
+            return
+
+        # Only follow the new messages if the view was already at the bottom
+        at_bottom = self.text.yview()[1] >= 1.0
+        top_line = self.first_visible_line()
+        self.insert_bottom(messages)
+        removed = self.trim_top()
+        if at_bottom:
+            self.text.see(tk.END)
+        elif removed:
+            # Keep the messages being read in place
+            self.text.yview(f"{max(1, top_line - removed)}.0")
+
+    def on_scroll(self, first, last):
+        """
+        Update the scrollbar and fetch a page when the view reaches the top or the bottom.
+        """
+        self.scrollbar.set(first, last)
+        if self.load_scheduled or self.store is None or self.peer is None:
+            return
+        if float(first) <= 0.0 and self.has_older:
+            # Defer the fetch, the widget is still being redrawn
+            self.load_scheduled = True
+            self.text.after_idle(self.load_older)
+        elif float(last) >= 1.0 and not self.at_tail:
+            self.load_scheduled = True
+            self.text.after_idle(self.load_newer)
+
+    def load_older(self):
+        """
+        Fetch the page preceding the first rendered message and drop
+        the messages falling out of the window at the bottom.
+        """
+        self.load_scheduled = False
+        if not self.rendered or self.loading is not None:
+            return
+        self.read(self.store.load_page(self.account, self.peer, before=self.rendered[0][0], limit=self.page_size),
+                  self.render_older)
+
+    def render_older(self, page):
+        self.has_older = len(page) == self.page_size
+
+        top_line = self.first_visible_line()
+        inserted = self.insert_top(page)
+        self.trim_bottom()
+        self.text.yview(f"{top_line + inserted}.0")
+
+    def load_newer(self):
+        """
+        Fetch the page following the last rendered message and drop
+        the messages falling out of the window at the top.
+        """
+        self.load_scheduled = False
+        if not self.rendered or self.loading is not None:
+            return
+        self.read(self.store.load_page(self.account, self.peer, after=self.rendered[-1][0], limit=self.page_size),
+                  self.render_newer)
+
+    def render_newer(self, page):
+        self.at_tail = len(page) < self.page_size
+
+        self.insert_bottom(page)
+        top_line = self.first_visible_line()
+        removed = self.trim_top()
+        self.text.yview(f"{max(1, top_line - removed)}.0")
+
+    def read(self, pages, render):
+        """
+        Call render with the result of pages, a future of the store, once it is read.
+        A read still in progress is dropped, its pages belong to a previous position.
+        """
+        if self.loading is not None:
+            self.loading.cancel()
+        self.loading = pages
+        pages.add_done_callback(lambda done: self.on_read(done, render))
+
+    def on_read(self, pages, render):
+        if pages is not self.loading:
+            return
+        self.loading = None
+        deferred, self.deferred = self.deferred, []
+        if pages.cancelled() or not self.text.winfo_exists():
+            return
+        if pages.exception() is not None:
+            log.error("Could not read the history: %s", pages.exception(), extra={'peer': self.peer})
+        else:
+            render(pages.result())
+        # The live messages were received after the pages were asked, none of them is in the pages
+        self.append(deferred)
+
+    def first_visible_line(self):
+        """
+        Return the number of the first line visible in the view.
+        """
+        return int(self.text.index("@0,0").split('.')[0])
+
+    def insert_top(self, messages):
+        """
+        Render messages above the first rendered one and return the number of lines inserted.
+        """
+        lines = [message.format() for message in messages]
+        counts = [line.count('\n') for line in lines]
+        self.write(1.0, "".join(lines))
+        self.rendered.extendleft(reversed(list(zip(messages, counts))))
+        self.line_count += sum(counts)
+        return sum(counts)
+
+    def insert_bottom(self, messages):
+        """
+        Render messages below the last rendered one, with a single insert.
+        """
+        lines = [message.format() for message in messages]
+        counts = [line.count('\n') for line in lines]
+        self.write(tk.END, "".join(lines))
+        self.rendered.extend(zip(messages, counts))
+        self.line_count += sum(counts)
+
+    def trim_top(self):
+        """
+        Remove the oldest rendered messages beyond the window size and return the number of lines removed.
+        """
+        removed = 0
+        while len(self.rendered) > self.window_size:
+            removed += self.rendered.popleft()[1]
+            self.has_older = True
+        if removed:
+            self.delete(1.0, f"{removed + 1}.0")
+            self.line_count -= removed
+        return removed
+
+    def trim_bottom(self):
+        """
+        Remove the newest rendered messages beyond the window size.
+        """
+        removed = 0
+        while len(self.rendered) > self.window_size:
+            removed += self.rendered.pop()[1]
+            self.at_tail = False
+        if removed:
+            self.delete(f"{self.line_count - removed + 1}.0", tk.END)
+            self.line_count -= removed
+
+    def write(self, index, text):
+        if text:
+            self.text.config(state=tk.NORMAL)
+            self.text.insert(index, text)
+            self.text.config(state=tk.DISABLED)
+
+    def delete(self, start, end):
+        self.text.config(state=tk.NORMAL)
+        self.text.delete(start, end)
+        self.text.config(state=tk.DISABLED)
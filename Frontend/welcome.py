@@ -2,8 +2,8 @@ import tkinter as tk
 
 class WelcomeWindow:
     """
-    This class represents the welcome window of the application.
-    This window will be the first thing the user sees when they run the application.
+    This class represents the welcome screen of the application.
+    This screen will be the first thing the user sees when they run the application.
 
     The window contains the following buttons:
         - Register: Opens the registration form
@@ -11,7 +11,9 @@ class WelcomeWindow:
         - Quit: Closes the application
 
     Attributes:
+        - router: The ScreenRouter displaying the screen
         - root: The main window of the application
+        - frame: The frame holding the items of the screen
 
     Methods:
         - initialize_items: Initializes the items on the window (labels, buttons)
@@ -20,9 +22,11 @@ class WelcomeWindow:
         - center_window: Centers the window on the screen
     """
 
-    def __init__(self):
-        # Create the main window of the application
-        self.root = tk.Tk()
+    def __init__(self, router):
+        # Build the screen in the main window of the application
+        self.router = router
+        self.root = router.root
+        self.frame = tk.Frame(self.root)
         self.root.title("XMPP Chat App")
         self.center_window(300, 250)
         self.root.resizable(False, False)
@@ -37,11 +41,11 @@ class WelcomeWindow:
         The buttons are used to interact with the application (register, login, quit).
         """
         # Create a label to display a welcome message
-        label = tk.Label(self.root, text="Welcome to XMPP Chat", font=("Arial", 14))
+        label = tk.Label(self.frame, text="Welcome to XMPP Chat", font=("Arial", 14))
         label.pack(pady=20)
 
         # Create a frame to hold the buttons
-        button_frame = tk.Frame(self.root)
+        button_frame = tk.Frame(self.frame)
         button_frame.pack(pady=10)
 
         # Create a login button that calls the open_login_form method
@@ -53,23 +57,19 @@ class WelcomeWindow:
         register_button.grid(row=1, column=0, padx=10, pady=10)
 
         # Create a quit button that closes the application
-        quit_button = tk.Button(button_frame, text="Quit", command=self.root.destroy) # Using destroy method to close the window safely
+        quit_button = tk.Button(button_frame, text="Quit", command=self.router.quit) # Close the application window safely
         quit_button.grid(row=2, column=0, columnspan=2, pady=10)
 
     def open_register_form(self):
-        self.root.destroy()                         # Close the welcome window
         from Frontend.register import RegisterForm  # Import the RegisterForm class
-        register_form = RegisterForm()              # Create an instance of the RegisterForm class
-        register_form.root.mainloop()               # Open the registration form
+        self.router.show(RegisterForm)              # Replace the welcome screen with the registration form
 
     def open_login_form(self):
         """
         Open the login form when the login button is clicked.
         """
-        self.root.destroy()                     # Close the welcome window
         from Frontend.login import LoginForm    # Import the LoginForm class
-        login_form = LoginForm()                # Create an instance of the LoginForm class
-        login_form.root.mainloop()              # Open the login form
+        self.router.show(LoginForm)             # Replace the welcome screen with the login form
 
     def center_window(self, width, height):
         """
@@ -1,26 +1,194 @@
-from Frontend.welcome import WelcomeWindow
+# Only the modules needed by the welcome screen are imported here: Slixmpp and the
+# session storage are loaded in the background once the first window is shown
+from Backend.event_loop import get_event_loop_bridge, DEFAULT_TICK_INTERVAL
+from Backend.log import get_logger, configure_logging, shutdown_logging, DEFAULT_LOG_LEVEL
+import argparse
+import getpass
+import json
+import os
 import platform
+import sys
+import time
 import asyncio
 
+log = get_logger("app")
+
+def parse_args():
+    """
+    Parse the command line arguments of the application.
+    """
+    parser = argparse.ArgumentParser(description="XMPP Chat Client")
+    parser.add_argument("--tick-interval", type=float, default=DEFAULT_TICK_INTERVAL * 1000,
+                        help="Milliseconds between two GUI refreshes of the event loop (default: %(default)s)")
+    parser.add_argument("--headless", action="store_true",
+                        help="Run a single session without the GUI (requires --jid)")
+    parser.add_argument("--jid", help="JID of the account used in headless mode")
+    parser.add_argument("--password",
+                        help="Password of the account (defaults to the XMPP_PASSWORD environment variable or a prompt)")
+    parser.add_argument("--register", action="store_true",
+                        help="Create the account on the server before logging in (headless mode)")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve the metrics in the Prometheus text format on this port (headless mode)")
+    parser.add_argument("--metrics-host", default="127.0.0.1",
+                        help="Address the metrics are served on (default: %(default)s)")
+    parser.add_argument("--log-level", default=DEFAULT_LOG_LEVEL,
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Lowest level of the messages logged (default: %(default)s)")
+    parser.add_argument("--log-format", default="text", choices=["text", "json"],
+                        help="Format of the log lines (default: %(default)s)")
+    parser.add_argument("--log-file", help="File the log is written to instead of the standard error")
+    parser.add_argument("--provision", metavar="CSV",
+                        help="Create the accounts listed in a CSV file (username,password) and exit, without the GUI")
+    parser.add_argument("--domain", default="alumchat.lol",
+                        help="Domain of the provisioned usernames without one (default: %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=10,
+                        help="Accounts registered at the same time when provisioning (default: %(default)s)")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="Retries of a registration the server does not answer (default: %(default)s)")
+    parser.add_argument("--report", help="JSON file the provisioning report is written to")
+    parser.add_argument("--no-prewarm", action="store_true",
+                        help="Load the XMPP backend when the login starts instead of in the background")
+    # Used by Benchmarks.startup: report the startup milestones as JSON and exit
+    parser.add_argument("--startup-probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.headless and not args.jid:
+        parser.error("--headless requires --jid")
+    return args
+
+def close_storage():
+    """
+    Close the local storage of the sessions.
+    """
+    from Backend.store import close_message_store
+    from Backend.roster_cache import close_roster_cache
+    close_message_store()
+    close_roster_cache()
+
+def report_startup(probe):
+    """
+    Write the startup milestones as a JSON line, for Benchmarks.startup.
+    """
+    print(json.dumps(probe), flush=True)
+
+def run_gui(args):
+    """
+    Create the welcome window and pump it from the asyncio event loop.
+    """
+    probe = {'imports_started': time.time()} if args.startup_probe else None
+    from Frontend.welcome import WelcomeWindow
+    from Frontend.router import get_screen_router
+
+    # Configure the tick budget of the GUI pump
+    bridge = get_event_loop_bridge(args.tick_interval / 1000)
+    if probe is not None:
+        probe['imports_done'] = time.time()
+        probe['slixmpp_before_window'] = 'slixmpp' in sys.modules
+
+    try:
+        router = get_screen_router()
+    except Exception as e:
+        # Without a display only the imports can be measured
+        if probe is None:
+            raise
+        probe['error'] = str(e)
+        report_startup(probe)
+        return 1
+
+    # A single Tk root is pumped, the screens are swapped inside it
+    router.show(WelcomeWindow)
+    bridge.attach(router.root)
+
+    if probe is not None:
+        # Draw the window once, then wait for the backend to be loaded in the background
+        router.root.update()
+        probe['first_window'] = time.time()
+        probe['slixmpp_before_window'] = 'slixmpp' in sys.modules
+        if not args.no_prewarm:
+            from Backend.prewarm import get_prewarmer
+            prewarmer = get_prewarmer()
+            prewarmer.start()
+            prewarmer.wait()
+            probe['backend_ready'] = time.time()
+        report_startup(probe)
+        router.quit()
+        return 0
+
+    if not args.no_prewarm:
+        # The window is on screen after the first tick, load the backend meanwhile
+        from Backend.prewarm import get_prewarmer
+        asyncio.get_event_loop().call_later(bridge.tick_interval, get_prewarmer().start)
+
+    log.info("Starting the asyncio event loop")
+    bridge.run()
+    log.info("Event loop stopped", extra=bridge.stats())
+    close_storage()
+    return 0
+
+def run_headless(args, loop):
+    """
+    Run a single XMPP session without importing Tkinter.
+    """
+    from Backend.headless import run_headless as run_session
+    from Backend.manager import get_connection_manager
+
+    password = args.password or os.environ.get("XMPP_PASSWORD") or getpass.getpass(f"Password for {args.jid}: ")
+
+    log.info("Starting the asyncio event loop in headless mode")
+    try:
+        return loop.run_until_complete(run_session(args.jid, password, register=args.register,
+                                                   metrics_host=args.metrics_host,
+                                                   metrics_port=args.metrics_port))
+    except KeyboardInterrupt:
+        log.info("Interrupted, closing the sessions")
+        get_connection_manager().close_all()
+        loop.run_until_complete(asyncio.sleep(0.5))
+        return 0
+    finally:
+        close_storage()
+
+def run_provisioning(args, loop):
+    """
+    Create the accounts of a CSV file without importing Tkinter.
+    """
+    from Backend.provisioning import run_provisioning as provision
+
+    log.info("Starting the asyncio event loop in provisioning mode")
+    try:
+        return loop.run_until_complete(provision(args.provision, args.domain, concurrency=args.concurrency,
+                                                 retries=args.retries, report=args.report))
+    except (OSError, ValueError) as e:
+        log.error("Could not read the accounts: %s", e)
+        return 1
+    except KeyboardInterrupt:
+        log.info("Interrupted, the accounts already created are kept")
+        return 1
+
 def main():
+    args = parse_args()
+
+    # Log through a queue, so the event loop never waits on the terminal
+    configure_logging(args.log_level, json_output=args.log_format == "json", filename=args.log_file)
+
     if platform.system() == 'Windows':
         # On Windows, the proactor event loop is necessary to listen for
         # events on stdin while running the asyncio event loop.
-        print("INFO: The current platform is Windows")
+        log.info("The current platform is Windows")
         if hasattr(asyncio, 'WindowsSelectorEventLoopPolicy'):
             asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-    loop = asyncio.get_event_loop()
-
-    if loop.is_running():
-        print("INFO: The asyncio event loop is already running")
-    else:
-        print("INFO: Starting the asyncio event loop")
-        loop.run_until_complete(asyncio.sleep(0))
+    # Create the event loop shared by Slixmpp and Tkinter
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
 
-    # Create the welcome window and start the main loop
-    welcome_window = WelcomeWindow()
-    welcome_window.root.mainloop()
+    try:
+        if args.provision:
+            return run_provisioning(args, loop)
+        if args.headless:
+            return run_headless(args, loop)
+        return run_gui(args)
+    finally:
+        shutdown_logging()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    raise SystemExit(main())
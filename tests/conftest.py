@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from Benchmarks.server import LocalXMPPServer
+from Backend.manager import ConnectionManager
+
+# Seconds a scenario may run before the test fails
+SCENARIO_TIMEOUT = 30
+
+# Password of the accounts created by the tests
+PASSWORD = 'secret'
+
+
+class LocalSessions:
+    """
+    The LocalSessions class gives a scenario a LocalXMPPServer listening on the loopback
+    interface and a ConnectionManager to log its accounts in.
+
+    Attributes:
+        - server: The LocalXMPPServer of the scenario
+        - address: The (host, port) address the server listens on
+        - manager: The ConnectionManager of the sessions opened by the scenario
+
+    Methods:
+        - login: Create an account if needed and return its session once started
+    """
+
+    def __init__(self, server, address):
+        self.server = server
+        self.address = address
+        self.manager = ConnectionManager()
+
+    async def login(self, username, **kwargs):
+        jid = f"{username}@{self.server.domain}"
+        if jid not in self.server.accounts:
+            self.server.add_account(username, PASSWORD)
+        client = self.manager.create_session(jid, PASSWORD, **kwargs)
+        assert await self.manager.open_session(client, address=self.address)
+        return client
+
+
+async def wait_until(condition, timeout=5.0, interval=0.02):
+    """
+    Wait for condition() to become true, failing the test after timeout seconds.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        if loop.time() > deadline:
+            pytest.fail("Condition not met in time")
+        await asyncio.sleep(interval)
+
+
+@pytest.fixture
+def local_xmpp():
+    """
+    Return a function running a scenario, a coroutine function taking a LocalSessions,
+    against a fresh local server; the sessions and the server are closed afterwards.
+    """
+    def run(scenario, timeout=SCENARIO_TIMEOUT):
+        async def main():
+            server = LocalXMPPServer(scram_iterations=64)
+            sessions = LocalSessions(server, await server.start('127.0.0.1'))
+            try:
+                return await asyncio.wait_for(scenario(sessions), timeout)
+            finally:
+                sessions.manager.close_all()
+                await asyncio.sleep(0.1)
+                await server.stop()
+
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1,81 @@
+import asyncio
+from Backend.importer import (ContactImport, parse_contacts, PENDING, SUBSCRIBED, REFUSED, FAILED,
+                              SKIPPED, INVALID, STATUSES)
+from conftest import PASSWORD, wait_until
+
+
+def check_counts(importer):
+    """
+    The counts kept by the import match the statuses of its outcomes.
+    """
+    progress = importer.progress()
+    assert progress['statuses'] == {status: sum(outcome.status == status for outcome in importer.outcomes.values())
+                                    for status in STATUSES}
+    assert sum(progress['statuses'].values()) == progress['total']
+
+
+def test_parse_contacts_completes_and_rejects_entries():
+    jids, invalid = parse_contacts("bob\ncarol@localhost, bob ; alice@localhost\nbad@@x", 'localhost',
+                                   'alice@localhost')
+    assert jids == ['bob@localhost', 'carol@localhost']
+    assert [entry for entry, reason in invalid] == ['alice@localhost', 'bad@@x']
+
+
+def test_import_tracks_every_contact_to_its_outcome(local_xmpp):
+    async def scenario(sessions):
+        server = sessions.server
+        server.add_account('alice', PASSWORD)
+        server.add_contact('alice@localhost', 'dave@localhost')  # Already subscribed, skipped
+        alice = await sessions.login('alice')
+        await sessions.login('bob')  # Online, approves the request automatically
+        erin = await sessions.login('erin')
+        server.add_account('carol', PASSWORD)  # Offline, the request stays pending
+
+        # Erin refuses the request
+        erin.auto_authorize = None
+        erin.add_event_handler('presence_subscribe',
+                               lambda presence: erin.send_presence(pto=presence['from'].bare, ptype='unsubscribed'))
+
+        jids, invalid = parse_contacts("bob carol dave erin bad@@x", 'localhost', 'alice@localhost')
+        importer = ContactImport(alice, rate=50, ack_timeout=5)
+        task = importer.start(jids, invalid)
+        check_counts(importer)
+        await task
+        await wait_until(lambda: importer.outcomes['bob@localhost'].status == SUBSCRIBED
+                         and importer.outcomes['erin@localhost'].status == REFUSED)
+        check_counts(importer)
+        importer.close()
+        return importer
+
+    importer = local_xmpp(scenario)
+    statuses = {jid: outcome.status for jid, outcome in importer.outcomes.items()}
+    assert statuses == {'bad@@x': INVALID, 'bob@localhost': SUBSCRIBED, 'carol@localhost': PENDING,
+                        'dave@localhost': SKIPPED, 'erin@localhost': REFUSED}
+    assert [outcome.jid for outcome in importer.failures()] == ['bad@@x', 'erin@localhost']
+    progress = importer.progress()
+    assert progress['settled'] == progress['total'] == 5
+    assert progress['finished']
+
+
+def test_cancelled_import_fails_the_queued_contacts(local_xmpp):
+    async def scenario(sessions):
+        alice = await sessions.login('alice')
+        importer = ContactImport(alice, rate=20, burst=2, ack_timeout=5)
+        task = importer.start([f"user{i}@localhost" for i in range(20)])
+        await asyncio.sleep(0.2)
+        importer.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        check_counts(importer)
+        importer.close()
+        return importer
+
+    importer = local_xmpp(scenario)
+    statuses = [outcome.status for outcome in importer.outcomes.values()]
+    # The first requests were sent and acknowledged, the others never left
+    assert statuses[0] == PENDING
+    assert statuses[-1] == FAILED
+    assert statuses == sorted(statuses, key=lambda status: status == FAILED)
+    assert all(outcome.error == "Import cancelled" for outcome in importer.failures())
@@ -0,0 +1,64 @@
+from Backend.presence import PresenceIndex
+
+
+def test_highest_priority_wins_over_show():
+    index = PresenceIndex()
+    index.set_available('bob@localhost', 'phone', 'chat', 'On the go', priority=0)
+    index.set_available('bob@localhost', 'laptop', 'away', 'At lunch', priority=5)
+
+    best = index.get('bob@localhost')
+    assert best.resource == 'laptop'
+    assert index.describe('bob@localhost') == ('Away', 'At lunch')
+
+
+def test_most_available_show_wins_at_equal_priority():
+    index = PresenceIndex()
+    assert index.set_available('bob@localhost', 'laptop', 'dnd')
+    assert index.set_available('bob@localhost', 'phone', '')
+    # Less available than the phone, the best presence stays the same
+    assert not index.set_available('bob@localhost', 'tablet', 'xa')
+
+    assert index.get('bob@localhost').resource == 'phone'
+
+
+def test_best_resource_degrading_elects_another():
+    index = PresenceIndex()
+    index.set_available('bob@localhost', 'laptop', '', priority=1)
+    index.set_available('bob@localhost', 'phone', 'away', priority=1)
+
+    assert index.set_available('bob@localhost', 'laptop', 'xa', priority=1)
+    assert index.get('bob@localhost').resource == 'phone'
+
+
+def test_best_resource_going_offline_elects_another():
+    index = PresenceIndex()
+    index.set_available('bob@localhost', 'laptop', 'chat')
+    index.set_available('bob@localhost', 'phone', 'away')
+
+    # Another resource leaving does not change the best presence
+    index.set_available('bob@localhost', 'tablet', 'xa')
+    assert not index.set_unavailable('bob@localhost', 'tablet')
+
+    assert index.set_unavailable('bob@localhost', 'laptop')
+    assert index.get('bob@localhost').resource == 'phone'
+
+    assert index.set_unavailable('bob@localhost', 'phone')
+    assert 'bob@localhost' not in index
+    assert index.describe('bob@localhost') == ('Offline', 'None')
+
+
+def test_unknown_resource_going_offline_changes_nothing():
+    index = PresenceIndex()
+    assert not index.set_unavailable('bob@localhost', 'laptop')
+    index.set_available('bob@localhost', 'laptop')
+    assert not index.set_unavailable('bob@localhost', 'phone')
+    assert index.get('bob@localhost').resource == 'laptop'
+
+
+def test_clear_returns_the_contacts_online():
+    index = PresenceIndex()
+    index.set_available('bob@localhost', 'laptop')
+    index.set_available('carol@localhost', 'phone')
+
+    assert sorted(index.clear()) == ['bob@localhost', 'carol@localhost']
+    assert index.get('bob@localhost') is None
@@ -0,0 +1,77 @@
+import time
+from Backend.rooms import Room, RoomMessage
+from conftest import wait_until
+
+
+def history_message(body, nick='bob'):
+    now = time.time()
+    return RoomMessage('team@conference.localhost', nick, body, now, True, now)
+
+
+def bodies(room):
+    return [message.body for message in room.history]
+
+
+def test_rejoin_keeps_only_the_history_after_the_messages_received():
+    room = Room('team@conference.localhost', 'alice')
+    for body in ("hello", "lunch?", "hello"):
+        room.append(history_message(body))
+    assert room.start_rejoin() is not None
+
+    # The room sends an older message, the overlap, then the missed messages
+    for body in ("before", "hello", "lunch?", "hello", "hello", "missed"):
+        assert room.defer_replayed(history_message(body))
+    assert bodies(room) == ["hello", "lunch?", "hello"]
+
+    assert room.end_rejoin() == 2
+    assert bodies(room) == ["hello", "lunch?", "hello", "hello", "missed"]
+    assert not room.rejoining
+
+
+def test_rejoin_without_overlap_keeps_the_whole_history():
+    room = Room('team@conference.localhost', 'alice')
+    room.append(history_message("hello"))
+    room.start_rejoin()
+    for body in ("missed", "again"):
+        room.defer_replayed(history_message(body))
+    assert room.end_rejoin() == 2
+    assert bodies(room) == ["hello", "missed", "again"]
+
+    # A room never heard from before keeps everything it sends
+    empty = Room('other@conference.localhost', 'alice')
+    assert empty.start_rejoin() is None
+    empty.defer_replayed(history_message("first"))
+    assert empty.end_rejoin() == 1
+
+
+def test_live_messages_are_not_held_by_a_rejoin():
+    room = Room('team@conference.localhost', 'alice')
+    room.start_rejoin()
+    now = time.time()
+    assert not room.defer_replayed(RoomMessage(room.jid, 'bob', "live", now, False, now))
+
+
+def test_rejoin_after_a_lost_session_replays_only_the_missed_messages(local_xmpp):
+    async def scenario(sessions):
+        server = sessions.server
+        jid = server.add_room('team', occupants=1)
+        for i in range(30):
+            server.room_say(jid, 'user1', f"old {i}")
+
+        alice = await sessions.login('alice')
+        room = await alice.rooms.join(jid, 'alice', maxstanzas=20)
+        for i in range(3):
+            server.room_say(jid, 'user1', f"live {i}")
+        await wait_until(lambda: bodies(room)[-1:] == ["live 2"])
+
+        # The stream is lost, the session is restarted and the room joined again
+        alice.disconnect()
+        await wait_until(lambda: 'alice' not in server.rooms[jid].occupants)
+        for body in ("missed 0", "missed 1", "live 0"):
+            server.room_say(jid, 'user1', body)
+        await wait_until(lambda: 'alice' in server.rooms[jid].occupants and bodies(room)[-1:] == ["live 0"])
+        return room
+
+    room = local_xmpp(scenario)
+    assert bodies(room) == ([f"old {i}" for i in range(10, 30)] + ["live 0", "live 1", "live 2"]
+                            + ["missed 0", "missed 1", "live 0"])
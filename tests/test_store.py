@@ -0,0 +1,99 @@
+import asyncio
+import time
+from Backend.messages import ChatMessage, MessageRouter
+from Backend.store import MessageStore, FLUSH_BATCH_SIZE, FLUSH_INTERVAL
+
+
+def messages(peer, count, start, prefix='message'):
+    return [ChatMessage(peer, f"{prefix} {i}", start + i, 'in') for i in range(count)]
+
+
+def test_messages_are_written_in_batches(tmp_path, monkeypatch):
+    batches = []
+    write = MessageStore._write
+
+    def count_batch(self, rows):
+        batches.append(len(rows))
+        return write(self, rows)
+
+    monkeypatch.setattr(MessageStore, '_write', count_batch)
+
+    async def scenario():
+        history = MessageStore(str(tmp_path / "history.db"))
+        for message in messages('bob@localhost', FLUSH_BATCH_SIZE - 1, time.time()):
+            history.add('alice@localhost', message)
+        # Below the batch size, the messages wait for the flush interval
+        assert len(history.pending) == FLUSH_BATCH_SIZE - 1
+
+        history.add('alice@localhost', ChatMessage('bob@localhost', "last of the batch", time.time() + 1000, 'in'))
+        assert history.pending == []
+
+        history.add('alice@localhost', ChatMessage('bob@localhost', "after the batch", time.time() + 2000, 'in'))
+        await asyncio.sleep(FLUSH_INTERVAL * 2)
+        page = await history.load_page('alice@localhost', 'bob@localhost', limit=3)
+        history.close()
+        return page
+
+    page = asyncio.run(scenario())
+    assert batches[:2] == [FLUSH_BATCH_SIZE, 1]
+    assert [message.body for message in page] == [f"message {FLUSH_BATCH_SIZE - 2}", "last of the batch",
+                                                  "after the batch"]
+
+
+def test_sessions_sharing_the_history_never_collide(tmp_path):
+    path = str(tmp_path / "history.db")
+
+    async def scenario():
+        first, second = MessageStore(path), MessageStore(path)
+        router = MessageRouter(first, 'alice@localhost')
+        start = time.time()
+
+        # Both stores queue messages before either writes, then write their batches in turn
+        recorded = [router.record(message) for message in messages('bob@localhost', 5, start, 'first')]
+        for message in messages('bob@localhost', 5, start + 0.5, 'second'):
+            second.add('alice@localhost', message)
+        await asyncio.wrap_future(second.flush())
+        await asyncio.wrap_future(first.flush())
+
+        page = await first.load_page('alice@localhost', 'bob@localhost', limit=20)
+        # A message held in memory pages from its position even without identifier
+        older = await first.load_page('alice@localhost', 'bob@localhost', before=recorded[2], limit=20)
+        newer = await first.load_page('alice@localhost', 'bob@localhost', after=recorded[2], limit=20)
+        first.close()
+        second.close()
+        return recorded, page, older, newer
+
+    recorded, page, older, newer = asyncio.run(scenario())
+    # The messages held in memory are never renumbered
+    assert [message.id for message in recorded] == [None] * 5
+    ids = [message.id for message in page]
+    assert len(set(ids)) == 10
+    assert [message.body for message in page] == [f"{name} {i}" for i in range(5) for name in ("first", "second")]
+    assert [message.body for message in older] == ["first 0", "second 0", "first 1", "second 1"]
+    assert [message.body for message in newer][0] == "second 2"
+    assert len(newer) == 5
+
+
+def test_search_ranks_matches_and_pages_around_them(tmp_path):
+    async def scenario():
+        history = MessageStore(str(tmp_path / "history.db"))
+        start = time.time()
+        for i, body in enumerate(["lunch at noon?", "see you tomorrow", "lunch again", "the launch is today"]):
+            history.add('alice@localhost', ChatMessage('bob@localhost', body, start + i, 'in'))
+        history.add('alice@localhost', ChatMessage('carol@localhost', "lunch with carol", start + 10, 'out'))
+
+        results = await history.search('alice@localhost', "lun")
+        with_bob = await history.search('alice@localhost', "lunch", peer='bob@localhost')
+        nothing = await history.search('alice@localhost', " ,;")
+        around = await history.load_page('alice@localhost', 'bob@localhost', before=with_bob[0].message, limit=1)
+        history.close()
+        return results, with_bob, nothing, around, history.full_text
+
+    results, with_bob, nothing, around, full_text = asyncio.run(scenario())
+    assert sorted(result.message.body for result in results) == ["lunch again", "lunch at noon?", "lunch with carol"]
+    assert {result.message.peer for result in with_bob} == {'bob@localhost'}
+    assert nothing == []
+    assert len(around) == 1 and around[0].timestamp < with_bob[0].message.timestamp
+    if full_text:
+        # The matched words are marked in the snippets of the full-text index
+        assert all('[' in result.snippet for result in results)